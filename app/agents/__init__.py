@@ -3,11 +3,14 @@ from app.agents.agent_factory import (
     AgentFactory,
     SYSTEM_PROMPT,
 )
+from app.agents.agent_cache import AgentCache, config_fingerprint
 from app.agents.error_classifier import AgentErrorClassifier, AgentErrorType
 
 __all__ = [
     "AgentFactory",
     "SYSTEM_PROMPT",
+    "AgentCache",
+    "config_fingerprint",
     "AgentErrorClassifier",
     "AgentErrorType",
 ]
@@ -0,0 +1,122 @@
+"""Agent 图缓存 - 按配置指纹缓存已编译的 Agent，LRU 淘汰"""
+
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+def config_fingerprint(label: str, **dimensions: Any) -> str:
+    """生成配置指纹
+
+    label 为可读前缀（便于监控中识别），其余维度（模型名、工具集等）
+    序列化后取哈希，任一维度变化都会得到新的缓存键。
+    """
+    payload = json.dumps(dimensions, sort_keys=True, default=str, ensure_ascii=False)
+    digest = hashlib.sha256(payload.encode()).hexdigest()[:12]
+    return f"{label}@{digest}"
+
+
+class AgentCache:
+    """有界 LRU 缓存，支持并发下的单次构建（single-flight）
+
+    - 命中时移到队尾，超过 max_size 时淘汰最久未使用的条目
+    - 同一键的并发构建只执行一次，其余调用方等待并复用结果
+    - 构建失败不缓存，下一次调用会重新构建
+
+    create_agent 为同步调用，预热时会在线程池中执行，因此使用线程锁。
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._build_errors = 0
+
+    def get(self, key: str) -> Any:
+        """获取缓存条目，不存在返回 None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+        return None
+
+    def get_or_create(self, key: str, builder: Callable[[], Any]) -> Any:
+        """获取缓存条目，不存在时调用 builder 构建并缓存"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._entries:
+                    # 等待期间已由其他调用方构建完成
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return self._entries[key]
+                self._misses += 1
+
+            try:
+                value = builder()
+            except Exception:
+                with self._lock:
+                    self._build_errors += 1
+                    self._building.pop(key, None)
+                raise
+
+            with self._lock:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                self._building.pop(key, None)
+                while len(self._entries) > self.max_size:
+                    evicted_key, _ = self._entries.popitem(last=False)
+                    self._evictions += 1
+                    logger.info(f"[AGENT] Evicted cached agent: {evicted_key}")
+            return value
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._build_errors = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "cached_agents": list(self._entries.keys()),
+                "total": len(self._entries),
+                "max": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "build_errors": self._build_errors,
+                "hit_rate": round(self._hits / total * 100, 2) if total > 0 else 0,
+            }
@@ -1,10 +1,13 @@
 """Agent工厂 - 使用LangChain Deep Agent"""
 
+import time
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Union, Dict, Any
+from typing import Optional, Sequence, Union, Dict, Any
 
 from langchain.agents import create_agent
 from langchain.agents.middleware import (
@@ -19,8 +22,10 @@ from langchain.agents.middleware import (
 )
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 
-from deepagents.middleware.skills import SkillsMiddleware
 from deepagents.middleware.patch_tool_calls import PatchToolCallsMiddleware
 from deepagents.middleware.filesystem import FilesystemMiddleware
 from deepagents.backends.filesystem import FilesystemBackend
@@ -30,6 +35,18 @@ from langgraph.store.memory import InMemoryStore, BaseStore
 
 from app.config import settings
 from app.llm.model_factory import ModelFactory
+from app.llm.telemetry import telemetry_callback
+from app.agents.stream_events import ToolStreamEventsMiddleware
+from app.agents.upstream_limit import (
+    UpstreamBusyToolMiddleware,
+    UpstreamLimitMiddleware,
+    retry_unless_busy,
+)
+from app.agents.agent_cache import AgentCache, config_fingerprint
+from app.agents.memory_store import RunCachedStore
+from app.agents.checkpoint_serde import DedupPostgresSaver
+from app.agents.context_policy import build_context_editing_middleware
+from app.agents.skills_index import IndexedSkillsMiddleware, SkillsIndex
 
 logger = logging.getLogger(__name__)
 
@@ -50,9 +67,10 @@ SYSTEM_PROMPT = """你是一个强大的AI助手，能够帮助用户处理各
 - 根据用户需求选择最合适的工具，避免不必要的工具调用
 
 **技能使用规则（非常重要）**：
-- 当用户请求匹配某个技能的描述时，你必须先调用 read_file 读取该技能的完整SKILL文件
-- 禁止在没有读取技能文件的情况下直接回答相关任务
-- 读取技能文件后，必须严格按照技能中的流程和模板执行任务
+- 当用户请求匹配某个技能的描述时，你必须先获取该技能的完整SKILL文件
+- 如果系统提示中已提供该技能的完整内容（"已加载技能"），直接使用，不要再调用 read_file
+- 否则调用 read_file 读取该技能的SKILL文件，禁止在没有技能内容的情况下直接回答相关任务
+- 获取技能内容后，必须严格按照技能中的流程和模板执行任务
 
 ## 记忆系统
 
@@ -76,10 +94,13 @@ class AgentFactory:
     """Agent工厂类 - 使用LangChain 1.0+推荐的create_agent"""
 
     _checkpointer: Optional[Union[AsyncPostgresSaver, InMemorySaver]] = None
-    _context_manager: Optional[object] = None
+    _context_manager: Optional[AsyncConnectionPool] = None
     _initialized: bool = False
-    _agent_cache: Dict[str, Any] = {}
+    _agent_cache: AgentCache = AgentCache(settings.agent_cache_max_size)
     _skills_backend: Optional[FilesystemBackend] = None
+    _skills_index: Optional[SkillsIndex] = None
+    # 技能后端与索引的单次初始化（预热线程池与请求可能并发调用）；索引创建时会获取后端，故用可重入锁
+    _skills_lock: threading.RLock = threading.RLock()
     _store: Optional[BaseStore] = None
     _store_context: Optional[object] = None
 
@@ -87,22 +108,52 @@ class AgentFactory:
     async def init_checkpointer(cls) -> bool:
         """初始化 checkpointer (异步版本)
 
-        在应用启动时调用，创建数据库连接并初始化表结构。
+        在应用启动时调用，创建连接池并初始化表结构。
+        
+        基于 psycopg_pool.AsyncConnectionPool，DedupPostgresSaver 在连接池模式下
+        每个操作各取一个连接、不经过 saver 级的锁，并发运行的 checkpoint 读写
+        不再串行；取出连接时做健康检查，失效连接自动重建。
 
         Returns:
             bool: 是否成功使用 PostgreSQL
         """
         try:
             if settings.database_url:
-                cls._context_manager = AsyncPostgresSaver.from_conn_string(settings.database_url)
-                cls._checkpointer = await cls._context_manager.__aenter__()
+                # 连接池会在超时前持续重试，先单独连接一次以便数据库不可用时快速失败
+                probe = await AsyncConnection.connect(
+                    settings.database_url, connect_timeout=int(settings.checkpointer_pool_timeout)
+                )
+                await probe.close()
+                pool = AsyncConnectionPool(
+                    conninfo=settings.database_url,
+                    min_size=settings.checkpointer_pool_min_size,
+                    max_size=settings.checkpointer_pool_max_size,
+                    timeout=settings.checkpointer_pool_timeout,
+                    max_idle=settings.checkpointer_pool_max_idle,
+                    check=AsyncConnectionPool.check_connection,
+                    kwargs={
+                        "autocommit": True,
+                        "prepare_threshold": settings.checkpointer_prepare_threshold,
+                        "row_factory": dict_row,
+                    },
+                    name="checkpointer",
+                    open=False,
+                )
+                cls._context_manager = pool
+                await pool.open(wait=True, timeout=settings.checkpointer_pool_timeout)
+                cls._checkpointer = DedupPostgresSaver(pool)
                 if not cls._initialized:
                     await cls._checkpointer.setup()
                     cls._initialized = True
-                logger.info("[AGENT] AsyncPostgresSaver initialized")
+                logger.info(
+                    f"[AGENT] AsyncPostgresSaver initialized, pool size "
+                    f"{settings.checkpointer_pool_min_size}-{settings.checkpointer_pool_max_size}"
+                )
                 return True
         except Exception as e:
             logger.warning(f"[AGENT] AsyncPostgresSaver init failed, fallback to InMemorySaver: {e}")
+            if cls._context_manager is not None:
+                await cls._context_manager.close()
 
         cls._checkpointer = InMemorySaver()
         cls._context_manager = None
@@ -110,22 +161,41 @@ class AgentFactory:
 
     @classmethod
     async def close_checkpointer(cls) -> None:
-        """关闭 checkpointer 连接 (异步版本)
+        """关闭 checkpointer 连接池 (异步版本)
 
         在应用关闭时调用，清理数据库连接和缓存。
         """
         if cls._context_manager and hasattr(cls._context_manager, '__aexit__'):
             try:
                 await cls._context_manager.__aexit__(None, None, None)
-                logger.info("[AGENT] AsyncPostgresSaver connection closed")
+                logger.info("[AGENT] AsyncPostgresSaver connection pool closed")
             except Exception as e:
-                logger.error(f"[AGENT] Failed to close AsyncPostgresSaver connection: {e}")
+                logger.error(f"[AGENT] Failed to close AsyncPostgresSaver connection pool: {e}")
         cls._checkpointer = None
         cls._context_manager = None
         cls._agent_cache.clear()
         cls._skills_backend = None
         logger.info("[AGENT] Cache cleared")
 
+    @classmethod
+    def get_pool_stats(cls) -> Dict[str, Any]:
+        """获取 checkpointer 与长期记忆存储的连接池指标
+        
+        Returns:
+            {"checkpointer": {...}, "store": {...}}，未使用连接池时为 None
+        """
+        def pool_stats(pool) -> Optional[Dict[str, Any]]:
+            if not isinstance(pool, AsyncConnectionPool):
+                return None
+            stats = pool.get_stats()
+            stats["closed"] = pool.closed
+            return stats
+
+        store = cls._store.store if isinstance(cls._store, RunCachedStore) else cls._store
+        return {
+            "checkpointer": pool_stats(cls._context_manager),
+            "store": pool_stats(getattr(store, "conn", None)),
+        }
 
     @classmethod
     def get_checkpointer(cls) -> Union[AsyncPostgresSaver, InMemorySaver]:
@@ -144,38 +214,53 @@ class AgentFactory:
     async def init_store(cls) -> bool:
         """初始化长期记忆存储 (BaseStore)
         
-        用于 StoreBackend 持久化跨线程记忆。
+        用于 StoreBackend 持久化跨线程记忆。使用基于连接池的 AsyncPostgresStore，
+        记忆读写不再在事件循环中执行阻塞的 psycopg 调用；同一时刻的并发操作
+        由 AsyncPostgresStore 合并为一次批量查询。外层包装 RunCachedStore，
+        单次运行内对热点记忆文件做读穿缓存。
         
         Returns:
             bool: 是否成功使用 PostgreSQL
         """
         try:
             if settings.database_url:
-                from langgraph.store.postgres import PostgresStore
-                cls._store_context = PostgresStore.from_conn_string(settings.database_url)
-                cls._store = cls._store_context.__enter__()
-                cls._store.setup()
-                logger.info("[AGENT] PostgresStore initialized for long-term memory")
+                from langgraph.store.postgres.aio import AsyncPostgresStore
+                cls._store_context = AsyncPostgresStore.from_conn_string(
+                    settings.database_url,
+                    pool_config={
+                        "min_size": settings.store_pool_min_size,
+                        "max_size": settings.store_pool_max_size,
+                    },
+                )
+                store = await cls._store_context.__aenter__()
+                await store.setup()
+                cls._store = RunCachedStore(store)
+                logger.info("[AGENT] AsyncPostgresStore initialized for long-term memory")
                 return True
         except Exception as e:
-            logger.warning(f"[AGENT] PostgresStore init failed, fallback to InMemoryStore: {e}")
+            logger.warning(f"[AGENT] AsyncPostgresStore init failed, fallback to InMemoryStore: {e}")
+            await cls._exit_store_context()
         
-        cls._store = InMemoryStore()
+        cls._store = RunCachedStore(InMemoryStore())
         cls._store_context = None
         return False
 
     @classmethod
-    async def close_store(cls) -> None:
-        """关闭长期记忆存储"""
-        if cls._store_context and hasattr(cls._store_context, '__exit__'):
+    async def _exit_store_context(cls) -> None:
+        if cls._store_context and hasattr(cls._store_context, '__aexit__'):
             try:
-                cls._store_context.__exit__(None, None, None)
-                logger.info("[AGENT] PostgresStore connection closed")
+                await cls._store_context.__aexit__(None, None, None)
+                logger.info("[AGENT] AsyncPostgresStore connection pool closed")
             except Exception as e:
-                logger.error(f"[AGENT] Failed to close PostgresStore: {e}")
-        cls._store = None
+                logger.error(f"[AGENT] Failed to close AsyncPostgresStore: {e}")
         cls._store_context = None
 
+    @classmethod
+    async def close_store(cls) -> None:
+        """关闭长期记忆存储"""
+        await cls._exit_store_context()
+        cls._store = None
+
     @classmethod
     def get_store(cls) -> BaseStore:
         """获取长期记忆存储实例
@@ -227,7 +312,11 @@ class AgentFactory:
         Returns:
             FilesystemBackend 实例
         """
-        if cls._skills_backend is None:
+        if cls._skills_backend is not None:
+            return cls._skills_backend
+        with cls._skills_lock:
+            if cls._skills_backend is not None:
+                return cls._skills_backend
             storage_dir = Path(settings.storage_dir).resolve()
             if not storage_dir.exists():
                 storage_dir.mkdir(parents=True, exist_ok=True)
@@ -249,14 +338,16 @@ class AgentFactory:
     def create_chat_agent(
         cls,
         is_expert: bool = False,
-        enable_thinking: bool = False
+        enable_thinking: bool = False,
+        tools: Optional[Sequence] = None,
     ):
         """创建聊天Agent (LangChain 1.0+ 推荐方式)
 
         使用create_agent创建ReAct模式的Agent，无需AgentExecutor。
         内部基于LangGraph构建，支持持久化、流式输出等特性。
         
-        使用缓存机制，相同配置的agent只创建一次，通过thread_id区分不同对话。
+        使用有界 LRU 缓存，相同配置指纹的agent只创建一次（并发请求共享同一次构建），
+        通过thread_id区分不同对话。
         
         集成中间件: SkillsMiddleware, PatchToolCallsMiddleware, 
         LLMToolSelectorMiddleware, ContextEditingMiddleware, 
@@ -266,44 +357,55 @@ class AgentFactory:
         Args:
             is_expert: 是否使用专家模型
             enable_thinking: 是否启用深度思考
+            tools: 本轮绑定的业务工具子集（见 ToolSelector），None 表示全部工具
 
         Returns:
             Agent实例，可直接调用invoke或stream
         """
-        cache_key = f"expert_{is_expert}_thinking_{enable_thinking}"
-        
-        if cache_key in cls._agent_cache:
-            logger.debug(f"[AGENT] Using cached agent: {cache_key}")
-            return cls._agent_cache[cache_key]
-        
-        main_model = ModelFactory.get_general_model(
-            is_expert=is_expert,
-            enable_thinking=enable_thinking
-        )
-        
-        middleware = cls._build_middleware()
-        
-        # 获取 store，如果 BackendManager 未初始化则使用 None
-        checkpointer = cls.get_checkpointer()
-        store = cls.get_store()
-
         # 延迟导入避免循环导入
         from app.tools import ALL_TOOLS
 
-        agent = create_agent(
-            model=main_model,
-            tools=ALL_TOOLS,
-            system_prompt=SYSTEM_PROMPT,
-            checkpointer=checkpointer,
-            store=store,
-            middleware=middleware,
-            context_schema=AgentContext,
-        )
+        tools = ALL_TOOLS if tools is None else list(tools)
+        cache_key = cls._cache_key(is_expert, enable_thinking, tools)
         
-        cls._agent_cache[cache_key] = agent
-        logger.debug(f"[AGENT] Created and cached agent: {cache_key}")
-
-        return agent
+        def build():
+            main_model = ModelFactory.get_general_model(
+                is_expert=is_expert,
+                enable_thinking=enable_thinking
+            )
+            middleware = cls._build_middleware()
+            
+            agent = create_agent(
+                model=main_model,
+                tools=tools,
+                system_prompt=SYSTEM_PROMPT,
+                checkpointer=cls.get_checkpointer(),
+                store=cls.get_store(),
+                middleware=middleware,
+                context_schema=AgentContext,
+            )
+            logger.debug(f"[AGENT] Created and cached agent: {cache_key}")
+            return agent
+        
+        return cls._agent_cache.get_or_create(cache_key, build)
+    
+    @classmethod
+    def _cache_key(cls, is_expert: bool, enable_thinking: bool, tools: list) -> str:
+        """Agent 配置指纹：模型、工具集及影响图结构的配置任一变化都会生成新键"""
+        return config_fingerprint(
+            f"expert_{is_expert}_thinking_{enable_thinking}",
+            model=settings.model_general_expert if is_expert else settings.model_general_fast,
+            fallback_model=settings.model_general_fast,
+            hedge=settings.model_hedge_enabled,
+            tools=sorted(getattr(t, "name", str(t)) for t in tools),
+            tool_call_limit=settings.agent_tool_call_limit,
+            context_policy=(
+                settings.context_edit_keep_turns,
+                settings.context_edit_default_budget,
+                settings.context_edit_tool_budgets,
+                settings.context_edit_exclude_tools,
+            ),
+        )
     
     @classmethod
     def _build_middleware(cls) -> list:
@@ -311,61 +413,148 @@ class AgentFactory:
         fallback_model = ModelFactory.get_general_model(is_expert=False, enable_thinking=False)
         summary_model = ModelFactory.get_general_model(is_expert=False, enable_thinking=False, streaming=False)
 
-        return [
+        summarization = SummarizationMiddleware(model=summary_model, max_tokens_before_summary=8000, messages_to_keep=6)
+        middleware = [
+            ToolStreamEventsMiddleware(),
             PatchToolCallsMiddleware(),
-            ToolRetryMiddleware(max_retries=1, backoff_factor=2.0),
+            UpstreamBusyToolMiddleware(),
+            ToolRetryMiddleware(max_retries=1, backoff_factor=2.0, retry_on=retry_unless_busy),
             ModelFallbackMiddleware(fallback_model),
+            UpstreamLimitMiddleware(),
             FilesystemMiddleware(backend=cls._make_backend),
-            SkillsMiddleware(backend=cls._get_skills_backend(), sources=["/skills/"]),
-            SummarizationMiddleware(model=summary_model, max_tokens_before_summary=8000, messages_to_keep=6),
+            IndexedSkillsMiddleware(
+                index=cls.get_skills_index(), backend=cls._get_skills_backend(), sources=["/skills/"]
+            ),
+            summarization,
             ToolCallLimitMiddleware(run_limit=settings.agent_tool_call_limit, exit_behavior="end"),
             ModelCallLimitMiddleware(run_limit=50, exit_behavior="end"),
         ]
+        # 过期工具输出只在发给模型的请求中清理/截断，放在摘要之后，摘要仍基于完整历史
+        context_editing = build_context_editing_middleware()
+        if context_editing is not None:
+            middleware.insert(middleware.index(summarization) + 1, context_editing)
+        return middleware
 
     @classmethod
-    async def warmup(cls):
-        """启动预热：并发创建全部 4 种配置
+    async def warmup(cls) -> Dict[str, float]:
+        """启动预热：并发执行各预热步骤
+        
+        在应用启动时调用，避免首次请求延迟：
+        - agents: 在线程池中构建 4 种模型配置 × 全部工具/无业务工具（闲聊）的图
+          （create_agent 为同步调用，直接在事件循环中执行会串行阻塞）
+        - connections: 预建立到 DashScope 的 HTTP/TLS 连接
+        - skills: 解析技能目录，建立内存技能索引
+        - checkpointer: 预热 checkpointer 连接
         
-        在应用启动时调用，避免首次请求延迟。
-        使用 asyncio.gather 并发创建，减少启动时间。
+        单个步骤失败只记录日志，不影响其他步骤。
+        
+        Returns:
+            各步骤耗时（毫秒），包含 total
         """
         configs = [
-            (False, False),
-            (True, False),
-            (False, True),
-            (True, True),
+            (is_expert, thinking, tools)
+            for is_expert, thinking in [(False, False), (True, False), (False, True), (True, True)]
+            for tools in (None, [])
         ]
+        timings: Dict[str, float] = {}
 
         logger.info("[AGENT] Starting concurrent warmup...")
+        started = time.perf_counter()
         
-        async def create_agent_safe(is_expert: bool, thinking: bool) -> Optional[str]:
+        async def timed(step: str, coro) -> None:
+            step_started = time.perf_counter()
+            try:
+                result = await coro
+                logger.debug(f"[AGENT] Warmup step {step} done: {result}")
+            except Exception as e:
+                logger.warning(f"[AGENT] Warmup step {step} failed: {e}")
+            finally:
+                timings[step] = round((time.perf_counter() - step_started) * 1000, 1)
+        
+        def create_agent_safe(is_expert: bool, thinking: bool, tools: Optional[list]) -> Optional[str]:
             """安全创建 Agent，返回缓存键或 None"""
             try:
-                cls.create_chat_agent(is_expert, thinking)
+                cls.create_chat_agent(is_expert, thinking, tools)
                 return f"expert_{is_expert}_thinking_{thinking}"
             except Exception as e:
                 logger.warning(f"[AGENT] Warmup failed for expert={is_expert}, thinking={thinking}: {e}")
                 return None
         
-        results = await asyncio.gather(
-            *[create_agent_safe(is_expert, thinking) for is_expert, thinking in configs]
+        async def build_agents() -> str:
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=len(configs), thread_name_prefix="agent-warmup") as executor:
+                results = await asyncio.gather(*[
+                    loop.run_in_executor(executor, create_agent_safe, is_expert, thinking, tools)
+                    for is_expert, thinking, tools in configs
+                ])
+            successful = [r for r in results if r is not None]
+            return f"cached {len(successful)}/{len(configs)}"
+        
+        await asyncio.gather(
+            timed("agents", build_agents()),
+            timed("connections", ModelFactory.warmup_connections()),
+            timed("skills", asyncio.to_thread(cls._load_skills_index)),
+            timed("checkpointer", cls._prime_checkpointer()),
         )
         
-        successful = [r for r in results if r is not None]
-        logger.info(f"[AGENT] Warmup completed, cached: {len(successful)}/{len(configs)}")
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            f"[AGENT] Warmup completed, cached: {len(cls._agent_cache)}/{len(configs)}, timings(ms): {timings}"
+        )
+        return timings
+
+    @classmethod
+    def get_skills_index(cls) -> SkillsIndex:
+        """获取技能索引（首次调用时创建，由预热步骤加载）"""
+        if cls._skills_index is not None:
+            return cls._skills_index
+        with cls._skills_lock:
+            if cls._skills_index is None:
+                cls._skills_index = SkillsIndex(
+                    Path(cls._get_skills_backend().cwd),
+                    min_score=settings.skills_match_min_score,
+                )
+        return cls._skills_index
+
+    @classmethod
+    def _load_skills_index(cls) -> int:
+        """解析技能目录下的 SKILL.md 并建立索引，返回技能数量"""
+        return cls.get_skills_index().load()
+
+    @classmethod
+    def start_skills_watcher(cls) -> None:
+        """启动技能目录热更新监听"""
+        if settings.skills_hot_reload:
+            cls.get_skills_index().start_watching()
+
+    @classmethod
+    async def stop_skills_watcher(cls) -> None:
+        if cls._skills_index is not None:
+            await cls._skills_index.stop_watching()
+
+    @classmethod
+    async def _prime_checkpointer(cls) -> int:
+        """预热 checkpointer 连接池
+        
+        按连接池最小连接数并发执行空查询，使每个常驻连接都完成
+        checkpoint 查询语句的预编译。返回执行的查询数。
+        """
+        checkpointer = cls.get_checkpointer()
+        concurrency = settings.checkpointer_pool_min_size if cls._context_manager is not None else 1
+        await asyncio.gather(*[
+            checkpointer.aget_tuple({"configurable": {"thread_id": "__warmup__"}})
+            for _ in range(max(1, concurrency))
+        ])
+        return max(1, concurrency)
 
     @classmethod
     def get_cache_stats(cls) -> dict:
         """获取缓存状态
         
         Returns:
-            包含缓存信息的字典
+            包含缓存条目、容量及命中/未命中/淘汰计数的字典
         """
-        return {
-            "cached_agents": list(cls._agent_cache.keys()),
-            "total": len(cls._agent_cache),
-            "max": 4,
-        }
+        return cls._agent_cache.get_stats()
 
     @classmethod
     def get_agent_config(cls, conversation_id: str, user_id: int | None = None) -> tuple[dict, "AgentContext | None"]:
@@ -381,7 +570,9 @@ class AgentFactory:
         config = {
             "configurable": {
                 "thread_id": f"conversation_{conversation_id}"
-            }
+            },
+            # 工具调用遥测（模型调用的回调由 ModelFactory 挂载，同一实例不会重复记录）
+            "callbacks": [telemetry_callback],
         }
 
         context = None
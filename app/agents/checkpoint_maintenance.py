@@ -0,0 +1,377 @@
+"""Checkpoint 维护 - 按线程保留最近 N 个 checkpoint，清理已删除对话的线程"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from langgraph.checkpoint.postgres import _ainternal
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg import AsyncCursor
+from psycopg.rows import DictRow, dict_row
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+THREAD_PREFIX = "conversation_"
+
+# 会话级 advisory lock 的键，多个 worker 进程中同一时间只有一个执行压缩
+COMPACTION_LOCK_KEY = 0x636B7074  # "ckpt"
+
+TRY_LOCK_SQL = "SELECT pg_try_advisory_lock(%s) AS locked"
+
+UNLOCK_SQL = "SELECT pg_advisory_unlock(%s)"
+
+# 超过保留数量的线程（每个 checkpoint_ns 单独计数）
+OVERSIZED_THREADS_SQL = """
+SELECT thread_id FROM checkpoints
+GROUP BY thread_id, checkpoint_ns
+HAVING count(*) > %s
+LIMIT %s
+"""
+
+# 删除每个 checkpoint_ns 下除最新 N 个之外的 checkpoint（checkpoint_id 为时间有序的 uuid6）
+DELETE_OLD_CHECKPOINTS_SQL = """
+WITH ranked AS (
+    SELECT checkpoint_ns, checkpoint_id,
+           row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+    FROM checkpoints
+    WHERE thread_id = %s
+)
+DELETE FROM checkpoints c
+USING ranked r
+WHERE c.thread_id = %s
+  AND c.checkpoint_ns = r.checkpoint_ns
+  AND c.checkpoint_id = r.checkpoint_id
+  AND r.rn > %s
+RETURNING c.checkpoint_ns, c.checkpoint_id, c.checkpoint -> 'channel_versions' AS versions,
+          pg_column_size(c.*) AS size
+"""
+
+CLEAR_DANGLING_PARENTS_SQL = """
+UPDATE checkpoints SET parent_checkpoint_id = NULL
+WHERE thread_id = %s AND checkpoint_ns = %s AND parent_checkpoint_id = ANY(%s)
+"""
+
+# 从 CompressedSerializer 写入的引用头（2 字节数量 + 32 字节 sha256）中取出正文哈希，
+# 需在提供 type、blob 列的 FROM 项上做 LATERAL 连接
+CONTENT_REFS_SQL = """
+SELECT encode(substring(blob FROM 3 + 32 * i FOR 32), 'hex') AS hash
+FROM generate_series(
+    0,
+    CASE WHEN type LIKE '%%+cas%%' THEN get_byte(blob, 0) * 256 + get_byte(blob, 1) - 1 ELSE -1 END
+) AS i
+"""
+
+DELETE_WRITES_SQL = f"""
+WITH deleted AS (
+    DELETE FROM checkpoint_writes w
+    WHERE thread_id = %s AND checkpoint_ns = %s AND checkpoint_id = ANY(%s)
+    RETURNING pg_column_size(w.*) AS size, w.type, w.blob
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0)::bigint AS bytes,
+       ARRAY(SELECT DISTINCT r.hash FROM deleted CROSS JOIN LATERAL ({CONTENT_REFS_SQL}) r) AS refs
+FROM deleted
+"""
+
+REFERENCED_BLOBS_SQL = """
+SELECT DISTINCT v.key AS channel, v.value AS version
+FROM checkpoints c
+CROSS JOIN LATERAL jsonb_each_text(c.checkpoint -> 'channel_versions') AS v
+WHERE c.thread_id = %s AND c.checkpoint_ns = %s
+"""
+
+DELETE_BLOBS_SQL = f"""
+WITH deleted AS (
+    DELETE FROM checkpoint_blobs b
+    WHERE thread_id = %s AND checkpoint_ns = %s AND channel = %s AND version = ANY(%s)
+    RETURNING pg_column_size(b.*) AS size, b.type, b.blob
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0)::bigint AS bytes,
+       ARRAY(SELECT DISTINCT r.hash FROM deleted CROSS JOIN LATERAL ({CONTENT_REFS_SQL}) r) AS refs
+FROM deleted
+"""
+
+# 线程内仍被保留的 channel blob 或 pending writes 引用的正文
+REFERENCED_CONTENT_SQL = f"""
+SELECT DISTINCT r.hash
+FROM (
+    SELECT type, blob FROM checkpoint_blobs WHERE thread_id = %s AND type LIKE '%%+cas%%'
+    UNION ALL
+    SELECT type, blob FROM checkpoint_writes WHERE thread_id = %s AND type LIKE '%%+cas%%'
+) b
+CROSS JOIN LATERAL ({CONTENT_REFS_SQL}) r
+"""
+
+DELETE_CONTENT_BLOBS_SQL = """
+WITH deleted AS (
+    DELETE FROM checkpoint_content_blobs c
+    WHERE thread_id = %s AND hash = ANY(%s)
+    RETURNING pg_column_size(c.*) AS size
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0)::bigint AS bytes FROM deleted
+"""
+
+CONVERSATION_THREADS_SQL = """
+SELECT DISTINCT thread_id FROM checkpoints WHERE thread_id LIKE %s
+"""
+
+DELETE_THREADS_SQL = tuple(
+    f"""
+WITH deleted AS (
+    DELETE FROM {table} t WHERE thread_id = ANY(%s)
+    RETURNING pg_column_size(t.*) AS size
+)
+SELECT count(*) AS rows, coalesce(sum(size), 0)::bigint AS bytes FROM deleted
+"""
+    for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes", "checkpoint_content_blobs")
+)
+
+
+def thread_id_for(conversation_id: int) -> str:
+    return f"{THREAD_PREFIX}{conversation_id}"
+
+
+@asynccontextmanager
+async def _cursor(saver: AsyncPostgresSaver) -> AsyncIterator[AsyncCursor[DictRow]]:
+    """直接从连接池取连接执行维护语句
+
+    AsyncPostgresSaver._cursor() 持有 saver.lock，在其中执行整个删除/GC 事务
+    会阻塞本 worker 所有正在进行的 checkpoint 读写。
+    """
+    async with _ainternal.get_connection(saver.conn) as conn:
+        async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+            yield cur
+
+
+def _new_report() -> Dict[str, Any]:
+    return {
+        "threads_compacted": 0,
+        "threads_deleted": 0,
+        "checkpoints_deleted": 0,
+        "writes_deleted": 0,
+        "blobs_deleted": 0,
+        "reclaimed_bytes": 0,
+    }
+
+
+class CheckpointCompactor:
+    """Checkpoint 压缩与保留策略
+
+    - compact_thread: 每个 checkpoint_ns 只保留最新 N 个 checkpoint，
+      同时删除其 pending writes、不再被引用的 channel blob 和消息正文
+    - delete_threads: 删除整个线程（对话被删除时调用）
+    - run_once: 压缩超过保留数量的线程，并清理已不存在对话的线程；
+      每个 worker 进程都有自己的后台任务，通过 advisory lock 保证同一时间只有一个执行
+
+    reclaimed_bytes 为被删除行的 pg_column_size 之和；表文件本身的空间
+    由 autovacuum 回收后复用。仅 AsyncPostgresSaver 支持压缩，
+    其他 checkpointer 只支持删除线程。
+    """
+
+    def __init__(self, keep_latest: Optional[int] = None):
+        self.keep_latest = max(1, keep_latest or settings.checkpoint_retention_keep)
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _get_checkpointer():
+        from app.agents.agent_factory import AgentFactory
+        return AgentFactory.get_checkpointer()
+
+    async def compact_thread(self, saver: AsyncPostgresSaver, thread_id: str) -> Dict[str, Any]:
+        """压缩单个线程，返回删除统计"""
+        report = _new_report()
+        async with _cursor(saver) as cur, cur.connection.transaction():
+            await cur.execute(DELETE_OLD_CHECKPOINTS_SQL, (thread_id, thread_id, self.keep_latest), prepare=False)
+            deleted_rows = await cur.fetchall()
+            if not deleted_rows:
+                return report
+
+            by_ns: Dict[str, Tuple[List[str], Set[Tuple[str, str]]]] = {}
+            for row in deleted_rows:
+                ids, freed = by_ns.setdefault(row["checkpoint_ns"], ([], set()))
+                ids.append(row["checkpoint_id"])
+                freed.update((channel, str(version)) for channel, version in (row["versions"] or {}).items())
+                report["reclaimed_bytes"] += row["size"] or 0
+            report["checkpoints_deleted"] = len(deleted_rows)
+            freed_content: Set[str] = set()
+
+            for ns, (ids, freed) in by_ns.items():
+                await cur.execute(CLEAR_DANGLING_PARENTS_SQL, (thread_id, ns, ids), prepare=False)
+
+                await cur.execute(DELETE_WRITES_SQL, (thread_id, ns, ids), prepare=False)
+                writes = await cur.fetchone()
+                report["writes_deleted"] += writes["rows"]
+                report["reclaimed_bytes"] += writes["bytes"]
+                freed_content.update(writes["refs"] or ())
+
+                # 只删除被删 checkpoint 引用、且不再被保留 checkpoint 引用的 blob，
+                # 避免误删并发运行刚写入、对应 checkpoint 尚未提交的 blob
+                await cur.execute(REFERENCED_BLOBS_SQL, (thread_id, ns), prepare=False)
+                referenced = {(r["channel"], r["version"]) for r in await cur.fetchall()}
+                garbage: Dict[str, List[str]] = {}
+                for channel, version in freed - referenced:
+                    garbage.setdefault(channel, []).append(version)
+                for channel, versions in garbage.items():
+                    await cur.execute(DELETE_BLOBS_SQL, (thread_id, ns, channel, versions), prepare=False)
+                    blobs = await cur.fetchone()
+                    report["blobs_deleted"] += blobs["rows"]
+                    report["reclaimed_bytes"] += blobs["bytes"]
+                    freed_content.update(blobs["refs"] or ())
+
+            # 正文按线程存储：同样只删除被删数据引用过、且不再被线程内任何保留数据引用的正文
+            if freed_content:
+                await cur.execute(REFERENCED_CONTENT_SQL, (thread_id, thread_id), prepare=False)
+                referenced_content = {r["hash"] for r in await cur.fetchall()}
+                garbage_content = sorted(freed_content - referenced_content)
+                if garbage_content:
+                    await cur.execute(DELETE_CONTENT_BLOBS_SQL, (thread_id, garbage_content), prepare=False)
+                    content = await cur.fetchone()
+                    report["blobs_deleted"] += content["rows"]
+                    report["reclaimed_bytes"] += content["bytes"]
+
+        report["threads_compacted"] = 1
+        return report
+
+    async def delete_threads(self, thread_ids: Iterable[str]) -> Dict[str, Any]:
+        """删除线程的全部 checkpoint、blob 与 writes"""
+        thread_ids = [str(t) for t in thread_ids]
+        report = _new_report()
+        if not thread_ids:
+            return report
+
+        checkpointer = self._get_checkpointer()
+        if not isinstance(checkpointer, AsyncPostgresSaver):
+            for thread_id in thread_ids:
+                await checkpointer.adelete_thread(thread_id)
+            report["threads_deleted"] = len(thread_ids)
+            return report
+
+        counters = ("checkpoints_deleted", "blobs_deleted", "writes_deleted", "blobs_deleted")
+        async with _cursor(checkpointer) as cur, cur.connection.transaction():
+            for sql, counter in zip(DELETE_THREADS_SQL, counters):
+                await cur.execute(sql, (thread_ids,), prepare=False)
+                row = await cur.fetchone()
+                report[counter] += row["rows"]
+                report["reclaimed_bytes"] += row["bytes"]
+        report["threads_deleted"] = len(thread_ids)
+        return report
+
+    async def delete_conversation_threads(self, conversation_ids: Iterable[int]) -> Dict[str, Any]:
+        """删除对话对应的线程"""
+        return await self.delete_threads(thread_id_for(cid) for cid in conversation_ids)
+
+    async def _find_orphan_threads(self, saver: AsyncPostgresSaver) -> List[str]:
+        """查找对话已被删除的线程"""
+        from sqlalchemy import select
+        from app.core.database import get_db_session
+        from app.models.conversation import Conversation
+
+        async with _cursor(saver) as cur:
+            await cur.execute(CONVERSATION_THREADS_SQL, (f"{THREAD_PREFIX}%",))
+            thread_ids = [row["thread_id"] for row in await cur.fetchall()]
+        if not thread_ids:
+            return []
+
+        async with get_db_session() as db:
+            result = await db.execute(select(Conversation.id))
+            live = {thread_id_for(cid) for cid in result.scalars().all()}
+        return [t for t in thread_ids if t not in live and t[len(THREAD_PREFIX):].isdigit()]
+
+    async def run_once(self) -> Dict[str, Any]:
+        """执行一次压缩与清理，返回报告（同时保存为 last_report）"""
+        async with self._lock:
+            started = time.perf_counter()
+            report = _new_report()
+            report["keep_latest"] = self.keep_latest
+
+            checkpointer = self._get_checkpointer()
+            if isinstance(checkpointer, AsyncPostgresSaver):
+                async with self._advisory_lock(checkpointer) as locked:
+                    if locked:
+                        await self._compact_all(checkpointer, report)
+                    else:
+                        report["skipped"] = "compaction is running in another worker"
+            else:
+                report["skipped"] = "checkpointer does not support compaction"
+
+            report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            report["finished_at"] = datetime.now().isoformat()
+            self.last_report = report
+            logger.info(f"[CHECKPOINT] Compaction finished: {report}")
+            return report
+
+    @staticmethod
+    @asynccontextmanager
+    async def _advisory_lock(saver: AsyncPostgresSaver) -> AsyncIterator[bool]:
+        """尝试获取压缩 advisory lock，返回是否成功
+
+        直接从连接池取连接并在整个压缩期间持有（见 _cursor）。
+        """
+        async with _ainternal.get_connection(saver.conn) as conn:
+            cur = await conn.execute(TRY_LOCK_SQL, (COMPACTION_LOCK_KEY,))
+            row = await cur.fetchone()
+            locked = bool(row["locked"] if isinstance(row, dict) else row[0])
+            try:
+                yield locked
+            finally:
+                if locked:
+                    await conn.execute(UNLOCK_SQL, (COMPACTION_LOCK_KEY,))
+
+    async def _compact_all(self, saver: AsyncPostgresSaver, report: Dict[str, Any]) -> None:
+        orphans = await self._find_orphan_threads(saver)
+        if orphans:
+            self._merge(report, await self.delete_threads(orphans))
+
+        async with _cursor(saver) as cur:
+            await cur.execute(
+                OVERSIZED_THREADS_SQL,
+                (self.keep_latest, settings.checkpoint_compaction_batch_size),
+            )
+            thread_ids = sorted({row["thread_id"] for row in await cur.fetchall()})
+
+        for thread_id in thread_ids:
+            try:
+                self._merge(report, await self.compact_thread(saver, thread_id))
+            except Exception as e:
+                # 与运行中的写入冲突等情况，下一轮再处理
+                logger.warning(f"[CHECKPOINT] Compaction failed for {thread_id}: {e}")
+
+    @staticmethod
+    def _merge(report: Dict[str, Any], other: Dict[str, Any]) -> None:
+        for key, value in other.items():
+            report[key] += value
+
+    async def start(self, interval: Optional[int] = None) -> None:
+        """启动后台压缩任务（interval <= 0 时不启动）"""
+        interval = settings.checkpoint_compaction_interval if interval is None else interval
+        if interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"[CHECKPOINT] Compaction job failed: {e}")
+
+        self._task = asyncio.create_task(loop())
+        logger.info(f"[CHECKPOINT] Compaction job started, interval={interval}s, keep_latest={self.keep_latest}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+checkpoint_compactor = CheckpointCompactor()
@@ -0,0 +1,368 @@
+"""Checkpoint 序列化 - zstd 压缩 + 大消息体内容寻址去重
+
+messages 通道每个 checkpoint 都会完整序列化一次消息列表，网页搜索 JSON、
+PDF 文本等大块工具输出会在每一轮被重复写入。这里：
+
+- 大于 checkpoint_blob_min_bytes 的消息正文按 sha256 存入 checkpoint_content_blobs，
+  消息列表中只保留引用，同一正文在线程内只写一次
+- 序列化结果大于 checkpoint_compression_min_bytes 时使用 zstd 压缩
+
+type 字段后缀标记编码方式（"msgpack+cas+zstd"），旧数据（无后缀）照常读取。
+"""
+
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import zstandard
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.postgres import _ainternal
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from psycopg import AsyncCursor
+from psycopg.rows import DictRow, dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+ZSTD_SUFFIX = "+zstd"
+CAS_SUFFIX = "+cas"
+# 消息正文中的引用标记，\x00 保证不会与正常文本冲突
+CAS_MARKER = "\x00cas:sha256:"
+# 引用的正文在数据库中已不存在时（例如被 checkpoint 压缩清理）使用的占位内容
+MISSING_BODY_PLACEHOLDER = "[该消息内容已丢失]"
+_DIGEST_SIZE = 32
+_COUNT = struct.Struct(">H")
+
+CREATE_CONTENT_BLOBS_SQL = """
+CREATE TABLE IF NOT EXISTS checkpoint_content_blobs (
+    thread_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    data BYTEA NOT NULL,
+    PRIMARY KEY (thread_id, hash)
+)
+"""
+
+CREATE_CONTENT_BLOBS_HASH_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS checkpoint_content_blobs_hash_idx ON checkpoint_content_blobs (hash)
+"""
+
+INSERT_CONTENT_BLOB_SQL = """
+INSERT INTO checkpoint_content_blobs (thread_id, hash, data) VALUES (%s, %s, %s)
+ON CONFLICT (thread_id, hash) DO NOTHING
+"""
+
+SELECT_PERSISTED_HASHES_SQL = """
+SELECT hash FROM checkpoint_content_blobs WHERE thread_id = %s AND hash = ANY(%s)
+"""
+
+SELECT_CONTENT_BLOBS_SQL = """
+SELECT DISTINCT ON (hash) hash, data FROM checkpoint_content_blobs WHERE hash = ANY(%s)
+"""
+
+
+def _is_message_list(value: Any) -> bool:
+    return isinstance(value, list) and any(isinstance(item, BaseMessage) for item in value)
+
+
+def _iter_message_lists(value: Any) -> Iterable[List[Any]]:
+    """遍历通道值中的消息列表（messages 通道值或 writes 中的消息增量）"""
+    if _is_message_list(value):
+        yield value
+    elif isinstance(value, BaseMessage):
+        yield [value]
+
+
+class CompressedSerializer(SerializerProtocol):
+    """带压缩与内容寻址去重的 checkpoint 序列化器
+
+    只有已写入 checkpoint_content_blobs 的正文才会被替换为引用（见
+    DedupPostgresSaver.aput），未登记的正文原样内联，保证任何时候读出的
+    checkpoint 都能还原。正文缓存按字节数做 LRU，读取时缺失的正文由
+    saver 预先批量加载，数据库中也不存在的正文以占位内容代替。
+    """
+
+    def __init__(
+        self,
+        inner: Optional[SerializerProtocol] = None,
+        *,
+        compression_min_bytes: Optional[int] = None,
+        compression_level: Optional[int] = None,
+        blob_min_bytes: Optional[int] = None,
+        cache_max_bytes: Optional[int] = None,
+    ):
+        self.inner = inner or JsonPlusSerializer()
+        self.compression_min_bytes = (
+            settings.checkpoint_compression_min_bytes if compression_min_bytes is None else compression_min_bytes
+        )
+        self.compression_level = (
+            settings.checkpoint_compression_level if compression_level is None else compression_level
+        )
+        self.blob_min_bytes = settings.checkpoint_blob_min_bytes if blob_min_bytes is None else blob_min_bytes
+        self.cache_max_bytes = (
+            settings.checkpoint_blob_cache_mb * 1024 * 1024 if cache_max_bytes is None else cache_max_bytes
+        )
+        self._bodies: "OrderedDict[str, str]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"raw_bytes": 0, "stored_bytes": 0, "blob_refs": 0}
+
+    # ---- 正文缓存 ----
+
+    def content_hash(self, message: BaseMessage) -> Optional[str]:
+        """返回需要外置的消息正文哈希，不需要外置时返回 None"""
+        content = message.content
+        if not isinstance(content, str) or self.blob_min_bytes <= 0 or content.startswith(CAS_MARKER):
+            return None
+        encoded = content.encode("utf-8")
+        if len(encoded) < self.blob_min_bytes:
+            return None
+        return hashlib.sha256(encoded).hexdigest()
+
+    def remember(self, digest: str, body: str) -> None:
+        """登记已持久化的正文"""
+        size = len(body)
+        with self._lock:
+            if digest in self._bodies:
+                self._bodies.move_to_end(digest)
+                return
+            self._bodies[digest] = body
+            self._cache_bytes += size
+            while self._cache_bytes > self.cache_max_bytes and len(self._bodies) > 1:
+                _, evicted = self._bodies.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+
+    def lookup(self, digest: str) -> Optional[str]:
+        with self._lock:
+            body = self._bodies.get(digest)
+            if body is not None:
+                self._bodies.move_to_end(digest)
+            return body
+
+    def compress(self, data: bytes) -> bytes:
+        # ZstdCompressor 非线程安全，序列化在 to_thread 线程中执行，按线程复用
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.compression_level)
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+    # ---- SerializerProtocol ----
+
+    def _externalize(self, obj: Any) -> Tuple[Any, List[str]]:
+        """将已登记的大正文替换为引用，返回新对象和引用的哈希列表（不修改原对象）"""
+        refs: List[str] = []
+
+        def replace(message: Any) -> Any:
+            if not isinstance(message, BaseMessage):
+                return message
+            digest = self.content_hash(message)
+            if digest is None or self.lookup(digest) is None:
+                return message
+            refs.append(digest)
+            return message.model_copy(update={"content": f"{CAS_MARKER}{digest}"})
+
+        if _is_message_list(obj):
+            return [replace(m) for m in obj], refs
+        if isinstance(obj, BaseMessage):
+            return replace(obj), refs
+        return obj, refs
+
+    def _internalize(self, obj: Any) -> Any:
+        for messages in _iter_message_lists(obj):
+            for message in messages:
+                content = getattr(message, "content", None)
+                if isinstance(content, str) and content.startswith(CAS_MARKER):
+                    digest = content[len(CAS_MARKER):]
+                    body = self.lookup(digest)
+                    if body is None:
+                        logger.warning(f"[CHECKPOINT] content blob {digest[:12]} missing, using placeholder")
+                        body = MISSING_BODY_PLACEHOLDER
+                    message.content = body
+        return obj
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        obj, refs = self._externalize(obj)
+        type_, data = self.inner.dumps_typed(obj)
+        raw_size = len(data)
+
+        compressed = False
+        if len(data) >= self.compression_min_bytes > 0:
+            packed = self.compress(data)
+            if len(packed) < len(data):
+                data, compressed = packed, True
+
+        if refs:
+            # 引用头不压缩，读取时无需解压即可预加载正文
+            refs = list(dict.fromkeys(refs))
+            data = _COUNT.pack(len(refs)) + b"".join(bytes.fromhex(d) for d in refs) + data
+            type_ += CAS_SUFFIX
+        if compressed:
+            type_ += ZSTD_SUFFIX
+
+        with self._lock:
+            self._stats["raw_bytes"] += raw_size
+            self._stats["stored_bytes"] += len(data)
+            self._stats["blob_refs"] += len(refs)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        compressed = type_.endswith(ZSTD_SUFFIX)
+        if compressed:
+            type_ = type_[: -len(ZSTD_SUFFIX)]
+        has_refs = type_.endswith(CAS_SUFFIX)
+        if has_refs:
+            type_ = type_[: -len(CAS_SUFFIX)]
+            _, payload = split_refs(payload)
+        if compressed:
+            payload = self.decompress(payload)
+        obj = self.inner.loads_typed((type_, payload))
+        return self._internalize(obj) if has_refs else obj
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            raw, stored = self._stats["raw_bytes"], self._stats["stored_bytes"]
+            return {
+                **self._stats,
+                "compression_ratio": round(raw / stored, 2) if stored else 0,
+                "cached_bodies": len(self._bodies),
+                "cached_bytes": self._cache_bytes,
+            }
+
+
+def split_refs(payload: bytes) -> Tuple[List[str], bytes]:
+    """解析引用头，返回 (哈希列表, 剩余数据)"""
+    (count,) = _COUNT.unpack_from(payload)
+    offset = _COUNT.size
+    refs = []
+    for _ in range(count):
+        refs.append(payload[offset:offset + _DIGEST_SIZE].hex())
+        offset += _DIGEST_SIZE
+    return refs, payload[offset:]
+
+
+def refs_in_type(type_: str, payload: Optional[bytes]) -> List[str]:
+    if payload is None or CAS_SUFFIX not in type_:
+        return []
+    return split_refs(payload)[0]
+
+
+class DedupPostgresSaver(AsyncPostgresSaver):
+    """配合 CompressedSerializer 的 AsyncPostgresSaver
+
+    - aput / aput_writes: 先把大消息正文写入 checkpoint_content_blobs，
+      再由序列化器替换为引用，checkpoint 提交时引用的正文一定已存在
+    - 连接池模式下每个操作使用独立连接，不再经过 saver 级的 asyncio.Lock，
+      同一 worker 内的 checkpoint 读写可以并发执行
+    - 写入前先查询线程内已存在的正文哈希，只写入缺失的正文：checkpoint 压缩
+      （可能在其他 worker 中）会清理不再被引用的正文，不能依赖进程内的记录
+    - 读取: 反序列化前批量加载缓存中缺失的正文
+    """
+
+    serde: CompressedSerializer
+
+    def __init__(self, conn: _ainternal.Conn, serde: Optional[CompressedSerializer] = None):
+        super().__init__(conn, serde=serde or CompressedSerializer())
+
+    @asynccontextmanager
+    async def _cursor(self, *, pipeline: bool = False) -> AsyncIterator[AsyncCursor[DictRow]]:
+        """连接池模式下跳过 self.lock：父类用它串行化共享的单个连接，而池中每次调用各取一个连接"""
+        if not isinstance(self.conn, AsyncConnectionPool) or self.pipe:
+            async with super()._cursor(pipeline=pipeline) as cur:
+                yield cur
+            return
+
+        async with self.conn.connection() as conn:
+            if pipeline and self.supports_pipeline:
+                async with conn.pipeline(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            elif pipeline:
+                async with conn.transaction(), conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+            else:
+                async with conn.cursor(binary=True, row_factory=dict_row) as cur:
+                    yield cur
+
+    async def setup(self) -> None:
+        await super().setup()
+        async with self._cursor() as cur:
+            await cur.execute(CREATE_CONTENT_BLOBS_SQL)
+            await cur.execute(CREATE_CONTENT_BLOBS_HASH_INDEX_SQL)
+
+    def _collect_bodies(self, values: Iterable[Any]) -> Dict[str, str]:
+        """收集需要外置的大消息正文"""
+        bodies: Dict[str, str] = {}
+        for value in values:
+            for messages in _iter_message_lists(value):
+                for message in messages:
+                    if not isinstance(message, BaseMessage):
+                        continue
+                    digest = self.serde.content_hash(message)
+                    if digest is not None:
+                        bodies[digest] = message.content
+        return bodies
+
+    async def _persist_bodies(self, thread_id: str, values: Iterable[Any]) -> None:
+        bodies = self._collect_bodies(values)
+        if not bodies:
+            return
+        async with self._cursor() as cur:
+            await cur.execute(SELECT_PERSISTED_HASHES_SQL, (thread_id, list(bodies)))
+            existing = {row["hash"] for row in await cur.fetchall()}
+            rows = [
+                (thread_id, digest, self.serde.compress(body.encode("utf-8")))
+                for digest, body in bodies.items()
+                if digest not in existing
+            ]
+            if rows:
+                await cur.executemany(INSERT_CONTENT_BLOB_SQL, rows)
+        for digest, body in bodies.items():
+            self.serde.remember(digest, body)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        values = checkpoint["channel_values"]
+        await self._persist_bodies(thread_id, (values[k] for k in new_versions if k in values))
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        await self._persist_bodies(thread_id, (value for _, value in writes))
+        await super().aput_writes(config, writes, task_id, task_path)
+
+    async def _load_checkpoint_tuple(self, value):
+        refs: Set[str] = set()
+        for _, type_, blob in value["channel_values"] or []:
+            refs.update(refs_in_type(type_.decode(), blob))
+        for write in value["pending_writes"] or []:
+            refs.update(refs_in_type(write[2].decode(), write[3]))
+        missing = [digest for digest in refs if self.serde.lookup(digest) is None]
+        if missing:
+            await self._fetch_bodies(missing)
+        return await super()._load_checkpoint_tuple(value)
+
+    async def _fetch_bodies(self, digests: List[str]) -> None:
+        # 调用方（aget_tuple / alist）仍持有读取用的游标，另取一个连接加载正文
+        async with _ainternal.get_connection(self.conn) as conn:
+            async with conn.cursor(binary=True) as cur:
+                await cur.execute(SELECT_CONTENT_BLOBS_SQL, (digests,))
+                rows = await cur.fetchall()
+        for row in rows:
+            digest, data = (row["hash"], row["data"]) if isinstance(row, dict) else row
+            self.serde.remember(digest, self.serde.decompress(bytes(data)).decode("utf-8"))
+        if len(rows) < len(digests):
+            logger.warning(f"[CHECKPOINT] {len(digests) - len(rows)} content blobs missing")
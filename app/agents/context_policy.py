@@ -0,0 +1,114 @@
+"""上下文编辑策略 - 按轮次清理或截断过期的工具输出
+
+供 ContextEditingMiddleware 使用，只修改发送给模型的消息副本，
+checkpoint 中保存的原始工具结果不受影响。
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Mapping, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain.agents.middleware import ContextEditingMiddleware
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TokenCounter = Callable[[Sequence[BaseMessage]], int]
+
+CLEARED_PLACEHOLDER = "[已清理: {tool} 的历史输出，如需要请重新调用工具]"
+TRUNCATED_SUFFIX = "\n...[已截断: {tool} 的历史输出，原约 {tokens} tokens]"
+
+
+@dataclass
+class StaleToolOutputEdit:
+    """按轮次处理工具输出
+
+    以用户消息划分轮次，当前轮（最后一条用户消息之后）的工具输出原样保留：
+    - 早于 keep_turns 轮的工具输出替换为占位文本
+    - 其余历史工具输出超过该工具的 token 预算时截断
+
+    Args:
+        keep_turns: 保留完整（或截断后）工具输出的历史轮数，0 表示只保留当前轮
+        tool_budgets: 各工具的历史输出 token 预算
+        default_budget: 未单独配置的工具的预算，<= 0 表示不截断
+        exclude_tools: 不做任何处理的工具
+    """
+
+    keep_turns: int = 2
+    tool_budgets: Mapping[str, int] = field(default_factory=dict)
+    default_budget: int = 2000
+    exclude_tools: Sequence[str] = ()
+
+    def apply(self, messages: List[AnyMessage], *, count_tokens: TokenCounter) -> None:
+        total_turns = sum(1 for m in messages if isinstance(m, HumanMessage))
+        if total_turns <= 1:
+            return
+
+        tool_names: Dict[str, str] = {}
+        excluded = set(self.exclude_tools)
+        turn = 0
+        for idx, message in enumerate(messages):
+            if isinstance(message, HumanMessage):
+                turn += 1
+                continue
+            if isinstance(message, AIMessage):
+                for call in message.tool_calls:
+                    tool_names[call.get("id")] = call["name"]
+                continue
+            if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+                continue
+
+            turns_ago = total_turns - turn
+            tool = message.name or tool_names.get(message.tool_call_id, "")
+            if turns_ago == 0 or tool in excluded:
+                continue
+            if message.response_metadata.get("context_editing", {}).get("cleared"):
+                continue
+
+            if turns_ago > self.keep_turns:
+                messages[idx] = self._replace(message, CLEARED_PLACEHOLDER.format(tool=tool), "clear_stale")
+                continue
+
+            budget = self.tool_budgets.get(tool, self.default_budget)
+            if budget <= 0:
+                continue
+            tokens = count_tokens([message])
+            if tokens <= budget:
+                continue
+            keep_chars = max(1, len(message.content) * budget // tokens)
+            content = message.content[:keep_chars] + TRUNCATED_SUFFIX.format(tool=tool, tokens=tokens)
+            messages[idx] = self._replace(message, content, "truncate")
+
+    @staticmethod
+    def _replace(message: ToolMessage, content: str, strategy: str) -> ToolMessage:
+        return message.model_copy(
+            update={
+                "artifact": None,
+                "content": content,
+                "response_metadata": {
+                    **message.response_metadata,
+                    "context_editing": {"cleared": strategy == "clear_stale", "strategy": strategy},
+                },
+            }
+        )
+
+
+def build_context_policy() -> Optional[StaleToolOutputEdit]:
+    """按配置构建上下文编辑策略，keep_turns < 0 时禁用"""
+    if settings.context_edit_keep_turns < 0:
+        return None
+    return StaleToolOutputEdit(
+        keep_turns=settings.context_edit_keep_turns,
+        tool_budgets=dict(settings.context_edit_tool_budgets),
+        default_budget=settings.context_edit_default_budget,
+        exclude_tools=tuple(settings.context_edit_exclude_tools),
+    )
+
+
+def build_context_editing_middleware() -> Optional[ContextEditingMiddleware]:
+    policy = build_context_policy()
+    if policy is None:
+        return None
+    return ContextEditingMiddleware(edits=[policy])
@@ -1,12 +1,15 @@
 import asyncio
 from enum import Enum
 
+from app.llm.upstream_limiter import UpstreamBusyError
+
 
 class AgentErrorType(Enum):
     """Agent 错误类型枚举"""
     TOOL_CALL_INVALID = "tool_call_invalid"
     TIMEOUT = "timeout"
     STATE_ERROR = "state_error"
+    UPSTREAM_BUSY = "upstream_busy"
     UNKNOWN = "unknown"
 
 
@@ -37,6 +40,9 @@ class AgentErrorClassifier:
         if isinstance(error, asyncio.TimeoutError):
             return AgentErrorType.TIMEOUT
         
+        if isinstance(error, UpstreamBusyError):
+            return AgentErrorType.UPSTREAM_BUSY
+        
         error_msg = str(error).lower()
         
         if all(pattern in error_msg for pattern in cls.TOOL_CALL_PATTERNS):
@@ -64,6 +70,7 @@ class AgentErrorClassifier:
             AgentErrorType.TIMEOUT: "请求处理超时，请稍后重试",
             AgentErrorType.TOOL_CALL_INVALID: "工具调用异常，正在重试..." if not is_production else "处理请求时遇到问题，请重试",
             AgentErrorType.STATE_ERROR: "会话状态异常，请刷新页面重试",
+            AgentErrorType.UPSTREAM_BUSY: "当前请求较多，请稍后再试",
             AgentErrorType.UNKNOWN: "处理请求时出错，请稍后重试",
         }
         return messages.get(error_type, "未知错误")
@@ -0,0 +1,162 @@
+"""长期记忆存储包装 - 单次运行内的读穿缓存"""
+
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Mapping, Optional, Tuple
+
+from langgraph.store.base import (
+    NOT_PROVIDED,
+    BaseStore,
+    Item,
+    NotProvided,
+    Op,
+    PutOp,
+    Result,
+    SearchItem,
+)
+
+logger = logging.getLogger(__name__)
+
+# StoreBackend 收到的是去掉路由前缀后的路径（/memories/preferences.txt → /preferences.txt）
+RUN_CACHED_KEYS = frozenset({"/preferences.txt"})
+
+_CacheKey = Tuple[Tuple[str, ...], str]
+
+_run_cache: ContextVar[Optional[Dict[_CacheKey, Optional[Item]]]] = ContextVar(
+    "memory_run_cache", default=None
+)
+
+
+@contextmanager
+def memory_run_scope() -> Iterator[None]:
+    """开启一次运行的记忆缓存作用域
+
+    作用域内（包括 LangGraph 节点任务和 asyncio.to_thread 线程，它们会复制上下文）
+    对 RUN_CACHED_KEYS 的读取只访问一次底层存储。
+    """
+    token = _run_cache.set({})
+    try:
+        yield
+    finally:
+        try:
+            _run_cache.reset(token)
+        except ValueError:
+            # 异步生成器可能在其他上下文中被关闭（如事件循环关闭时回收）
+            _run_cache.set(None)
+
+
+class RunCachedStore(BaseStore):
+    """包装底层 store，在单次运行内对热点记忆文件做读穿缓存
+
+    - get/aget: 命中运行缓存直接返回，否则读取底层存储并写入缓存
+    - put/delete: 写穿到底层存储并使缓存失效
+    - 其余操作直接委托，保留 AsyncPostgresStore 对同一时刻并发操作的合并批处理
+
+    不在运行作用域内时不做任何缓存。
+    """
+
+    def __init__(self, store: BaseStore, cached_keys: Iterable[str] = RUN_CACHED_KEYS):
+        self.store = store
+        self.cached_keys = frozenset(cached_keys)
+        self.supports_ttl = store.supports_ttl
+        self.ttl_config = store.ttl_config
+
+    def _cache_for(self, key: str) -> Optional[Dict[_CacheKey, Optional[Item]]]:
+        if key not in self.cached_keys:
+            return None
+        return _run_cache.get()
+
+    def _invalidate(self, namespace: Tuple[str, ...], key: str) -> None:
+        cache = self._cache_for(key)
+        if cache is not None:
+            cache.pop((tuple(namespace), key), None)
+
+    def _invalidate_ops(self, ops: List[Op]) -> None:
+        for op in ops:
+            if isinstance(op, PutOp):
+                self._invalidate(op.namespace, op.key)
+
+    def get(
+        self,
+        namespace: Tuple[str, ...],
+        key: str,
+        *,
+        refresh_ttl: Optional[bool] = None,
+    ) -> Optional[Item]:
+        cache = self._cache_for(key)
+        cache_key = (tuple(namespace), key)
+        if cache is not None and cache_key in cache:
+            logger.debug(f"[MEMORY] Run cache hit: {key}")
+            return cache[cache_key]
+        item = self.store.get(namespace, key, refresh_ttl=refresh_ttl)
+        if cache is not None:
+            cache[cache_key] = item
+        return item
+
+    async def aget(
+        self,
+        namespace: Tuple[str, ...],
+        key: str,
+        *,
+        refresh_ttl: Optional[bool] = None,
+    ) -> Optional[Item]:
+        cache = self._cache_for(key)
+        cache_key = (tuple(namespace), key)
+        if cache is not None and cache_key in cache:
+            logger.debug(f"[MEMORY] Run cache hit: {key}")
+            return cache[cache_key]
+        item = await self.store.aget(namespace, key, refresh_ttl=refresh_ttl)
+        if cache is not None:
+            cache[cache_key] = item
+        return item
+
+    def put(
+        self,
+        namespace: Tuple[str, ...],
+        key: str,
+        value: Mapping[str, Any],
+        index: Optional[Literal[False] | List[str]] = None,
+        *,
+        ttl: Optional[float] | NotProvided = NOT_PROVIDED,
+    ) -> None:
+        self.store.put(namespace, key, value, index, ttl=ttl)
+        self._invalidate(namespace, key)
+
+    async def aput(
+        self,
+        namespace: Tuple[str, ...],
+        key: str,
+        value: Mapping[str, Any],
+        index: Optional[Literal[False] | List[str]] = None,
+        *,
+        ttl: Optional[float] | NotProvided = NOT_PROVIDED,
+    ) -> None:
+        await self.store.aput(namespace, key, value, index, ttl=ttl)
+        self._invalidate(namespace, key)
+
+    def delete(self, namespace: Tuple[str, ...], key: str) -> None:
+        self.store.delete(namespace, key)
+        self._invalidate(namespace, key)
+
+    async def adelete(self, namespace: Tuple[str, ...], key: str) -> None:
+        await self.store.adelete(namespace, key)
+        self._invalidate(namespace, key)
+
+    def search(self, namespace_prefix: Tuple[str, ...], /, **kwargs: Any) -> List[SearchItem]:
+        return self.store.search(namespace_prefix, **kwargs)
+
+    async def asearch(self, namespace_prefix: Tuple[str, ...], /, **kwargs: Any) -> List[SearchItem]:
+        return await self.store.asearch(namespace_prefix, **kwargs)
+
+    def batch(self, ops: Iterable[Op]) -> List[Result]:
+        ops = list(ops)
+        results = self.store.batch(ops)
+        self._invalidate_ops(ops)
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> List[Result]:
+        ops = list(ops)
+        results = await self.store.abatch(ops)
+        self._invalidate_ops(ops)
+        return results
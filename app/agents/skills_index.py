@@ -0,0 +1,221 @@
+"""技能索引 - 内存中的 SKILL.md 元数据与正文，支持热更新
+
+SkillsMiddleware 默认每个新线程通过 FilesystemBackend 扫描技能目录，
+且模型需要先调用 read_file 读取 SKILL.md 才能按技能执行，多一次模型往返。
+这里启动时解析全部 SKILL.md（frontmatter、描述、内容哈希与正文）：
+
+- IndexedSkillsMiddleware 直接使用索引中的元数据，不再扫描目录
+- 当前轮用户消息与某个技能描述匹配时，把技能正文直接注入系统提示
+- watchfiles 监听技能目录，文件变化后重新加载索引
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+# 以下为 deepagents 私有接口，requirements.txt 中限定了 deepagents 的版本上限，升级前需确认仍可用
+from deepagents.middleware._utils import append_to_system_message
+from deepagents.middleware.skills import SkillMetadata, SkillsMiddleware, _parse_skill_metadata
+from langchain_core.messages import HumanMessage
+
+from app.agents.tool_selector import cosine_similarity, ngram_vector
+
+logger = logging.getLogger(__name__)
+
+SKILL_FILE = "SKILL.md"
+
+INJECTED_SKILL_TEMPLATE = """## 已加载技能：{name}
+
+当前请求匹配技能 `{name}`，以下是 `{path}` 的完整内容，已为你读取，无需再调用 read_file，
+请直接按照技能中的流程和模板执行：
+
+{body}"""
+
+
+@dataclass(frozen=True)
+class SkillEntry:
+    """单个技能的索引条目"""
+
+    metadata: SkillMetadata
+    body: str
+    content_hash: str
+    file_path: Path
+    vector: Any
+
+    @property
+    def name(self) -> str:
+        return self.metadata["name"]
+
+
+class SkillsIndex:
+    """技能索引
+
+    load() 在线程中执行（文件 IO），重新加载时整体替换条目字典，
+    读取方无需加锁即可拿到一致的快照。
+    """
+
+    def __init__(self, root: Path, virtual_prefix: str = "/skills/", min_score: float = 0.15):
+        self.root = Path(root)
+        self.virtual_prefix = virtual_prefix
+        self.min_score = min_score
+        self._entries: Dict[str, SkillEntry] = {}
+        self._reload_lock = threading.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+
+    def load(self) -> int:
+        """扫描并解析技能目录，返回技能数量；内容未变化的技能复用已有条目"""
+        with self._reload_lock:
+            previous = {entry.file_path: entry for entry in self._entries.values()}
+            entries: Dict[str, SkillEntry] = {}
+            for skill_file in sorted(self.root.rglob(SKILL_FILE)) if self.root.exists() else []:
+                try:
+                    raw = skill_file.read_bytes()
+                except OSError as e:
+                    logger.warning(f"[SKILLS] Failed to read {skill_file}: {e}")
+                    continue
+                content_hash = hashlib.sha256(raw).hexdigest()
+                cached = previous.get(skill_file)
+                if cached is not None and cached.content_hash == content_hash:
+                    entries[cached.name] = cached
+                    continue
+
+                relative = skill_file.relative_to(self.root).as_posix()
+                metadata = _parse_skill_metadata(
+                    raw.decode("utf-8", errors="replace"),
+                    f"{self.virtual_prefix}{relative}",
+                    skill_file.parent.name,
+                )
+                if metadata is None:
+                    continue
+                entries[metadata["name"]] = SkillEntry(
+                    metadata=metadata,
+                    body=raw.decode("utf-8", errors="replace"),
+                    content_hash=content_hash,
+                    file_path=skill_file,
+                    vector=ngram_vector(f"{metadata['name']} {metadata['description']}"),
+                )
+
+            self._entries = entries
+            self.loaded_at = time.time()
+            self.reloads += 1
+            logger.info(f"[SKILLS] Indexed {len(entries)} skills from {self.root}")
+            return len(entries)
+
+    def metadata(self) -> List[SkillMetadata]:
+        return [entry.metadata for entry in self._entries.values()]
+
+    def get(self, name: str) -> Optional[SkillEntry]:
+        return self._entries.get(name)
+
+    def match(self, text: str) -> Optional[SkillEntry]:
+        """返回与文本最匹配的技能（得分低于阈值时返回 None）"""
+        if not text or not self._entries:
+            return None
+        query = ngram_vector(text)
+        best, best_score = None, self.min_score
+        for entry in self._entries.values():
+            score = cosine_similarity(query, entry.vector)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    async def _watch(self) -> None:
+        from watchfiles import awatch
+
+        async for changes in awatch(self.root, stop_event=self._stop_event):
+            if any(Path(path).name == SKILL_FILE for _, path in changes):
+                try:
+                    await asyncio.to_thread(self.load)
+                except Exception as e:
+                    logger.error(f"[SKILLS] Reload failed: {e}")
+
+    def start_watching(self) -> None:
+        """启动技能目录监听（需要在事件循环中调用）"""
+        if self._watch_task is not None and not self._watch_task.done():
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._stop_event = asyncio.Event()
+        self._watch_task = asyncio.create_task(self._watch())
+        logger.info(f"[SKILLS] Watching {self.root} for changes")
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is None:
+            return
+        self._stop_event.set()
+        try:
+            await asyncio.wait_for(self._watch_task, timeout=5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._watch_task.cancel()
+        self._watch_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "root": str(self.root),
+            "skills": [
+                {
+                    "name": entry.name,
+                    "path": entry.metadata["path"],
+                    "content_hash": entry.content_hash[:12],
+                    "size": len(entry.body),
+                }
+                for entry in self._entries.values()
+            ],
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "watching": self._watch_task is not None and not self._watch_task.done(),
+        }
+
+
+class IndexedSkillsMiddleware(SkillsMiddleware):
+    """基于 SkillsIndex 的 SkillsMiddleware
+
+    - before_agent: 用索引元数据更新状态（索引热更新后同步到已有线程），不扫描目录
+    - 模型调用: 技能列表取自索引；当前轮用户消息匹配技能时注入技能正文
+    """
+
+    def __init__(self, *, index: SkillsIndex, backend: Any, sources: Sequence[str]):
+        super().__init__(backend=backend, sources=sources)
+        self.index = index
+
+    def before_agent(self, state, runtime, config):
+        skills = self.index.metadata()
+        if state.get("skills_metadata") == skills:
+            return None
+        return {"skills_metadata": skills}
+
+    async def abefore_agent(self, state, runtime, config):
+        return self.before_agent(state, runtime, config)
+
+    @staticmethod
+    def _current_user_text(messages: Sequence[Any]) -> str:
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                content = message.content
+                return content if isinstance(content, str) else ""
+        return ""
+
+    def modify_request(self, request):
+        if self.system_prompt_template is None:
+            return request
+
+        skills_section = self.system_prompt_template.format(
+            skills_locations=self._format_skills_locations(),
+            skills_load_warnings="",
+            skills_list=self._format_skills_list(self.index.metadata()),
+        )
+        entry = self.index.match(self._current_user_text(request.messages))
+        if entry is not None:
+            skills_section += "\n\n" + INJECTED_SKILL_TEMPLATE.format(
+                name=entry.name, path=entry.metadata["path"], body=entry.body
+            )
+            logger.debug(f"[SKILLS] Injected skill {entry.name}")
+
+        return request.override(system_message=append_to_system_message(request.system_message, skills_section))
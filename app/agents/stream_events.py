@@ -0,0 +1,83 @@
+"""工具流式事件中间件 - 通过 LangGraph custom 流输出工具调用生命周期"""
+
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.agents.middleware.types import ToolCallRequest
+from langchain_core.messages import ToolMessage
+from langgraph.types import Command
+
+logger = logging.getLogger(__name__)
+
+TOOL_START_EVENT = "tool_start"
+TOOL_END_EVENT = "tool_end"
+# artifact 中只随 tool_end 事件发送、不写入 checkpoint 的详情字段
+STREAM_DETAILS_KEY = "details"
+
+
+def _find_tool_message(result: Any, tool_call_id: str) -> Optional[ToolMessage]:
+    """从工具执行结果（ToolMessage 或 Command）中取出对应的 ToolMessage"""
+    if isinstance(result, ToolMessage):
+        return result
+    if isinstance(result, Command) and isinstance(result.update, dict):
+        for message in result.update.get("messages", []) or []:
+            if isinstance(message, ToolMessage) and message.tool_call_id == tool_call_id:
+                return message
+    return None
+
+
+class ToolStreamEventsMiddleware(AgentMiddleware):
+    """在工具执行前后写入 custom 流事件
+
+    - tool_start: 工具调用参数已完整，作为工具调用的确认
+    - tool_end: 携带工具自身产出的结构化 artifact（若有），
+      下游直接据此生成摘要，无需再解析工具输出字符串；artifact 中的
+      details（代码、译文等正文）移到事件的 details 字段，ToolMessage 写入
+      checkpoint 前从 artifact 中移除
+
+    事件对象仅在进程内传递，未订阅 custom 流时写入为空操作。
+    """
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[Any]],
+    ) -> Any:
+        tool_call = request.tool_call
+        tool_call_id = tool_call.get("id", "")
+        name = tool_call.get("name", "")
+        writer = getattr(request.runtime, "stream_writer", None) if request.runtime else None
+
+        if writer is not None:
+            writer({
+                "event": TOOL_START_EVENT,
+                "tool_call_id": tool_call_id,
+                "name": name,
+                "args": tool_call.get("args", {}),
+            })
+
+        result = await handler(request)
+        message = _find_tool_message(result, tool_call_id)
+
+        details = None
+        if message is not None and isinstance(message.artifact, dict) and STREAM_DETAILS_KEY in message.artifact:
+            artifact = dict(message.artifact)
+            details = artifact.pop(STREAM_DETAILS_KEY)
+            message.artifact = artifact
+
+        if writer is not None:
+            if message is not None:
+                writer({
+                    "event": TOOL_END_EVENT,
+                    "tool_call_id": tool_call_id,
+                    "name": message.name or name,
+                    "artifact": message.artifact,
+                    "details": details,
+                    "content": message.content,
+                    "status": message.status,
+                })
+            else:
+                logger.debug(f"[AGENT] No ToolMessage found for tool_call_id={tool_call_id}")
+
+        return result
@@ -0,0 +1,276 @@
+"""工具子集预选 - 按轮次为 Agent 选择需要绑定的业务工具
+
+每次模型调用都会携带所有绑定工具的 schema。这里在本地（不调用模型）
+根据关键词和字符 n-gram 相似度选出本轮可能用到的工具组：
+
+- 未命中任何工具组、且明确是闲聊（问候、致谢、不含疑问的极短消息）时不绑定业务工具
+  （文件系统工具由中间件提供，始终可用）
+- 其他未命中的消息保守地绑定全部工具：实时信息、领域问题不一定含关键词
+- 同一对话上一轮选中的工具组会保留到本轮，便于"再详细一点"之类的追问
+
+选择按工具组进行，组合数量有限，对应的 Agent 图可以被 AgentCache 复用。
+"""
+
+import re
+import math
+import logging
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TOOL_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "search": ("web_search",),
+    "knowledge": ("search_knowledge_base",),
+    "documents": ("read_pdf", "read_word"),
+    "vision": ("understand_image", "ocr_document"),
+    "image_gen": ("generate_image", "edit_image"),
+    "code": ("code_assist",),
+    "translate": ("translate_text",),
+}
+
+GROUP_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "search": ("搜索", "搜一下", "查一下", "查查", "联网", "最新", "最近", "目前", "新闻", "天气", "股价", "实时", "search", "news", "weather", "latest"),
+    "knowledge": ("扫地", "扫拖", "拖地", "吸尘", "滤网", "边刷", "基站", "robot", "vacuum"),
+    "documents": ("pdf", "docx", "word", "文档", "文件", "论文", "报告"),
+    "vision": ("图片", "照片", "截图", "这张图", "识别", "ocr", "image", "photo"),
+    "image_gen": ("画一", "画个", "画张", "生成图", "生成一张", "绘制", "设计图", "海报", "修图", "改图", "p图", "抠图", "背景", "滤镜", "风格", "卡通", "美化", "draw"),
+    "code": ("代码", "编程", "函数", "报错", "bug", "python", "java", "sql", "脚本", "算法", "code"),
+    "translate": ("翻译", "译成", "译为", "translate"),
+}
+
+# 图片附件既可能是识别也可能是编辑，两组都绑定
+ATTACHMENT_GROUPS: Dict[str, Tuple[str, ...]] = {
+    ".pdf": ("documents",),
+    ".docx": ("documents",),
+    ".doc": ("documents",),
+    ".png": ("vision", "image_gen"),
+    ".jpg": ("vision", "image_gen"),
+    ".jpeg": ("vision", "image_gen"),
+    ".webp": ("vision", "image_gen"),
+    ".bmp": ("vision", "image_gen"),
+    ".gif": ("vision", "image_gen"),
+}
+
+# 问候、致谢、应答等闲聊开头；英文需整词匹配
+SMALL_TALK_PHRASES: Tuple[str, ...] = (
+    "你好", "您好", "嗨", "哈喽", "早上好", "早安", "中午好", "下午好", "晚上好", "晚安",
+    "谢谢", "多谢", "感谢", "好的", "嗯", "收到", "明白", "了解", "再见", "拜拜",
+    "hi", "hello", "hey", "thanks", "thank you", "thx", "ok", "okay", "bye",
+)
+
+# 问候/致谢后常见的语气词与称呼，只在 is_greeting 中与 SMALL_TALK_PHRASES 组合出现
+GREETING_FILLERS: Tuple[str, ...] = (
+    "呀", "啊", "啦", "哈", "嘛", "哦", "喔", "噢", "哒", "了", "你", "您", "大家",
+    "so", "much", "a", "lot", "very", "you", "all", "there", "again",
+)
+
+QUESTION_MARKERS: Tuple[str, ...] = (
+    "?", "？", "吗", "呢", "么", "什么", "怎么", "怎样", "如何", "多少", "几", "哪", "谁", "是否",
+    "how", "what", "when", "where", "why", "who", "which",
+)
+
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r"[\s,.!~，。！～、…]+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text.lower()).strip()
+
+
+def is_small_talk(text: str, max_chars: Optional[int] = None) -> bool:
+    """是否为明确的闲聊：问候/致谢/应答，或不含疑问的极短消息（不超过 max_chars 个字符）"""
+    max_chars = settings.tool_selector_small_talk_chars if max_chars is None else max_chars
+    normalized = _normalize(text)
+    if any(marker in normalized for marker in QUESTION_MARKERS):
+        return False
+    stripped = _PUNCTUATION.sub(" ", normalized).strip()
+    compact = stripped.replace(" ", "")
+    if not compact:
+        return False
+    for phrase in SMALL_TALK_PHRASES:
+        if not stripped.startswith(phrase):
+            continue
+        rest = stripped[len(phrase):]
+        if phrase.isascii() and rest and not rest.startswith(" "):
+            continue
+        if len(rest.replace(" ", "")) <= max_chars:
+            return True
+    return len(compact) <= max_chars
+
+
+_GREETING_TOKENS = sorted(
+    [(token, True) for token in SMALL_TALK_PHRASES] + [(token, False) for token in GREETING_FILLERS],
+    key=lambda item: -len(item[0]),
+)
+
+
+def is_greeting(text: str) -> bool:
+    """是否只由问候/致谢/应答短语（可带语气词）组成，如"你好呀"、"好的谢谢"、"thank you so much"
+
+    与 is_small_talk 不同，不把其他短消息视为闲聊："继续"、"总结一下"、"用英文回答"等
+    追问依赖上下文和工具，不能按闲聊处理。
+    """
+    normalized = _normalize(text)
+    if any(marker in normalized for marker in QUESTION_MARKERS):
+        return False
+    rest = _PUNCTUATION.sub(" ", normalized).strip()
+    matched = False
+    while rest:
+        for token, is_phrase in _GREETING_TOKENS:
+            if not rest.startswith(token):
+                continue
+            tail = rest[len(token):]
+            if token.isascii() and tail and not tail.startswith(" "):
+                continue
+            rest = tail.lstrip()
+            matched = matched or is_phrase
+            break
+        else:
+            return False
+    return matched
+
+
+def ngram_vector(text: str, n: int = 2) -> Counter:
+    text = _normalize(text).replace(" ", "")
+    if len(text) < n:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def cosine_similarity(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[gram] for gram, count in a.items() if gram in b)
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm
+
+
+class ToolSelector:
+    """本地工具子集预选器
+
+    选择结果按（归一化消息, 附件类型）缓存，LRU 淘汰。选中的工具组超过 max_groups 时
+    绑定全部工具，把 Agent 图的工具组合数限制在少数几档内。
+    """
+
+    def __init__(
+        self,
+        min_score: Optional[float] = None,
+        small_talk_chars: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        max_groups: Optional[int] = None,
+    ):
+        self.min_score = settings.tool_selector_min_score if min_score is None else min_score
+        self.small_talk_chars = (
+            settings.tool_selector_small_talk_chars if small_talk_chars is None else small_talk_chars
+        )
+        self.cache_size = max(1, settings.tool_selector_cache_size if cache_size is None else cache_size)
+        self.max_groups = settings.tool_selector_max_groups if max_groups is None else max_groups
+        self._cache: "OrderedDict[Tuple[str, Tuple[str, ...]], FrozenSet[str]]" = OrderedDict()
+        self._last_groups: "OrderedDict[Any, FrozenSet[str]]" = OrderedDict()
+        self._group_vectors: Optional[Dict[str, Counter]] = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _all_tools() -> list:
+        from app.tools import ALL_TOOLS
+        return ALL_TOOLS
+
+    def _vectors(self) -> Dict[str, Counter]:
+        """各工具组描述的 n-gram 向量（首次使用时计算）"""
+        if self._group_vectors is None:
+            descriptions = {getattr(t, "name", ""): getattr(t, "description", "") or "" for t in self._all_tools()}
+            self._group_vectors = {
+                group: ngram_vector(" ".join(descriptions.get(name, "") for name in names))
+                for group, names in TOOL_GROUPS.items()
+            }
+        return self._group_vectors
+
+    def _score_groups(self, text: str, extensions: Tuple[str, ...]) -> FrozenSet[str]:
+        normalized = _normalize(text)
+        groups = {group for ext in extensions for group in ATTACHMENT_GROUPS.get(ext, ())}
+        for group, keywords in GROUP_KEYWORDS.items():
+            if any(keyword in normalized for keyword in keywords):
+                groups.add(group)
+
+        # 描述相似度只在附件与关键词都未命中时兜底：字符 bigram 很容易与无关工具的描述
+        # 重合（如"搜索一下最新的python新闻"与知识库描述中的"搜索"）
+        if not groups:
+            query = ngram_vector(normalized)
+            for group, vector in self._vectors().items():
+                if cosine_similarity(query, vector) >= self.min_score:
+                    groups.add(group)
+
+        if not groups and not is_small_talk(normalized, self.small_talk_chars):
+            groups = set(TOOL_GROUPS)
+        return frozenset(groups)
+
+    def select_groups(
+        self,
+        content: str,
+        attachments: Optional[Sequence[str]] = None,
+        conversation_id: Any = None,
+    ) -> FrozenSet[str]:
+        """选择本轮的工具组"""
+        extensions = tuple(sorted({Path(a).suffix.lower() for a in attachments or []}))
+        cache_key = (_normalize(content), extensions)
+
+        with self._lock:
+            groups = self._cache.get(cache_key)
+            if groups is not None:
+                self._cache.move_to_end(cache_key)
+                self._hits += 1
+        if groups is None:
+            groups = self._score_groups(content, extensions)
+            with self._lock:
+                self._misses += 1
+                self._cache[cache_key] = groups
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if conversation_id is not None:
+            with self._lock:
+                previous = self._last_groups.pop(conversation_id, frozenset())
+                self._last_groups[conversation_id] = groups
+                while len(self._last_groups) > self.cache_size:
+                    self._last_groups.popitem(last=False)
+            groups = groups | previous
+        if len(groups) > self.max_groups:
+            # 每种工具组合对应一个编译好的 Agent 图，组合过多会让图缓存频繁淘汰重建
+            groups = frozenset(TOOL_GROUPS)
+        return groups
+
+    def select(
+        self,
+        content: str,
+        attachments: Optional[Sequence[str]] = None,
+        conversation_id: Any = None,
+    ) -> List[Any]:
+        """选择本轮绑定的工具，保持 ALL_TOOLS 中的顺序"""
+        groups = self.select_groups(content, attachments, conversation_id)
+        names = {name for group in groups for name in TOOL_GROUPS[group]}
+        tools = [t for t in self._all_tools() if getattr(t, "name", None) in names]
+        logger.debug(f"[TOOLS] Selected groups {sorted(groups)} -> {[t.name for t in tools]}")
+        return tools
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "cached_selections": len(self._cache),
+                "tracked_conversations": len(self._last_groups),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total * 100, 2) if total > 0 else 0,
+            }
+
+
+tool_selector = ToolSelector()
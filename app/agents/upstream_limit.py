@@ -0,0 +1,59 @@
+"""上游限流中间件 - Agent 的每次模型调用占用对应模型的限流槽"""
+
+import logging
+from typing import Any, Awaitable, Callable
+
+from langchain.agents.middleware import AgentMiddleware
+from langchain.agents.middleware.types import ModelRequest, ToolCallRequest
+from langchain_core.messages import ToolMessage
+
+from app.llm.upstream_limiter import UpstreamBusyError, upstream_limiters
+
+logger = logging.getLogger(__name__)
+
+
+def retry_unless_busy(error: Exception) -> bool:
+    """ToolRetryMiddleware 的 retry_on：上游排队超时不重试，避免放大负载"""
+    return not isinstance(error, UpstreamBusyError)
+
+
+class UpstreamBusyToolMiddleware(AgentMiddleware):
+    """工具上游繁忙时返回错误 ToolMessage，由模型在缺少该工具结果的情况下继续作答
+
+    放在 ToolRetryMiddleware 之前（外层）：retry_unless_busy 让繁忙错误不重试、
+    直接抛出且不经过 on_failure，在此转换，避免整轮对话失败。
+    """
+
+    async def awrap_tool_call(
+        self,
+        request: ToolCallRequest,
+        handler: Callable[[ToolCallRequest], Awaitable[Any]],
+    ) -> Any:
+        try:
+            return await handler(request)
+        except UpstreamBusyError as e:
+            tool_call = request.tool_call
+            logger.warning(f"[AGENT] Tool {tool_call.get('name')} skipped: {e}")
+            return ToolMessage(
+                content=f"Tool '{tool_call.get('name')}' is temporarily unavailable: {e}. "
+                        "Answer without it.",
+                tool_call_id=tool_call.get("id", ""),
+                name=tool_call.get("name"),
+                status="error",
+            )
+
+
+class UpstreamLimitMiddleware(AgentMiddleware):
+    """按实际调用的模型（ModelFallbackMiddleware 切换后的模型）限流
+
+    放在 ModelFallbackMiddleware 之后，主模型与回退模型分别计入各自的上游。
+    """
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[Any]],
+    ) -> Any:
+        name = getattr(request.model, "model_name", None) or "default"
+        async with upstream_limiters.get(name).slot():
+            return await handler(request)
@@ -17,10 +17,11 @@ async def get_token_from_header(credentials: HTTPAuthorizationCredentials = Depe
     return credentials.credentials
 
 
-async def get_current_user(
-    token: str = Depends(get_token_from_header),
-    db: AsyncSession = Depends(get_db)
-) -> User:
+async def resolve_user_from_token(token: str, db: AsyncSession) -> User:
+    """校验 Token（黑名单 + 签名）并加载对应用户
+    
+    供 HTTP 依赖与 WebSocket 握手共用，校验失败时抛出 401 HTTPException。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -50,9 +51,24 @@ async def get_current_user(
     return user
 
 
+async def get_current_user(
+    token: str = Depends(get_token_from_header),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    return await resolve_user_from_token(token, db)
+
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_superuser(
+    current_user: User = Depends(get_current_active_user)
+) -> User:
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough privileges")
+    return current_user
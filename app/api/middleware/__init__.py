@@ -1,16 +1,21 @@
 """API 中间件模块"""
 
 from .request_size_limit import RequestSizeLimitMiddleware
-from .rate_limit import limiter, rate_limit_exceeded_handler, CHAT_RATE_LIMIT, AUTH_RATE_LIMIT, DEFAULT_RATE_LIMIT
+from .rate_limit import limiter, rate_limit_exceeded_handler, hit_rate_limit, release_rate_limit, get_view_rate_limit, CHAT_RATE_LIMIT, AUTH_RATE_LIMIT, DEFAULT_RATE_LIMIT
 from .tracing import RequestTracingMiddleware, get_request_id
+from .metrics import MetricsMiddleware
 
 __all__ = [
     "RequestSizeLimitMiddleware",
     "limiter",
     "rate_limit_exceeded_handler",
+    "hit_rate_limit",
+    "release_rate_limit",
+    "get_view_rate_limit",
     "CHAT_RATE_LIMIT",
     "AUTH_RATE_LIMIT",
     "DEFAULT_RATE_LIMIT",
     "RequestTracingMiddleware",
     "get_request_id",
+    "MetricsMiddleware",
 ]
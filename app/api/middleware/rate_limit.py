@@ -2,6 +2,8 @@
 
 import logging
 from fastapi import Request
+from typing import Optional, Sequence, Tuple
+from limits import parse, RateLimitItem
 from fastapi.responses import JSONResponse
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -59,6 +61,38 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
     )
 
 
+def hit_rate_limit(limit_value: str, scope: str, identifier: str) -> bool:
+    """在非 HTTP 路由（如 WebSocket 消息）中手动计数限流
+    
+    与装饰器共用同一存储，存储不可用时放行。
+    
+    Returns:
+        bool: 是否允许本次请求
+    """
+    try:
+        return limiter.limiter.hit(parse(limit_value), scope, identifier)
+    except Exception as e:
+        logger.warning(f"[RATE LIMIT] 限流存储不可用，放行请求: {e}")
+        return True
+
+
+def release_rate_limit(item: RateLimitItem, identifiers: Sequence[str]) -> None:
+    """退还一次限流计数（如运行被服务端取消）
+    
+    identifiers 与计数时使用的键组成一致：装饰器路由取自
+    request.state.view_rate_limit，手动计数为 (scope, identifier)。
+    """
+    try:
+        limiter.limiter.storage.incr(item.key_for(*identifiers), item.get_expiry(), amount=-1)
+    except Exception as e:
+        logger.warning(f"[RATE LIMIT] 退还限流额度失败: {e}")
+
+
+def get_view_rate_limit(request: Request) -> Optional[Tuple[RateLimitItem, Sequence[str]]]:
+    """获取当前请求命中的限流项及其键组成"""
+    return getattr(request.state, "view_rate_limit", None)
+
+
 CHAT_RATE_LIMIT = settings.rate_limit_chat
 AUTH_RATE_LIMIT = settings.rate_limit_auth
 DEFAULT_RATE_LIMIT = settings.rate_limit_default
@@ -2,24 +2,24 @@
 
 import uuid
 import logging
-from contextvars import ContextVar
+from typing import AsyncIterator
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
-logger = logging.getLogger(__name__)
-
-request_id_var: ContextVar[str] = ContextVar("request_id", default="")
-
+from app.config import settings
+from app.core.profiling import request_profiler
+from app.core.request_context import get_request_id, request_id_var
+from app.core.timing import RequestTiming, can_expose, request_timing_var
 
-def get_request_id() -> str:
-    """获取当前请求的追踪 ID"""
-    return request_id_var.get()
+logger = logging.getLogger(__name__)
 
 
 class RequestTracingMiddleware(BaseHTTPMiddleware):
     """请求追踪中间件
     
-    为每个请求生成唯一的追踪 ID，并添加到响应头和日志上下文中
+    为每个请求生成唯一的追踪 ID，并添加到响应头和日志上下文中；
+    记录请求阶段耗时，输出 [TIMING] 日志，允许查看时输出 Server-Timing 头（见 app.core.timing）；
+    开启剖析时对抽中的请求采样调用栈（见 app.core.profiling）
     """
     
     async def dispatch(self, request: Request, call_next):
@@ -29,13 +29,63 @@ class RequestTracingMiddleware(BaseHTTPMiddleware):
         
         request.state.request_id = request_id
         
-        response = await call_next(request)
+        timing = RequestTiming(expose=can_expose(request.headers)) if settings.request_timing_enabled else None
+        request_timing_var.set(timing)
+        
+        profile = request_profiler.maybe_start(request_id, request.method, request.url.path, request.headers)
+        try:
+            response = await call_next(request)
+        except BaseException as e:
+            if profile is not None:
+                profile.finish(e)
+            raise
         
         response.headers["X-Request-ID"] = request_id
         
+        if timing is not None:
+            if timing.expose:
+                # 流式响应只含响应头之前的 span，完整结果见 timing 事件与日志
+                response.headers["Server-Timing"] = timing.server_timing_header()
+            body_iterator = getattr(response, "body_iterator", None)
+            if body_iterator is not None:
+                response.body_iterator = self._log_timing_after(body_iterator, timing, request, request_id)
+            else:
+                self._log_timing(timing, request, request_id)
+        
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers["X-Profile-ID"] = profile.profile_id
+            body_iterator = getattr(response, "body_iterator", None)
+            if body_iterator is not None:
+                # 流式响应在响应体发送完毕后结束剖析
+                response.body_iterator = profile.wrap_stream(body_iterator)
+            else:
+                profile.finish()
+        
         logger.debug(
             f"[REQUEST] method={request.method} path={request.url.path} "
             f"status_code={response.status_code} request_id={request_id}"
         )
         
         return response
+
+    @classmethod
+    async def _log_timing_after(
+        cls, body: AsyncIterator[bytes], timing: RequestTiming, request: Request, request_id: str
+    ) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            cls._log_timing(timing, request, request_id)
+
+    @staticmethod
+    def _log_timing(timing: RequestTiming, request: Request, request_id: str) -> None:
+        if not timing.spans:
+            return
+        summary = timing.summary()
+        logger.info(
+            f"[TIMING] method={request.method} path={request.url.path} "
+            f"total={summary['total_ms']}ms spans={len(summary['spans'])} request_id={request_id}",
+            extra={"request_id": request_id, "extra_data": summary},
+        )
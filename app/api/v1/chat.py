@@ -1,11 +1,21 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, WebSocket
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
+from limits import parse
 
 from app.core.database import get_db
-from app.api.dependencies import get_current_active_user
-from app.api.middleware import limiter, CHAT_RATE_LIMIT
+from app.core.timing import traced
+from app.api.dependencies import get_current_active_user, resolve_user_from_token
+from app.api.middleware import (
+    limiter,
+    hit_rate_limit,
+    release_rate_limit,
+    get_view_rate_limit,
+    CHAT_RATE_LIMIT,
+)
+from app.security import decode_access_token
 from app.models.user import User
 from app.schemas.message import (
     ChatRequest,
@@ -14,11 +24,44 @@ from app.schemas.message import (
 )
 from app.services.chat_service import chat_service
 from app.services.conversation_service import conversation_service
-from app.services.stream import sse_with_heartbeat
+from app.services.stream import (
+    ChatWebSocketSession,
+    run_registry,
+    sse_with_heartbeat,
+    make_ndjson_heartbeat,
+    NDJSON_MEDIA_TYPE,
+    STREAM_FORMAT_NDJSON,
+    STREAM_FORMAT_SSE,
+)
 
 router = APIRouter(prefix="/chat", tags=["聊天"])
 logger = __import__("logging").getLogger(__name__)
 
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+
+def _stream_format(request: Request) -> str:
+    """根据 Accept 头协商流式传输格式：NDJSON 紧凑传输或默认的 SSE"""
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return STREAM_FORMAT_NDJSON
+    return STREAM_FORMAT_SSE
+
+
+def _get_ws_token(websocket: WebSocket) -> str | None:
+    """从查询参数或 Authorization 头获取 WebSocket 认证 Token"""
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, credentials = authorization.partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    return None
+
 
 @router.get("/conversations/{conversation_id}/history", response_model=ChatHistoryResponse)
 @limiter.limit(CHAT_RATE_LIMIT)
@@ -49,6 +92,7 @@ async def get_chat_history(
 
 @router.post("/send")
 @limiter.limit(CHAT_RATE_LIMIT)
+@traced("send_chat_message")
 async def send_chat_message(
     request: Request,
     chat_request: ChatRequest,
@@ -66,6 +110,13 @@ async def send_chat_message(
             detail="Conversation not found"
         )
     
+    run_id = chat_request.run_id or run_registry.new_run_id()
+    if run_registry.get(run_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Run already exists"
+        )
+    
     await chat_service.create_message(
         db,
         conversation_id=chat_request.conversation_id,
@@ -77,20 +128,118 @@ async def send_chat_message(
         user_id=current_user.id
     )
     
+    # 预先登记运行，取消时退还本次请求占用的限流额度
+    view_rate_limit = get_view_rate_limit(request)
+    run_registry.register(
+        run_id,
+        conversation_id=chat_request.conversation_id,
+        user_id=current_user.id,
+        on_cancel=(lambda: release_rate_limit(*view_rate_limit)) if view_rate_limit else None
+    )
+    
+    stream_kwargs = dict(
+        db=db,
+        conversation_id=chat_request.conversation_id,
+        user_id=current_user.id,
+        content=chat_request.content,
+        is_expert=chat_request.is_expert,
+        enable_thinking=chat_request.enable_thinking,
+        attachments=chat_request.attachments,
+        run_id=run_id
+    )
+    headers = {**STREAM_HEADERS, "X-Run-ID": run_id}
+    # 流正常结束时由生成器注销；流未启动（客户端提前断开）时兜底清理
+    cleanup = BackgroundTask(run_registry.unregister, run_id)
+    
+    if _stream_format(request) == STREAM_FORMAT_NDJSON:
+        return StreamingResponse(
+            sse_with_heartbeat(
+                chat_service.generate_ndjson_stream(**stream_kwargs),
+                make_heartbeat=make_ndjson_heartbeat
+            ),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=headers,
+            background=cleanup
+        )
+    
     return StreamingResponse(
-        sse_with_heartbeat(chat_service.generate_sse_stream(
-            db=db,
-            conversation_id=chat_request.conversation_id,
-            user_id=current_user.id,
-            content=chat_request.content,
-            is_expert=chat_request.is_expert,
-            enable_thinking=chat_request.enable_thinking,
-            attachments=chat_request.attachments
-        )),
+        sse_with_heartbeat(chat_service.generate_sse_stream(**stream_kwargs)),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"
-        }
+        headers=headers,
+        background=cleanup
+    )
+
+
+@router.post("/conversations/{conversation_id}/runs/{run_id}/cancel", status_code=status.HTTP_202_ACCEPTED)
+async def cancel_chat_run(
+    conversation_id: int,
+    run_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """取消进行中的运行
+
+    取消沿 LangGraph 运行传播到挂起的模型/工具调用，已生成的部分回复会被保存，
+    本次运行占用的限流额度会被退还。运行不在当前 worker 时广播给其他 worker。
+    """
+    conv = await conversation_service.get_conversation(
+        db,
+        conversation_id=conversation_id,
+        user_id=current_user.id
+    )
+    if not conv:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    cancelled = await run_registry.request_cancel(run_id, conversation_id, current_user.id)
+    return {
+        "run_id": run_id,
+        "conversation_id": conversation_id,
+        "status": "cancelled" if cancelled else "cancel_requested"
+    }
+
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    db: AsyncSession = Depends(get_db)
+):
+    """WebSocket 聊天通道
+
+    连接时认证一次（?token= 或 Authorization 头），之后在同一连接上
+    多路复用多个对话和并发运行，支持 cancel / interrupt 消息。
+    """
+    token = _get_ws_token(websocket)
+    if not token:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Missing token")
+        return
+    
+    try:
+        user = await resolve_user_from_token(token, db)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    if not user.is_active:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Inactive user")
+        return
+    
+    # 认证完成后释放连接，每次运行按需获取独立会话
+    await db.close()
+    
+    payload = decode_access_token(token) or {}
+    user_id = user.id
+    
+    await websocket.accept()
+    logger.info(f"[WS] Connection accepted, user_id={user_id}")
+    
+    session = ChatWebSocketSession(
+        websocket,
+        user,
+        sse_emitter=chat_service.sse_emitter,
+        token_expires_at=payload.get("exp"),
+        rate_limiter=lambda: hit_rate_limit(CHAT_RATE_LIMIT, "chat_ws", f"user:{user_id}"),
+        rate_limit_release=lambda: release_rate_limit(parse(CHAT_RATE_LIMIT), ("chat_ws", f"user:{user_id}")),
     )
+    await session.serve()
@@ -1,7 +1,8 @@
 """监控 API 路由"""
 
-from fastapi import APIRouter, Depends
-from app.api.dependencies import get_current_active_user
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from app.api.dependencies import get_current_active_user, get_current_superuser
 from app.models.user import User
 from app.cache import get_cache_stats
 
@@ -14,6 +15,129 @@ async def get_cache_statistics(current_user: User = Depends(get_current_active_u
     return await get_cache_stats()
 
 
+@router.get("/agents/cache")
+async def get_agent_cache_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取 Agent 图缓存统计信息（需要认证）"""
+    from app.agents.agent_factory import AgentFactory
+    
+    return AgentFactory.get_cache_stats()
+
+
+@router.get("/agents/tool-selector")
+async def get_tool_selector_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取工具子集预选缓存统计信息（需要认证）"""
+    from app.agents.tool_selector import tool_selector
+    
+    return tool_selector.get_stats()
+
+
+@router.get("/agents/skills")
+async def get_skills_index_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取技能索引状态（需要认证）"""
+    from app.agents.agent_factory import AgentFactory
+    
+    return AgentFactory.get_skills_index().get_stats()
+
+
+@router.get("/models/cache")
+async def get_model_cache_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取模型实例缓存与 DashScope 连接池状态（需要认证）"""
+    from app.llm.model_factory import ModelFactory
+    
+    return ModelFactory.get_cache_stats()
+
+
+@router.get("/models/latency")
+async def get_model_latency_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取各模型滚动首 token 耗时百分位与对冲胜出次数（需要认证）"""
+    from app.llm.hedging import ttft_tracker
+    
+    return ttft_tracker.get_stats()
+
+
+@router.get("/models/telemetry")
+async def get_model_telemetry_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取各模型、工具模型与 Agent 工具的调用耗时、首 token、token 数直方图及错误/重试次数（需要认证）"""
+    from app.llm.model_factory import ModelFactory
+    
+    return ModelFactory.get_telemetry_stats()
+
+
+@router.get("/tools/cache")
+async def get_tool_cache_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取工具结果缓存命中统计（需要认证）"""
+    from app.cache.tool_cache import tool_result_cache
+    
+    return tool_result_cache.get_stats()
+
+
+@router.delete("/tools/cache")
+async def clear_tool_cache(current_user: User = Depends(get_current_superuser)):
+    """清空工具结果缓存（需要管理员权限）"""
+    from app.cache.tool_cache import tool_result_cache
+    
+    return {"deleted": await tool_result_cache.clear()}
+
+
+@router.get("/upstreams")
+async def get_upstream_limiter_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取各上游限流器的并发窗口、排队深度与限流次数（需要认证）"""
+    from app.llm.upstream_limiter import upstream_limiters
+    
+    return upstream_limiters.get_stats()
+
+
+@router.get("/profiles")
+async def list_request_profiles(current_user: User = Depends(get_current_superuser)):
+    """列出请求剖析结果摘要，最新的在前（需要管理员权限）"""
+    from app.core.profiling import request_profiler
+    
+    return request_profiler.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+async def get_request_profile(
+    profile_id: str,
+    format: str = Query("folded", pattern="^(folded|json)$"),
+    current_user: User = Depends(get_current_superuser),
+):
+    """下载请求剖析结果：folded 为火焰图输入（collapsed stack），json 为摘要与时间分解（需要管理员权限）"""
+    from app.core.profiling import request_profiler
+    
+    path = request_profiler.get_profile_path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "application/json" if format == "json" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=path.name)
+
+
+@router.get("/db/pools")
+async def get_db_pool_statistics(current_user: User = Depends(get_current_active_user)):
+    """获取 checkpointer / 长期记忆存储连接池指标（需要认证）"""
+    from app.agents.agent_factory import AgentFactory
+    
+    return AgentFactory.get_pool_stats()
+
+
+@router.get("/checkpoints/compaction")
+async def get_checkpoint_compaction_report(current_user: User = Depends(get_current_superuser)):
+    """获取最近一次 checkpoint 压缩报告（需要管理员权限）"""
+    from app.agents.checkpoint_maintenance import checkpoint_compactor
+    
+    return {
+        "keep_latest": checkpoint_compactor.keep_latest,
+        "last_report": checkpoint_compactor.last_report,
+    }
+
+
+@router.post("/checkpoints/compaction")
+async def run_checkpoint_compaction(current_user: User = Depends(get_current_superuser)):
+    """立即执行一次 checkpoint 压缩，返回回收统计（需要管理员权限）"""
+    from app.agents.checkpoint_maintenance import checkpoint_compactor
+    
+    return await checkpoint_compactor.run_once()
+
+
 @router.get("/health/detailed")
 async def detailed_health_check():
     """详细健康检查"""
@@ -3,6 +3,7 @@
 from .redis import redis_client, cache_aside, invalidate_cache_by_pattern, cached
 from .warmup import cache_warmup, CacheWarmup
 from .metrics import cache_metrics, get_cache_stats
+from .tool_cache import tool_result_cache, ToolResultCache
 
 __all__ = [
     "redis_client",
@@ -13,4 +14,6 @@ __all__ = [
     "CacheWarmup",
     "cache_metrics",
     "get_cache_stats",
+    "tool_result_cache",
+    "ToolResultCache",
 ]
@@ -4,11 +4,16 @@ import logging
 from typing import Dict, Any
 from datetime import datetime
 
+from app.core.metrics import record_cache
+
 logger = logging.getLogger(__name__)
 
 
 class CacheMetrics:
-    """缓存指标收集器"""
+    """缓存指标收集器
+
+    进程内计数供 /monitoring/cache/stats 使用，同时计入 Prometheus 计数器（见 app.core.metrics）
+    """
     
     def __init__(self):
         self._hits = 0
@@ -19,15 +24,19 @@ class CacheMetrics:
     
     def record_hit(self):
         self._hits += 1
+        record_cache("redis", "hit")
     
     def record_miss(self):
         self._misses += 1
+        record_cache("redis", "miss")
     
     def record_null_hit(self):
         self._null_hits += 1
+        record_cache("redis", "null_hit")
     
     def record_error(self):
         self._errors += 1
+        record_cache("redis", "error")
     
     def get_stats(self) -> Dict[str, Any]:
         total = self._hits + self._misses + self._null_hits
@@ -2,6 +2,7 @@ import asyncio
 import json
 import logging
 import random
+import time
 from typing import Optional, Any, Callable
 from functools import wraps
 import redis.asyncio as redis
@@ -9,12 +10,25 @@ import redis.asyncio as redis
 from app.config import settings
 from app.utils.serializers import is_sqlalchemy_model, model_to_dict
 from app.cache.metrics import cache_metrics
+from app.core.metrics import observe_redis_command
 
 logger = logging.getLogger(__name__)
 
 NULL_VALUE_MARKER = "__NULL__"
 
 
+class InstrumentedRedis(redis.Redis):
+    """记录每条命令耗时的 Redis 客户端（Pub/Sub 的阻塞读取不经过 execute_command，不计入）"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).upper() if args else "UNKNOWN"
+            observe_redis_command(command, time.perf_counter() - started)
+
+
 class RedisClient:
     def __init__(self):
         self.redis_url = settings.redis_url
@@ -22,7 +36,7 @@ class RedisClient:
 
     async def connect(self):
         if self._client is None:
-            self._client = redis.from_url(self.redis_url, decode_responses=True)
+            self._client = InstrumentedRedis.from_url(self.redis_url, decode_responses=True)
 
     async def disconnect(self):
         if self._client:
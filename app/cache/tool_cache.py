@@ -0,0 +1,215 @@
+"""工具结果缓存 - 确定性工具的模型输出按输入缓存
+
+translate_text、code_assist、ocr_document、understand_image 对相同输入的结果可复用。
+缓存键由（工具名, 模型名, 归一化参数, 输入文件内容哈希）计算，结果存入 Redis：
+
+- 每条结果带 TTL，超过 tool_cache_max_entry_bytes 的结果不缓存
+- 索引有序集合记录写入时间，条目数超过 tool_cache_max_entries 时淘汰最早的条目
+- 同一进程内相同键的并发调用只请求一次模型
+- Redis 不可用时直接调用模型，不影响工具执行
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+from app.config import settings
+from app.cache.redis import redis_client
+from app.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "tool_result"
+INDEX_KEY = f"{KEY_PREFIX}:index"
+
+# 统计字段 -> Prometheus dragonai_cache_requests_total 的 result 标签
+_CACHE_RESULTS = {"hits": "hit", "misses": "miss", "errors": "error"}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def file_fingerprint(source: str) -> str:
+    """输入文件的指纹：本地文件取内容哈希，URL 原样使用，data URI 取字符串哈希
+
+    同一图片重新上传到不同路径时指纹相同；同一路径的文件内容变化后指纹随之变化。
+    """
+    if source.startswith(("http://", "https://")):
+        return source
+    if source.startswith("data:"):
+        return hashlib.sha256(source.encode()).hexdigest()
+
+    from app.storage import file_storage
+
+    path = file_storage.get_file_path(source) or Path(source)
+    try:
+        if path.is_file():
+            return await asyncio.to_thread(_hash_file, path)
+    except OSError as e:
+        logger.debug(f"[TOOL CACHE] Cannot hash {source}: {e}")
+    return source
+
+
+class ToolResultCache:
+    """工具结果缓存"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def _record(self, tool: str, field: str, amount: float = 1) -> None:
+        stats = self._stats.setdefault(
+            tool, {"hits": 0, "misses": 0, "errors": 0, "skipped": 0, "saved_seconds": 0.0}
+        )
+        stats[field] += amount
+        if field in _CACHE_RESULTS:
+            record_cache(f"tool:{tool}", _CACHE_RESULTS[field])
+
+    async def make_key(
+        self,
+        tool: str,
+        model_name: str,
+        args: Dict[str, Any],
+        files: Sequence[str] = (),
+    ) -> str:
+        fingerprints = [await file_fingerprint(f) for f in files]
+        raw = json.dumps(
+            {"model": model_name, "args": _normalize(args), "files": fingerprints},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return f"{KEY_PREFIX}:{tool}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await redis_client.client.get(key)
+        return json.loads(raw) if raw else None
+
+    async def _set(self, key: str, value: Any, elapsed: float) -> bool:
+        data = json.dumps({"value": value, "elapsed": elapsed}, ensure_ascii=False)
+        if len(data.encode()) > settings.tool_cache_max_entry_bytes:
+            return False
+
+        client = redis_client.client
+        await client.set(key, data, ex=settings.tool_cache_ttl)
+        await client.zadd(INDEX_KEY, {key: time.time()})
+        overflow = await client.zcard(INDEX_KEY) - settings.tool_cache_max_entries
+        if overflow > 0:
+            evicted = [member for member, _ in await client.zpopmin(INDEX_KEY, overflow)]
+            if evicted:
+                await client.delete(*evicted)
+                logger.debug(f"[TOOL CACHE] Evicted {len(evicted)} oldest entries")
+        return True
+
+    async def get_or_compute(
+        self,
+        tool: str,
+        model_name: str,
+        args: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        files: Sequence[str] = (),
+    ) -> Any:
+        """返回缓存的结果，未命中时调用 compute 并写入缓存
+
+        compute 的返回值需要可 JSON 序列化；compute 抛出的异常原样抛出，不缓存。
+        """
+        if not settings.tool_cache_enabled:
+            return await compute()
+
+        try:
+            key = await self.make_key(tool, model_name, args, files)
+            cached = await self._get(key)
+        except Exception as e:
+            self._record(tool, "errors")
+            logger.debug(f"[TOOL CACHE] Lookup failed for {tool}: {e}")
+            return await compute()
+
+        if cached is not None:
+            self._record(tool, "hits")
+            self._record(tool, "saved_seconds", cached.get("elapsed", 0.0))
+            logger.debug(f"[TOOL CACHE] Hit: {key}")
+            return cached["value"]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._record(tool, "hits")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                return await compute()
+
+        self._record(tool, "misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            start = time.perf_counter()
+            value = await compute()
+            elapsed = time.perf_counter() - start
+            future.set_result(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有并发等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        try:
+            if not await self._set(key, value, elapsed):
+                self._record(tool, "skipped")
+        except Exception as e:
+            self._record(tool, "errors")
+            logger.debug(f"[TOOL CACHE] Store failed for {tool}: {e}")
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        tools = {}
+        for tool, stats in self._stats.items():
+            total = stats["hits"] + stats["misses"]
+            tools[tool] = {
+                **stats,
+                "saved_seconds": round(stats["saved_seconds"], 3),
+                "hit_rate": round(stats["hits"] / total * 100, 2) if total > 0 else 0,
+            }
+        return {
+            "enabled": settings.tool_cache_enabled,
+            "ttl": settings.tool_cache_ttl,
+            "max_entries": settings.tool_cache_max_entries,
+            "inflight": len(self._inflight),
+            "tools": tools,
+        }
+
+    async def clear(self) -> int:
+        """清空所有工具结果缓存，返回删除的条目数"""
+        client = redis_client.client
+        keys = await client.zrange(INDEX_KEY, 0, -1)
+        if keys:
+            await client.delete(*keys)
+        await client.delete(INDEX_KEY)
+        return len(keys)
+
+
+tool_result_cache = ToolResultCache()
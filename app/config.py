@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -29,6 +30,9 @@ class Settings(BaseSettings):
 
     log_level: str = "INFO"
     log_dir: str = "./logs"
+    # 日志经队列由后台线程写入；按日志器对逐 token 的 DEBUG 日志采样（保留比例）
+    log_queue_enabled: bool = True
+    log_debug_sample_rates: Dict[str, float] = {"app.services.stream.sse_emitter": 0.05}
 
     model_general_fast: str = "deepseek-r1-0528"
     model_general_expert: str = "deepseek-r1"
@@ -54,8 +58,113 @@ class Settings(BaseSettings):
 
     model_embedding: str = "text-embedding-v4"
 
+    model_warmup_connections: int = 2
+    dashscope_pool_limit: int = 100
+    dashscope_pool_limit_per_host: int = 32
+    dashscope_pool_keepalive: float = 60.0
+    dashscope_pool_dns_ttl: int = 300
+
+    # 工具结果缓存：确定性工具（翻译、编程、OCR、图片理解）的模型输出按输入缓存到 Redis
+    tool_cache_enabled: bool = True
+    tool_cache_ttl: int = 7 * 24 * 3600
+    tool_cache_max_entries: int = 10000
+    tool_cache_max_entry_bytes: int = 256 * 1024
+
+    # 上游限流：每个上游（模型名 / tavily）的并发窗口上限与 QPS，未配置的上游使用 default
+    upstream_limiter_enabled: bool = True
+    upstream_limiter_shared: bool = True
+    upstream_limits: Dict[str, Dict[str, float]] = {
+        "default": {"max_concurrency": 16, "qps": 10},
+        "tavily": {"max_concurrency": 4, "qps": 5},
+    }
+    upstream_min_concurrency: int = 1
+    upstream_queue_timeout: float = 30.0
+    upstream_default_retry_after: float = 2.0
+
+    # 对冲请求：专家模型在截止时间内没有首个 token 时并发请求快速模型，取先返回者
+    # 截止时间样本足够时取专家模型滚动 TTFT 的 P90，限制在 [min, max] 内
+    # 默认关闭：开启后部分专家请求会由快速模型回答（回复中标记实际模型）
+    model_hedge_enabled: bool = False
+    model_hedge_deadline: float = 3.0
+    model_hedge_min_deadline: float = 1.0
+    model_hedge_max_deadline: float = 10.0
+    model_hedge_min_samples: int = 20
+
+    # Prometheus 指标：/metrics 输出；多 worker 部署需设置环境变量 PROMETHEUS_MULTIPROC_DIR
+    metrics_enabled: bool = True
+    metrics_sample_interval: float = 15.0
+
+    # 请求剖析：按比例抽样或携带 "{profiling_header}: {profiling_token}" 的请求，结果写入 {log_dir}/profiles
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0
+    profiling_header: str = "X-Profile"
+    profiling_token: str = ""
+    profiling_interval: float = 0.005
+    profiling_max_concurrent: int = 2
+    profiling_max_files: int = 200
+    # 单次剖析的最长时长（秒）：流式响应体未被迭代（客户端在发送前断开）时也能结束剖析并释放名额
+    profiling_max_duration: float = 300.0
+
+    # 请求阶段耗时：始终写 [TIMING] 结构化日志；Server-Timing 响应头与聊天流 timing 事件含内部
+    # span 名与上游耗时，默认只对开发环境和携带 "{profiling_header}: {profiling_token}" 的调试请求输出
+    request_timing_enabled: bool = True
+    request_timing_expose: bool = False
+
     agent_tool_call_limit: int = 10
     agent_timeout: int = 120
+    agent_cache_max_size: int = 32
+
+    # 工具子集预选：按关键词与描述相似度为每轮选择工具组；未命中时除明确的闲聊
+    # （问候/致谢，或不含疑问且不超过 tool_selector_small_talk_chars 字）外绑定全部工具；
+    # 选中超过 tool_selector_max_groups 个工具组时也绑定全部工具，限制 Agent 图的组合数
+    tool_selector_enabled: bool = True
+    tool_selector_min_score: float = 0.06
+    tool_selector_small_talk_chars: int = 6
+    tool_selector_cache_size: int = 1024
+    tool_selector_max_groups: int = 3
+
+    # 技能索引：描述匹配阈值，技能文件变化时热更新
+    skills_match_min_score: float = 0.15
+    skills_hot_reload: bool = True
+
+    # 快速路径：只由问候/致谢组成、未选中业务工具的短消息直接流式调用快速模型，不经过 Agent 图
+    fast_path_enabled: bool = True
+    fast_path_max_chars: int = 40
+    fast_path_history_messages: int = 6
+
+    checkpointer_pool_min_size: int = 2
+    checkpointer_pool_max_size: int = 10
+    checkpointer_pool_timeout: float = 10.0
+    checkpointer_pool_max_idle: float = 600.0
+    # psycopg 语句预编译阈值：0 表示首次执行即预编译，None 表示禁用（经 pgbouncer 事务池时使用）
+    checkpointer_prepare_threshold: Optional[int] = 0
+
+    # 每个线程保留的 checkpoint 数量；压缩间隔（秒）为 0 时不启动后台任务
+    checkpoint_retention_keep: int = 10
+    checkpoint_compaction_interval: int = 3600
+    checkpoint_compaction_batch_size: int = 200
+
+    # checkpoint 序列化：超过阈值的数据 zstd 压缩；超过 blob 阈值的消息正文按内容哈希去重存储
+    checkpoint_compression_min_bytes: int = 1024
+    checkpoint_compression_level: int = 3
+    checkpoint_blob_min_bytes: int = 4096
+    checkpoint_blob_cache_mb: int = 64
+
+    store_pool_min_size: int = 1
+    store_pool_max_size: int = 5
+
+    # 上下文编辑：当前轮之外的工具输出按预算截断，早于 keep_turns 轮的清理；-1 禁用
+    context_edit_keep_turns: int = 2
+    context_edit_default_budget: int = 2000
+    context_edit_tool_budgets: Dict[str, int] = {
+        "read_pdf": 1500,
+        "read_word": 1500,
+        "web_search": 1000,
+        "search_knowledge_base": 1500,
+    }
+    context_edit_exclude_tools: List[str] = []
+
+    ws_max_concurrent_runs: int = 4
 
     rate_limit_storage: str = "redis"
     rate_limit_default: str = "100/minute"
@@ -6,10 +6,16 @@
 - 处理器配置
 - 第三方库日志控制
 - 环境感知配置
+- 异步写入：根日志器只挂 QueueHandler，格式化与文件 I/O 在 QueueListener 后台线程完成，
+  不占用事件循环；热点 DEBUG 日志可按日志器采样
 """
 
 import os
+import copy
 import json
+import queue
+import random
+import atexit
 import logging
 import logging.handlers
 from datetime import datetime
@@ -90,11 +96,89 @@ class ColoredConsoleFormatter(logging.Formatter):
     RESET = "\033[0m"
     
     def format(self, record: logging.LogRecord) -> str:
+        # 复制记录，避免颜色码写入同一记录后出现在文件日志中
+        record = copy.copy(record)
         color = self.COLORS.get(record.levelname, "")
         record.levelname = f"{color}{record.levelname}{self.RESET}"
         return super().format(record)
 
 
+class LogSampler(logging.Filter):
+    """按日志器名称（前缀匹配）对 DEBUG 日志采样，INFO 及以上级别始终保留
+
+    rates 为保留比例，如 {"app.services.stream.sse_emitter": 0.05} 表示每个 token 一条的调试日志只保留约 5%。
+    """
+    
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self._resolved: Dict[str, float] = {}
+    
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """进程内队列处理器：调用线程只解析消息参数，格式化交给后台线程
+    
+    进程内队列不需要序列化，保留 exc_info 由后台线程的格式化器生成堆栈。
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[AsyncQueueHandler] = None
+
+
+def stop_logging(reattach: bool = True) -> None:
+    """停止后台写日志线程并写完队列中剩余的日志
+
+    reattach 为真时把实际的处理器直接挂回根日志器（同步写），
+    之后（uvicorn 关闭、atexit）产生的日志不会进入无人消费的队列而丢失。
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    root_logger = logging.getLogger()
+    if _queue_handler is not None:
+        root_logger.removeHandler(_queue_handler)
+    for handler in _listener.handlers:
+        if reattach:
+            for log_filter in (_queue_handler.filters if _queue_handler is not None else []):
+                handler.addFilter(log_filter)
+            root_logger.addHandler(handler)
+        else:
+            handler.close()
+    _listener = None
+    _queue_handler = None
+
+
+atexit.register(stop_logging)
+
+
 class LoggerAdapter(logging.LoggerAdapter):
     """日志适配器，支持添加额外上下文"""
     
@@ -122,6 +206,8 @@ def setup_logging(
     backup_count: int = 5,
     when: str = "midnight",
     interval: int = 1,
+    use_queue: bool = True,
+    sample_rates: Optional[Dict[str, float]] = None,
 ) -> None:
     """设置日志配置
     
@@ -136,7 +222,12 @@ def setup_logging(
         backup_count: 保留的日志文件数量
         when: 时间轮转时机 (midnight, H, D, W0-W6)
         interval: 轮转间隔
+        use_queue: 是否经 QueueHandler / QueueListener 在后台线程写日志
+        sample_rates: 按日志器的 DEBUG 日志保留比例
     """
+    global _listener, _queue_handler
+    stop_logging(reattach=False)
+    
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
     
@@ -201,8 +292,18 @@ def setup_logging(
         structured_handler.setFormatter(StructuredFormatter())
         handlers.append(structured_handler)
     
-    for handler in handlers:
-        root_logger.addHandler(handler)
+    sampler = LogSampler(sample_rates)
+    if use_queue:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = _queue_handler = AsyncQueueHandler(log_queue)
+        queue_handler.addFilter(sampler)
+        root_logger.addHandler(queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            handler.addFilter(sampler)
+            root_logger.addHandler(handler)
     
     configure_third_party_loggers(app_env)
 
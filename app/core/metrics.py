@@ -0,0 +1,228 @@
+"""Prometheus 指标
+
+所有指标在此定义，由各模块调用 observe_* / record_* 辅助函数更新，/metrics 以 Prometheus 文本格式输出。
+
+多 worker（uvicorn --workers N）部署时需设置环境变量 PROMETHEUS_MULTIPROC_DIR（启动前清空该目录）：
+每个 worker 把指标写入该目录下的 mmap 文件，任意 worker 处理 /metrics 时汇总全部 worker 的数据。
+Gauge 使用 livesum 模式，只汇总存活 worker 的值；worker 退出时调用 mark_process_dead 清理。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LONG_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 300.0)
+REDIS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "dragonai_http_request_duration_seconds",
+    "HTTP 请求耗时（含流式响应体发送）",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "dragonai_http_requests_in_progress",
+    "正在处理的 HTTP 请求数",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+STREAM_DURATION = Histogram(
+    "dragonai_stream_duration_seconds",
+    "聊天流（SSE / NDJSON / WebSocket）持续时间",
+    ["transport", "outcome"],
+    buckets=LONG_BUCKETS,
+)
+STREAM_EVENTS = Counter(
+    "dragonai_stream_events_total",
+    "聊天流发送的事件数",
+    ["transport", "type"],
+)
+AGENT_RUN_DURATION = Histogram(
+    "dragonai_agent_run_duration_seconds",
+    "一次消息处理（完整 Agent 或快速路径）的耗时",
+    ["path", "outcome"],
+    buckets=LONG_BUCKETS,
+)
+UPSTREAM_CALL_DURATION = Histogram(
+    "dragonai_upstream_call_duration_seconds",
+    "模型、工具模型与 Agent 工具的调用耗时",
+    ["kind", "name"],
+    buckets=LONG_BUCKETS,
+)
+UPSTREAM_TTFT = Histogram(
+    "dragonai_model_ttft_seconds",
+    "聊天模型首 token 耗时",
+    ["name"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_CALL_ERRORS = Counter(
+    "dragonai_upstream_call_errors_total",
+    "模型、工具模型与 Agent 工具的调用错误数",
+    ["kind", "name"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "dragonai_db_pool_connections",
+    "数据库连接池状态（SQLAlchemy 主连接池、checkpointer / 存储 psycopg 连接池）",
+    ["pool", "state"],
+    multiprocess_mode="livesum",
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "dragonai_redis_command_duration_seconds",
+    "Redis 命令耗时",
+    ["command"],
+    buckets=REDIS_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "dragonai_cache_requests_total",
+    "缓存查询次数，命中率 = hit / (hit + miss)",
+    ["cache", "result"],
+)
+
+
+def is_multiprocess() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+# -------------------------------------------------------------- 记录
+
+
+def observe_redis_command(command: str, seconds: float) -> None:
+    REDIS_COMMAND_DURATION.labels(command).observe(seconds)
+
+
+def record_cache(cache: str, result: str) -> None:
+    CACHE_REQUESTS.labels(cache, result).inc()
+
+
+def observe_upstream_call(kind: str, name: str, seconds: float, ttft: Optional[float], error: bool) -> None:
+    UPSTREAM_CALL_DURATION.labels(kind, name).observe(seconds)
+    if ttft is not None:
+        UPSTREAM_TTFT.labels(name).observe(ttft)
+    if error:
+        UPSTREAM_CALL_ERRORS.labels(kind, name).inc()
+
+
+def observe_agent_run(path: str, outcome: str, seconds: float) -> None:
+    AGENT_RUN_DURATION.labels(path, outcome).observe(seconds)
+
+
+async def track_stream(events, transport: str):
+    """包装事件流：按类型计数事件，结束时按结果记录流持续时间
+
+    结果：done（正常结束）、cancelled（服务端取消）、error（流中出现错误事件或异常）、
+    disconnected（客户端断开，生成器未结束即被关闭）。
+    """
+    started = time.perf_counter()
+    outcome = "disconnected"
+    errored = False
+    try:
+        async for event in events:
+            event_type = event.get("type", "unknown")
+            STREAM_EVENTS.labels(transport, event_type).inc()
+            if event_type == "error":
+                errored = True
+            elif event_type == "cancelled":
+                outcome = "cancelled"
+            elif event_type == "done" and outcome != "cancelled":
+                outcome = "error" if errored else "done"
+            yield event
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        STREAM_DURATION.labels(transport, outcome).observe(time.perf_counter() - started)
+
+
+# -------------------------------------------------------------- 连接池采样
+
+
+def _pool_states() -> Tuple[Tuple[str, str, float], ...]:
+    from app.agents.agent_factory import AgentFactory
+    from app.core.database import engine
+
+    states = []
+    pool = engine.pool
+    for state, getter in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+        method = getattr(pool, getter, None)
+        if callable(method):
+            states.append(("sqlalchemy", state, float(method())))
+    for name, stats in AgentFactory.get_pool_stats().items():
+        if not stats:
+            continue
+        for state in ("pool_size", "pool_available", "requests_waiting"):
+            states.append((name, state, float(stats.get(state, 0))))
+    return tuple(states)
+
+
+def sample_pools() -> None:
+    """把当前 worker 的连接池状态写入 Gauge"""
+    try:
+        for pool, state, value in _pool_states():
+            DB_POOL_CONNECTIONS.labels(pool, state).set(value)
+    except Exception as e:
+        logger.debug(f"[METRICS] Failed to sample pools: {e}")
+
+
+class MetricsSampler:
+    """后台定时采样连接池状态（每个 worker 各自采样，多 worker 时由 livesum 汇总）"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, interval: Optional[float] = None) -> None:
+        interval = settings.metrics_sample_interval if interval is None else interval
+        if not settings.metrics_enabled or interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+
+        async def loop() -> None:
+            while True:
+                sample_pools()
+                await asyncio.sleep(interval)
+
+        self._task = asyncio.create_task(loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if is_multiprocess():
+            multiprocess.mark_process_dead(os.getpid())
+
+
+metrics_sampler = MetricsSampler()
+
+
+# -------------------------------------------------------------- 输出
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成 Prometheus 文本格式；多 worker 时汇总 PROMETHEUS_MULTIPROC_DIR 下所有 worker 的数据"""
+    sample_pools()
+    if is_multiprocess():
+        registry: Any = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,279 @@
+"""请求级采样剖析
+
+RequestTracingMiddleware 按 profiling_sample_rate 随机抽样请求，或对携带
+"{profiling_header}: {profiling_token}" 请求头的请求开启剖析：
+
+- 栈采样：后台线程按 profiling_interval 采样事件循环线程的调用栈，输出 collapsed stack 格式
+  （每行 "帧1;帧2;...;帧N 次数"），可直接用 flamegraph.pl / speedscope / inferno 生成火焰图。
+  事件循环上并发的其他请求也会被采到，高并发时应结合 loop_lag 与时间分解一起看。
+- 流式响应（SSE / NDJSON）额外记录任务级时间分解：首个 chunk 耗时、等待上游产出的时间、
+  写出（客户端背压）时间、chunk 数，以及剖析期间的事件循环延迟。
+
+结果写入 {log_dir}/profiles/{profile_id}.folded 与 {profile_id}.json，超过 profiling_max_files 时删除最早的文件。
+剖析最长持续 profiling_max_duration 秒，到时未结束的剖析会被强制结束（如响应体从未开始迭代）。
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def profiles_dir() -> Path:
+    return Path(settings.log_dir) / "profiles"
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+    """把调用栈折叠为 "根;...;叶" 形式"""
+    names: List[str] = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """后台线程定时采样指定线程的调用栈"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """通知采样线程停止，不等待（可在事件循环线程中调用）"""
+        self._stop.set()
+
+    def join(self) -> None:
+        """等待采样线程退出，之后 samples 不再变化；会阻塞，不要在事件循环线程中调用"""
+        self._thread.join(timeout=1.0)
+
+
+class Profile:
+    """一次请求的剖析会话"""
+
+    def __init__(self, request_id: str, method: str, path: str, reason: str):
+        stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+        safe_request_id = re.sub(r"[^A-Za-z0-9_-]", "", request_id)[:64]
+        self.profile_id = f"{stamp}_{safe_request_id}"
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started = time.perf_counter()
+        self.status: Optional[int] = None
+        self.error: Optional[str] = None
+        self.stream: Optional[Dict[str, Any]] = None
+        self._loop_lags: List[float] = []
+        self._lag_task: Optional[asyncio.Task] = None
+        self._expiry: Optional[asyncio.TimerHandle] = None
+        self._finished = False
+        self._sampler = StackSampler(threading.get_ident(), settings.profiling_interval)
+
+    def start(self) -> None:
+        self._sampler.start()
+        self._lag_task = asyncio.create_task(self._watch_loop_lag())
+        if settings.profiling_max_duration > 0:
+            # wrap_stream 只在响应体生成器的 finally 中结束剖析，生成器从未启动时 finally 不会执行
+            self._expiry = asyncio.get_running_loop().call_later(settings.profiling_max_duration, self._expire)
+
+    def _expire(self) -> None:
+        if self._finished:
+            return
+        logger.warning(f"[PROFILE] {self.method} {self.path} exceeded max duration, finishing: id={self.profile_id}")
+        self.error = self.error or "MaxDurationExceeded"
+        self.finish()
+
+    async def _watch_loop_lag(self) -> None:
+        interval = 0.01
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self._loop_lags.append(max(0.0, loop.time() - expected))
+
+    def wrap_stream(self, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """包装流式响应体，记录任务级时间分解，响应体结束时结束剖析"""
+        stream = self.stream = {"first_chunk": None, "producer_wait": 0.0, "send": 0.0, "chunks": 0, "bytes": 0}
+
+        async def iterate() -> AsyncIterator[bytes]:
+            iterator = body.__aiter__()
+            try:
+                while True:
+                    waited = time.perf_counter()
+                    try:
+                        chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    now = time.perf_counter()
+                    stream["producer_wait"] += now - waited
+                    if stream["first_chunk"] is None:
+                        stream["first_chunk"] = now - self.started
+                    stream["chunks"] += 1
+                    stream["bytes"] += len(chunk)
+                    yield chunk
+                    stream["send"] += time.perf_counter() - now
+            except BaseException as e:
+                self.error = type(e).__name__
+                raise
+            finally:
+                self.finish()
+
+        return iterate()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if error is not None:
+            self.error = type(error).__name__
+        if self._expiry is not None:
+            self._expiry.cancel()
+        self._sampler.stop()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        duration = time.perf_counter() - self.started
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write, duration)
+        except RuntimeError:
+            # 响应体生成器在事件循环外被回收
+            self._write(duration)
+
+    def _summary(self, duration: float) -> Dict[str, Any]:
+        lags = sorted(self._loop_lags)
+        summary: Dict[str, Any] = {
+            "profile_id": self.profile_id,
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "reason": self.reason,
+            "status": self.status,
+            "error": self.error,
+            "created_at": datetime.now().isoformat(),
+            "duration_seconds": round(duration, 4),
+            "interval_seconds": self._sampler.interval,
+            "samples": sum(self._sampler.samples.values()),
+            "loop_lag": {
+                "max": round(lags[-1], 4) if lags else None,
+                "p99": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 4) if lags else None,
+            },
+        }
+        if self.stream is not None:
+            summary["stream"] = {
+                key: round(value, 4) if isinstance(value, float) else value for key, value in self.stream.items()
+            }
+        return summary
+
+    def _write(self, duration: float) -> None:
+        try:
+            self._sampler.join()
+            directory = profiles_dir()
+            directory.mkdir(parents=True, exist_ok=True)
+            folded = "\n".join(f"{stack} {count}" for stack, count in self._sampler.samples.most_common())
+            (directory / f"{self.profile_id}.folded").write_text(folded + "\n", encoding="utf-8")
+            summary = self._summary(duration)
+            (directory / f"{self.profile_id}.json").write_text(
+                json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            logger.info(
+                f"[PROFILE] {self.method} {self.path} profiled: id={self.profile_id}, "
+                f"duration={duration:.3f}s, samples={summary['samples']}"
+            )
+            _prune(directory, settings.profiling_max_files)
+        except Exception as e:
+            logger.warning(f"[PROFILE] Failed to write profile {self.profile_id}: {e}")
+        finally:
+            request_profiler.release()
+
+
+def _prune(directory: Path, max_files: int) -> None:
+    summaries = sorted(directory.glob("*.json"))
+    for summary in summaries[: max(0, len(summaries) - max_files)]:
+        summary.unlink(missing_ok=True)
+        summary.with_suffix(".folded").unlink(missing_ok=True)
+
+
+class RequestProfiler:
+    """决定是否剖析请求，并限制同时进行的剖析数"""
+
+    def __init__(self):
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _reason(self, headers) -> Optional[str]:
+        token = settings.profiling_token
+        provided = headers.get(settings.profiling_header) or ""
+        if token and hmac.compare_digest(provided.encode(), token.encode()):
+            return "header"
+        if settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate:
+            return "sampled"
+        return None
+
+    def maybe_start(self, request_id: str, method: str, path: str, headers) -> Optional[Profile]:
+        if not settings.profiling_enabled:
+            return None
+        reason = self._reason(headers)
+        if reason is None:
+            return None
+        with self._lock:
+            if self._active >= settings.profiling_max_concurrent:
+                return None
+            self._active += 1
+        profile = Profile(request_id, method, path, reason)
+        profile.start()
+        return profile
+
+    def release(self) -> None:
+        with self._lock:
+            self._active = max(0, self._active - 1)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for summary in sorted(profiles_dir().glob("*.json"), reverse=True):
+            try:
+                profiles.append(json.loads(summary.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def get_profile_path(self, profile_id: str, fmt: str = "folded") -> Optional[Path]:
+        if fmt not in ("folded", "json") or not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = profiles_dir() / f"{profile_id}.{fmt}"
+        return path if path.is_file() else None
+
+
+request_profiler = RequestProfiler()
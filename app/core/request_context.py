@@ -0,0 +1,13 @@
+"""请求上下文 - 当前请求的追踪 ID
+
+由 RequestTracingMiddleware 设置，供日志、遥测等各层读取，不依赖 API 层。
+"""
+
+from contextvars import ContextVar
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="")
+
+
+def get_request_id() -> str:
+    """获取当前请求的追踪 ID"""
+    return request_id_var.get()
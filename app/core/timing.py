@@ -0,0 +1,129 @@
+"""请求阶段耗时（span）
+
+RequestTracingMiddleware 为每个请求创建 RequestTiming 并放入上下文，业务代码用 span() / traced()
+记录阶段耗时（会话查询、消息写入、Agent 运行、工具与模型调用、回复落库等）。结果以三种方式输出：
+
+- 结构化日志：响应体发送完毕后一条 [TIMING] 日志，extra_data 为完整的 span 列表
+- 非流式响应：Server-Timing 响应头（同名 span 合并，desc 为次数）
+- 聊天流：done 之前的 timing 事件
+
+响应头与 timing 事件包含内部 span 名（model.<名称>、tool.<名称>）和上游耗时，只对可以查看的请求
+输出（expose 为真）：request_timing_expose 开启、非生产环境，或携带剖析令牌的调试请求。
+
+不在请求上下文中（后台任务、WebSocket、单元测试）时 span() 为空操作。
+"""
+
+import functools
+import hmac
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from app.config import settings
+
+MAX_SPANS = 256
+
+_SERVER_TIMING_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+class RequestTiming:
+    """一次请求内记录的 span；expose 为真时才通过响应头与 timing 事件返回给客户端"""
+
+    def __init__(self, expose: bool = False):
+        self.expose = expose
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+    def add(self, name: str, start: float, duration: float, **attrs: Any) -> None:
+        """记录一个 span；start 为 perf_counter 时间"""
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({"name": name, "start": start - self.started, "duration": duration, **attrs})
+
+    def server_timing_header(self) -> str:
+        """按名称合并 span，生成 Server-Timing 头"""
+        totals: Dict[str, List[float]] = {}
+        for item in self.spans:
+            name = _SERVER_TIMING_NAME.sub("_", item["name"])
+            total = totals.setdefault(name, [0.0, 0])
+            total[0] += item["duration"]
+            total[1] += 1
+        entries = []
+        for name, (duration, count) in totals.items():
+            entry = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self) -> Dict[str, Any]:
+        spans = []
+        for item in self.spans:
+            attrs = {key: value for key, value in item.items() if key not in ("start", "duration")}
+            spans.append({
+                **attrs,
+                "start_ms": round(item["start"] * 1000, 1),
+                "duration_ms": round(item["duration"] * 1000, 1),
+            })
+        summary: Dict[str, Any] = {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "spans": spans,
+        }
+        if self.dropped:
+            summary["dropped"] = self.dropped
+        return summary
+
+
+def can_expose(headers) -> bool:
+    """是否向客户端返回耗时明细"""
+    if settings.request_timing_expose or settings.app_env != "production":
+        return True
+    token = settings.profiling_token
+    provided = headers.get(settings.profiling_header) or ""
+    return bool(token) and hmac.compare_digest(provided.encode(), token.encode())
+
+
+request_timing_var: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    """当前请求的 RequestTiming，不在请求上下文中时为 None"""
+    return request_timing_var.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """记录代码块耗时；产出的 dict 可在块内补充属性，异常时记录 error"""
+    timing = request_timing_var.get()
+    if timing is None:
+        yield attrs
+        return
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        timing.add(name, started, time.perf_counter() - started, **attrs)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """以 span 包装异步函数"""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
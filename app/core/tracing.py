@@ -2,18 +2,12 @@
 
 import uuid
 import logging
-from contextvars import ContextVar
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
-logger = logging.getLogger(__name__)
-
-request_id_var: ContextVar[str] = ContextVar("request_id", default="")
+from app.core.request_context import get_request_id, request_id_var
 
-
-def get_request_id() -> str:
-    """获取当前请求的追踪 ID"""
-    return request_id_var.get()
+logger = logging.getLogger(__name__)
 
 
 class RequestTracingMiddleware(BaseHTTPMiddleware):
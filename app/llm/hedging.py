@@ -0,0 +1,238 @@
+"""对冲请求 - 首个 token 超时后并发请求回退模型
+
+ModelFallbackMiddleware 只在主模型报错后切换，主模型慢但未失败时用户要一直等到超时。
+HedgedChatModel 包装主模型与回退模型：
+
+- 主模型在截止时间内没有返回首个 chunk 时，向回退模型发出对冲请求
+- 两者中先返回首个 chunk 的一方胜出并继续流式输出，另一方被取消
+- 截止时间默认取主模型滚动 TTFT 的 P90（限制在配置的上下限内），样本不足时使用配置值；
+  主模型落败被取消时记录取消时已等待的时长（真实 TTFT 的下界），否则样本只剩快请求，
+  P90 会逐渐降到下限
+- 胜出方的首个 chunk 在 response_metadata["hedge"] 中标记实际回答的模型，
+  StreamProcessor 据此输出 model 事件，保存的回复按实际模型记录
+
+ChatTongyi 在线程池中读取同步流，被取消的一方在当前读取返回后不再继续读取，连接随生成器回收。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.config import settings
+from app.llm.upstream_limiter import upstream_limiters
+
+logger = logging.getLogger(__name__)
+
+
+class TTFTTracker:
+    """按模型记录最近的首 token 耗时（秒），提供滚动百分位"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._hedges: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def record_hedge(self, model: str, outcome: str) -> None:
+        with self._lock:
+            stats = self._hedges.setdefault(model, {"hedged": 0, "primary_won": 0, "fallback_won": 0})
+            stats["hedged"] += 1
+            stats[outcome] += 1
+
+    def percentile(self, model: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+    def deadline(self, model: str) -> float:
+        """对冲截止时间：样本足够时取 P90，限制在 [min, max] 内"""
+        with self._lock:
+            count = len(self._samples.get(model, ()))
+        if count < settings.model_hedge_min_samples:
+            return settings.model_hedge_deadline
+        p90 = self.percentile(model, 90)
+        return min(settings.model_hedge_max_deadline, max(settings.model_hedge_min_deadline, p90))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = list(dict.fromkeys([*self._samples, *self._hedges]))
+            hedges = {name: dict(stats) for name, stats in self._hedges.items()}
+        stats = {}
+        for model in models:
+            stats[model] = {
+                "samples": len(self._samples.get(model, ())),
+                "p50": self.percentile(model, 50),
+                "p90": self.percentile(model, 90),
+                "p99": self.percentile(model, 99),
+                "hedge_deadline": round(self.deadline(model), 3),
+                **hedges.get(model, {}),
+            }
+        return stats
+
+
+ttft_tracker = TTFTTracker()
+
+
+async def _next_chunk(stream: AsyncIterator[ChatGenerationChunk]) -> Optional[ChatGenerationChunk]:
+    try:
+        return await stream.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _cancel(task: "asyncio.Task", stream: AsyncIterator[Any]) -> None:
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    try:
+        await stream.aclose()
+    except BaseException:
+        pass
+
+
+class HedgedChatModel(BaseChatModel):
+    """主模型首个 chunk 超时后对冲回退模型的聊天模型"""
+
+    primary: BaseChatModel
+    fallback: BaseChatModel
+    model_name: str
+    streaming: bool = True
+    hedge_deadline: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "fallback": getattr(self.fallback, "model_name", None)}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(tools=formatted_tools, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 同步调用不对冲（线程中无法取消读取），直接使用主模型
+        return self.primary._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.primary._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await agenerate_from_stream(
+            self._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+        )
+
+    async def _fallback_stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]], **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """对冲请求同样计入回退模型的上游限流"""
+        name = getattr(self.fallback, "model_name", "default")
+        async with upstream_limiters.get(name).slot():
+            async for chunk in self.fallback._astream(messages, stop=stop, **kwargs):
+                yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # token 回调由 BaseChatModel.astream / _agenerate_with_cache 对本模型产出的 chunk 统一上报
+        fallback_name = getattr(self.fallback, "model_name", "fallback")
+        deadline = self.hedge_deadline if self.hedge_deadline is not None else ttft_tracker.deadline(self.model_name)
+
+        started = time.perf_counter()
+        primary = self.primary._astream(messages, stop=stop, **kwargs)
+        primary_task = asyncio.ensure_future(_next_chunk(primary))
+        streams = {primary_task: (primary, self.model_name, started)}
+
+        winner_task = None
+        errors: List[BaseException] = []
+        pending = {primary_task}
+        cancelled_at = started
+        try:
+            done, _ = await asyncio.wait(pending, timeout=deadline)
+            if not done:
+                hedge = self._fallback_stream(messages, stop, **kwargs)
+                hedge_task = asyncio.ensure_future(_next_chunk(hedge))
+                streams[hedge_task] = (hedge, fallback_name, time.perf_counter())
+                pending.add(hedge_task)
+                logger.info(
+                    f"[HEDGE] {self.model_name} no first token after {deadline:.2f}s, hedging to {fallback_name}"
+                )
+
+            while pending and winner_task is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 同时完成时优先主模型
+                for task in sorted(done, key=lambda t: t is not primary_task):
+                    if task.exception() is None:
+                        winner_task = task
+                        break
+                    errors.append(task.exception())
+        finally:
+            # 取消落败或未完成的一方（包括调用方在等待期间被取消的情况）
+            cancelled_at = time.perf_counter()
+            for task, (stream, _, _) in streams.items():
+                if task is not winner_task:
+                    await _cancel(task, stream)
+
+        if winner_task is None:
+            raise errors[0]
+
+        stream, name, name_started = streams[winner_task]
+        ttft_tracker.record(name, time.perf_counter() - name_started)
+        if winner_task is not primary_task and primary_task.cancelled():
+            ttft_tracker.record(self.model_name, cancelled_at - started)
+        if len(streams) > 1:
+            outcome = "primary_won" if winner_task is primary_task else "fallback_won"
+            ttft_tracker.record_hedge(self.model_name, outcome)
+            logger.info(f"[HEDGE] {name} answered first ({outcome})")
+
+        first = winner_task.result()
+        if first is None:
+            return
+        first.message.response_metadata = {
+            **first.message.response_metadata,
+            "hedge": {"model_name": name, "fallback": winner_task is not primary_task},
+        }
+        yield first
+        async for chunk in stream:
+            yield chunk
@@ -0,0 +1,177 @@
+"""DashScope HTTP 连接池 - 所有 DashScope SDK 调用共享的长连接池
+
+DashScope SDK 内部已经按事件循环复用一个 aiohttp 会话（Aio* 模型），
+并为同步调用（ChatTongyi 在线程中执行）复用一个 requests 会话，
+但两者都使用默认参数：连接总数 100、无单主机上限、空闲 15 秒即断开、
+不缓存 DNS。这里按配置创建这两个会话并注册到 SDK 的共享会话表中，
+SDK 的每次调用都会取到同一个可调参数的连接池。
+
+共享会话表是 SDK 的内部实现（requirements.txt 中限定了 dashscope 版本上限）；
+SDK 升级后缺少这些属性时记录一次警告并沿用 SDK 默认会话，不影响调用。
+"""
+
+import asyncio
+import importlib
+import logging
+import threading
+import weakref
+from types import ModuleType
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_AIO_SDK_ATTRS = ("_lock", "_aio_sessions", "get_ssl_context", "close_shared_aio_session")
+_SYNC_SDK_ATTRS = (
+    "_shared_sync_session_lock", "_shared_sync_session", "_KeepAliveHTTPAdapter", "close_shared_sync_session",
+)
+
+_warned: set = set()
+
+
+def _sdk_module(name: str, attrs: Tuple[str, ...]) -> Optional[ModuleType]:
+    """返回提供所需内部属性的 SDK 模块，不兼容时返回 None（每个模块只警告一次）"""
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    missing = [attr for attr in attrs if not hasattr(module, attr)] if module is not None else list(attrs)
+    if not missing:
+        return module
+    if name not in _warned:
+        _warned.add(name)
+        logger.warning(
+            f"[HTTP POOL] {name} missing {missing}, falling back to DashScope SDK default sessions"
+        )
+    return None
+
+
+def _aio_sdk() -> Optional[ModuleType]:
+    return _sdk_module("dashscope.api_entities.aio_session", _AIO_SDK_ATTRS)
+
+
+def _sync_sdk() -> Optional[ModuleType]:
+    return _sdk_module("dashscope.api_entities.http_request", _SYNC_SDK_ATTRS)
+
+
+class DashScopeHTTPPool:
+    """DashScope SDK 共享连接池
+
+    aiohttp 会话绑定事件循环，每个事件循环各有一个；同步会话进程内唯一。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aio_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._sync_session = None
+
+    @staticmethod
+    def _create_connector(sdk: ModuleType) -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(
+            ssl=sdk.get_ssl_context(),
+            limit=settings.dashscope_pool_limit,
+            limit_per_host=settings.dashscope_pool_limit_per_host,
+            keepalive_timeout=settings.dashscope_pool_keepalive,
+            ttl_dns_cache=settings.dashscope_pool_dns_ttl,
+        )
+
+    async def get_aio_session(self) -> Optional[aiohttp.ClientSession]:
+        """返回当前事件循环的共享 aiohttp 会话，首次调用时创建并注册到 SDK；SDK 不兼容时返回 None"""
+        sdk = _aio_sdk()
+        if sdk is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        with sdk._lock:
+            session = sdk._aio_sessions.get(loop)
+            if session is not None and not session.closed and session is self._aio_sessions.get(loop):
+                return session
+
+            previous = session
+            session = aiohttp.ClientSession(connector=self._create_connector(sdk), trust_env=True)
+            sdk._aio_sessions[loop] = session
+            with self._lock:
+                self._aio_sessions[loop] = session
+
+        if previous is not None and not previous.closed:
+            await previous.close()
+        logger.info(
+            f"[HTTP POOL] aiohttp pool ready: limit={settings.dashscope_pool_limit}, "
+            f"per_host={settings.dashscope_pool_limit_per_host}, "
+            f"keepalive={settings.dashscope_pool_keepalive}s"
+        )
+        return session
+
+    def get_sync_session(self):
+        """返回共享 requests 会话，首次调用时创建并注册到 SDK；SDK 不兼容时返回 None"""
+        sdk = _sync_sdk()
+        if sdk is None:
+            return None
+
+        with sdk._shared_sync_session_lock:
+            session = sdk._shared_sync_session
+            if session is not None and session is self._sync_session:
+                return session
+
+            import requests
+
+            session = requests.Session()
+            adapter = sdk._KeepAliveHTTPAdapter(
+                pool_connections=settings.dashscope_pool_limit_per_host,
+                pool_maxsize=settings.dashscope_pool_limit_per_host,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            previous, sdk._shared_sync_session = sdk._shared_sync_session, session
+            self._sync_session = session
+
+        if previous is not None:
+            previous.close()
+        return session
+
+    async def ensure(self) -> None:
+        """确保当前事件循环与同步调用都使用本连接池（已就绪时只做一次字典查找）"""
+        loop = asyncio.get_running_loop()
+        session = self._aio_sessions.get(loop)
+        if (session is None or session.closed) and _aio_sdk() is not None:
+            await self.get_aio_session()
+        if self._sync_session is None and _sync_sdk() is not None:
+            self.get_sync_session()
+
+    async def close(self) -> None:
+        """关闭当前事件循环的 aiohttp 会话与同步会话"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._aio_sessions.pop(loop, None)
+            self._sync_session = None
+        aio_sdk, sync_sdk = _aio_sdk(), _sync_sdk()
+        if aio_sdk is not None:
+            await aio_sdk.close_shared_aio_session()
+        if sync_sdk is not None:
+            sync_sdk.close_shared_sync_session()
+        logger.info("[HTTP POOL] DashScope connection pools closed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        session = self._aio_sessions.get(loop) if loop is not None else None
+        connector = session.connector if session is not None and not session.closed else None
+        return {
+            "limit": settings.dashscope_pool_limit,
+            "limit_per_host": settings.dashscope_pool_limit_per_host,
+            "keepalive_timeout": settings.dashscope_pool_keepalive,
+            "dns_ttl": settings.dashscope_pool_dns_ttl,
+            "aio_sessions": len(self._aio_sessions),
+            "aio_acquired": len(connector._acquired) if connector is not None else 0,
+            "sync_session": self._sync_session is not None,
+        }
+
+
+dashscope_http_pool = DashScopeHTTPPool()
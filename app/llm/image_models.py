@@ -7,11 +7,13 @@
 from abc import ABC, abstractmethod
 from typing import List, Any
 
-import dashscope
 from dashscope import AioMultiModalConversation
 from dashscope.aigc import AioImageSynthesis
 
 from app.config import settings
+from app.llm.http_pool import dashscope_http_pool
+from app.llm.telemetry import model_telemetry
+from app.llm.upstream_limiter import upstream_limiters
 
 
 # ============================================================================
@@ -96,9 +98,6 @@ class DashScopeImageModel(ABC):
         self.api_key = api_key or settings.qwen_api_key
         self.temperature = kwargs.get("temperature", 0.7)
         self.max_tokens = kwargs.get("max_tokens")
-        
-        # 配置 SDK
-        dashscope.api_key = self.api_key
         self.model_category = "image"
     
     @abstractmethod
@@ -141,7 +140,10 @@ class QwenImageGenerationModel(DashScopeImageModel):
                 "content": [{"text": prompt}]
             }
         ]
-        response = await AioMultiModalConversation.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioMultiModalConversation.call),
             api_key=self.api_key,
             model=self.model_name,
             messages=messages,
@@ -193,7 +195,10 @@ class QwenImageEditModel(DashScopeImageModel):
                 "content": [{"image": image_url}, {"text": prompt}]
             }
         ]
-        response = await AioMultiModalConversation.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioMultiModalConversation.call),
             api_key=self.api_key,
             model=self.model_name,
             messages=messages,
@@ -229,7 +234,10 @@ class WanxImageGenerationModelV2(DashScopeImageModel):
         **kwargs
     ) -> List[str]:
         """生成图像"""
-        response = await AioImageSynthesis.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioImageSynthesis.call),
             api_key=self.api_key,
             model=self.model_name,
             prompt=prompt,
@@ -266,7 +274,10 @@ class WanxImageEditModelV2_5(DashScopeImageModel):
     
     async def aedit(self, image_url: str, prompt: str, **kwargs) -> str:
         """编辑图像"""
-        response = await AioImageSynthesis.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioImageSynthesis.call),
             api_key=self.api_key,
             model=self.model_name,
             prompt=prompt,
@@ -15,6 +15,9 @@ from langchain_community.chat_models import ChatTongyi
 from langchain_community.embeddings import DashScopeEmbeddings
 
 from app.config import settings
+from app.llm.hedging import HedgedChatModel
+from app.llm.http_pool import dashscope_http_pool
+from app.llm.telemetry import model_telemetry, telemetry_callback
 from app.llm.text_models import (
     DashScopeModel,
     DashScopeTextModel,
@@ -37,8 +40,9 @@ logger = logging.getLogger(__name__)
 class ModelFactory:
     """模型工厂 - 支持配置化模型创建，连接池复用"""
 
-    _chat_clients: Dict[str, ChatTongyi] = {}
+    _chat_clients: Dict[str, Union[ChatTongyi, HedgedChatModel]] = {}
     _async_clients: Dict[str, AsyncOpenAI] = {}
+    _tool_models: Dict[str, Union[DashScopeModel, DashScopeImageModel]] = {}
     _lock = asyncio.Lock()
 
     @classmethod
@@ -84,7 +88,8 @@ class ModelFactory:
         enable_thinking: bool = False,
         use_cache: bool = True,
         streaming: bool = True,
-    ) -> ChatTongyi:
+        hedge: Optional[bool] = None,
+    ) -> Union[ChatTongyi, HedgedChatModel]:
         """获取通用模型（连接池复用）
 
         使用 LangChain 的 ChatTongyi 创建模型，支持 bind_tools (用于 Agent)
@@ -94,8 +99,13 @@ class ModelFactory:
             thinking: 是否启用深度思考
             use_cache: 是否使用缓存（默认True）
             streaming: 是否启用流式输出（默认True，用于Agent）
+            hedge: 专家模型首 token 超时后是否对冲快速模型（默认取 model_hedge_enabled，仅流式生效）
         """
+        hedge = settings.model_hedge_enabled if hedge is None else hedge
+        hedge = hedge and is_expert and streaming
         cache_key = f"general_{is_expert}_{enable_thinking}_{streaming}"
+        if hedge:
+            cache_key += "_hedged"
 
         if use_cache and cache_key in cls._chat_clients:
             logger.debug(f"[MODEL FACTORY] ChatTongyi cache hit: {cache_key}")
@@ -125,9 +135,20 @@ class ModelFactory:
             temperature=0.3 if enable_thinking else 0.6,
             model_kwargs=model_kwargs if model_kwargs else None,
             request_timeout=60,
-            max_retries=3
+            max_retries=3,
+            callbacks=[telemetry_callback],
         )
 
+        if hedge:
+            client = HedgedChatModel(
+                primary=client,
+                fallback=cls.get_general_model(
+                    is_expert=False, enable_thinking=enable_thinking, use_cache=use_cache, streaming=streaming
+                ),
+                model_name=model_name,
+                callbacks=[telemetry_callback],
+            )
+
         if use_cache:
             cls._chat_clients[cache_key] = client
             logger.debug(f"[MODEL FACTORY] ChatTongyi created and cached: {cache_key}")
@@ -135,24 +156,53 @@ class ModelFactory:
         return client
 
     @classmethod
-    def get_vision_model(cls, is_ocr: bool = False, **kwargs) -> DashScopeModel:
+    def _get_tool_model(
+        cls,
+        model_class: type,
+        model_name: str,
+        use_cache: bool,
+        kwargs: Dict[str, Any],
+    ) -> Union[DashScopeModel, DashScopeImageModel]:
+        """获取工具模型实例（按模型类、模型名和参数缓存）
+
+        工具模型只保存模型名、API Key 和调用参数，调用时才发起请求，
+        同一配置的实例可以在并发的工具调用之间共享。
+        """
+        params = ",".join(f"{k}={kwargs[k]!r}" for k in sorted(kwargs))
+        cache_key = f"{model_class.__name__}_{model_name}_{params}"
+
+        if use_cache and cache_key in cls._tool_models:
+            logger.debug(f"[MODEL FACTORY] Tool model cache hit: {cache_key}")
+            return cls._tool_models[cache_key]
+
+        model = model_class(
+            model_name=model_name,
+            api_key=settings.qwen_api_key,
+            **kwargs
+        )
+
+        if use_cache:
+            cls._tool_models[cache_key] = model
+            logger.debug(f"[MODEL FACTORY] Tool model created and cached: {cache_key}")
+
+        return model
+
+    @classmethod
+    def get_vision_model(cls, is_ocr: bool = False, use_cache: bool = True, **kwargs) -> DashScopeModel:
         """获取视觉模型 - 统一使用一个模型
         
         Args:
             is_ocr: 是否使用 OCR 专用模型
+            use_cache: 是否使用缓存（默认True）
         """
         model_name = (
             settings.model_vision_ocr if is_ocr
             else settings.model_vision
         )
-        return QwenVisionModel(
-            model_name=model_name,
-            api_key=settings.qwen_api_key,
-            **kwargs
-        )
+        return cls._get_tool_model(QwenVisionModel, model_name, use_cache, kwargs)
     
     @classmethod
-    def get_text_to_image_model(cls, **kwargs) -> DashScopeImageModel:
+    def get_text_to_image_model(cls, use_cache: bool = True, **kwargs) -> DashScopeImageModel:
         """获取图像生成模型 - 统一使用一个模型
         
         根据配置的模型名称自动选择 Qwen 或 Wanx 系列
@@ -160,21 +210,14 @@ class ModelFactory:
         model_name = settings.model_text_to_image
         
         # 根据模型名称前缀选择正确的模型类
-        if model_name.startswith("wan"):
-            return WanxImageGenerationModelV2(
-                model_name=model_name,
-                api_key=settings.qwen_api_key,
-                **kwargs
-            )
-        else:
-            return QwenImageGenerationModel(
-                model_name=model_name,
-                api_key=settings.qwen_api_key,
-                **kwargs
-            )
+        model_class = (
+            WanxImageGenerationModelV2 if model_name.startswith("wan")
+            else QwenImageGenerationModel
+        )
+        return cls._get_tool_model(model_class, model_name, use_cache, kwargs)
     
     @classmethod
-    def get_image_edit_model(cls, **kwargs) -> DashScopeImageModel:
+    def get_image_edit_model(cls, use_cache: bool = True, **kwargs) -> DashScopeImageModel:
         """获取图像编辑模型 - 根据配置选择模型类型
         
         注意：图像编辑使用专门的模型
@@ -182,36 +225,21 @@ class ModelFactory:
         model_name = settings.model_image_edit
         
         # 根据模型名称前缀选择正确的模型类
-        if model_name.startswith("wan"):
-            return WanxImageEditModelV2_5(
-                model_name=model_name,
-                api_key=settings.qwen_api_key,
-                **kwargs
-            )
-        else:
-            return QwenImageEditModel(
-                model_name=model_name,
-                api_key=settings.qwen_api_key,
-                **kwargs
-            )
+        model_class = (
+            WanxImageEditModelV2_5 if model_name.startswith("wan")
+            else QwenImageEditModel
+        )
+        return cls._get_tool_model(model_class, model_name, use_cache, kwargs)
     
     @classmethod
-    def get_coder_model(cls, **kwargs) -> DashScopeModel:
+    def get_coder_model(cls, use_cache: bool = True, **kwargs) -> DashScopeModel:
         """获取编程模型 - 统一使用一个模型"""
-        return DashScopeCoderModel(
-            model_name=settings.model_coder,
-            api_key=settings.qwen_api_key,
-            **kwargs
-        )
+        return cls._get_tool_model(DashScopeCoderModel, settings.model_coder, use_cache, kwargs)
     
     @classmethod
-    def get_translation_model(cls, **kwargs) -> DashScopeModel:
+    def get_translation_model(cls, use_cache: bool = True, **kwargs) -> DashScopeModel:
         """获取翻译模型 - 统一使用一个模型"""
-        return DashScopeTranslationModel(
-            model_name=settings.model_translation,
-            api_key=settings.qwen_api_key,
-            **kwargs
-        )
+        return cls._get_tool_model(DashScopeTranslationModel, settings.model_translation, use_cache, kwargs)
 
     @classmethod
     def get_embedding(cls, model_name: str = None, **kwargs) -> DashScopeEmbeddings:
@@ -228,10 +256,54 @@ class ModelFactory:
             **kwargs
         )
 
+    @classmethod
+    async def warmup_connections(cls, count: Optional[int] = None) -> int:
+        """预建立到 DashScope 的 HTTP/TLS 连接
+        
+        DashScope SDK 的同步调用（ChatTongyi 在线程中执行）和异步调用
+        （Aio* 模型）各自复用 dashscope_http_pool 中的共享连接池。启动时
+        发起少量 HEAD 请求，让首个用户请求不再承担 DNS 解析和 TLS 握手的耗时。
+        
+        Args:
+            count: 每个连接池预建立的连接数，默认取配置，0 表示跳过
+        
+        Returns:
+            成功建立的连接数
+        """
+        count = settings.model_warmup_connections if count is None else count
+        if count <= 0 or not settings.qwen_api_key:
+            return 0
+
+        import aiohttp
+        import dashscope
+
+        url = dashscope.base_http_api_url
+        timeout = 5
+
+        sync_session = dashscope_http_pool.get_sync_session()
+
+        def open_sync() -> None:
+            sync_session.head(url, timeout=timeout)
+
+        async def open_async(session: "aiohttp.ClientSession") -> None:
+            async with session.head(url, timeout=aiohttp.ClientTimeout(total=timeout)):
+                pass
+
+        session = await dashscope_http_pool.get_aio_session()
+        results = await asyncio.gather(
+            *[asyncio.to_thread(open_sync) for _ in range(count)],
+            *[open_async(session) for _ in range(count)],
+            return_exceptions=True,
+        )
+        opened = sum(1 for r in results if not isinstance(r, BaseException))
+        logger.info(f"[MODEL FACTORY] Pre-opened {opened}/{len(results)} DashScope connections")
+        return opened
+
     @classmethod
     async def close_all(cls):
         """关闭所有客户端连接，清理缓存"""
         cls._chat_clients.clear()
+        cls._tool_models.clear()
 
         for key, client in cls._async_clients.items():
             try:
@@ -241,6 +313,11 @@ class ModelFactory:
                 logger.warning(f"[MODEL FACTORY] Failed to close client {key}: {e}")
 
         cls._async_clients.clear()
+
+        try:
+            await dashscope_http_pool.close()
+        except Exception as e:
+            logger.warning(f"[MODEL FACTORY] Failed to close DashScope connection pool: {e}")
         logger.info("[MODEL FACTORY] All clients closed and cache cleared")
 
     @classmethod
@@ -249,6 +326,14 @@ class ModelFactory:
         return {
             "chat_clients": list(cls._chat_clients.keys()),
             "async_clients": list(cls._async_clients.keys()),
+            "tool_models": list(cls._tool_models.keys()),
             "total_chat": len(cls._chat_clients),
             "total_async": len(cls._async_clients),
+            "total_tool": len(cls._tool_models),
+            "http_pool": dashscope_http_pool.get_stats(),
         }
+
+    @classmethod
+    def get_telemetry_stats(cls) -> Dict[str, Any]:
+        """获取各模型与工具的调用遥测（耗时、首 token、token 间隔、token 数直方图）"""
+        return model_telemetry.get_stats()
@@ -0,0 +1,350 @@
+"""上游调用遥测 - 按模型与工具记录耗时、token 与错误
+
+- 聊天模型（ChatTongyi / HedgedChatModel）：通过 ModelFactory 挂载的 TelemetryCallbackHandler 记录
+  首 token 耗时、token 间隔、总耗时、输入/输出 token、重试与错误
+- 工具模型（DashScope SDK）：ModelFactory 创建的模型通过 model_telemetry.timed 包装 SDK 调用，
+  只统计上游耗时（不含限流排队）
+- Agent 工具：TelemetryCallbackHandler 加入 Agent 运行配置，同一 tool_call_id 再次开始计为重试
+
+每次调用按桶累积到直方图（同时计入 Prometheus 指标），并带 request_id 输出一条结构化日志；
+在请求上下文中时同时记为 "model.{名称}" / "tool.{名称}" span（见 app.core.timing）。
+"""
+
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.core.metrics import observe_upstream_call
+from app.core.request_context import get_request_id
+from app.core.timing import RequestTiming, current_timing
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+INTER_TOKEN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class Histogram:
+    """固定桶直方图（累计计数），百分位按桶上界估算"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._count:
+            return None
+        target = q / 100 * self._count
+        seen = 0
+        for bound, count in zip(self.buckets, self._counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative, seen = {}, 0
+        for bound, count in zip(self.buckets, self._counts):
+            seen += count
+            cumulative[str(bound)] = seen
+        cumulative["+Inf"] = self._count
+        return {
+            "count": self._count,
+            "sum": round(self._sum, 4),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": cumulative,
+        }
+
+
+class CallStats:
+    """单个模型或工具的调用统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.ttft = Histogram(LATENCY_BUCKETS)
+        self.inter_token = Histogram(INTER_TOKEN_BUCKETS)
+        self.input_tokens = Histogram(TOKEN_BUCKETS)
+        self.output_tokens = Histogram(TOKEN_BUCKETS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "duration_seconds": self.duration.snapshot(),
+            "ttft_seconds": self.ttft.snapshot(),
+            "inter_token_seconds": self.inter_token.snapshot(),
+            "input_tokens": self.input_tokens.snapshot(),
+            "output_tokens": self.output_tokens.snapshot(),
+        }
+
+
+class ModelTelemetry:
+    """按 (类别, 名称) 汇总调用统计；类别为 model / tool_model / tool"""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], CallStats] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        kind: str,
+        name: str,
+        duration: float,
+        *,
+        ttft: Optional[float] = None,
+        inter_token: Sequence[float] = (),
+        input_tokens: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        error: Optional[BaseException] = None,
+        request_id: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            stats = self._stats.setdefault((kind, name), CallStats())
+            stats.calls += 1
+            stats.duration.observe(duration)
+            if error is not None:
+                stats.errors += 1
+            if ttft is not None:
+                stats.ttft.observe(ttft)
+            for gap in inter_token:
+                stats.inter_token.observe(gap)
+            if input_tokens is not None:
+                stats.input_tokens.observe(input_tokens)
+            if output_tokens is not None:
+                stats.output_tokens.observe(output_tokens)
+        observe_upstream_call(kind, name, duration, ttft, error is not None)
+
+        request_id = request_id if request_id is not None else get_request_id()
+        data = {
+            "kind": kind,
+            "name": name,
+            "duration": round(duration, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "error": type(error).__name__ if error is not None else None,
+        }
+        logger.debug(
+            f"[TELEMETRY] {kind}={name} duration={duration:.3f}s request_id={request_id}",
+            extra={"request_id": request_id, "extra_data": data},
+        )
+
+    def record_retry(self, kind: str, name: str) -> None:
+        with self._lock:
+            self._stats.setdefault((kind, name), CallStats()).retries += 1
+
+    def timed(self, name: str, func: Callable[..., Awaitable[Any]], kind: str = "tool_model") -> Callable[..., Awaitable[Any]]:
+        """包装 DashScope SDK 调用：记录耗时、usage 与错误（非 200 响应计为错误）"""
+
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                response = await func(*args, **kwargs)
+            except Exception as e:
+                self.record(kind, name, time.perf_counter() - started, error=e)
+                raise
+            input_tokens, output_tokens = _response_usage(response)
+            status = getattr(response, "status_code", 200)
+            error = None
+            if isinstance(status, int) and status != 200:
+                error = RuntimeError(f"status_code: {status}")
+            self.record(
+                kind, name, time.perf_counter() - started,
+                input_tokens=input_tokens, output_tokens=output_tokens, error=error,
+            )
+            return response
+
+        return wrapper
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats: Dict[str, Dict[str, Any]] = {}
+            for (kind, name), call_stats in self._stats.items():
+                stats.setdefault(kind, {})[name] = call_stats.snapshot()
+        return stats
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+model_telemetry = ModelTelemetry()
+
+
+def _get(obj: Any, key: str) -> Any:
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def _response_usage(response: Any) -> Tuple[Optional[int], Optional[int]]:
+    """DashScope SDK 响应的 usage（文本模型为 input/output_tokens，图片模型可能没有）"""
+    usage = _get(response, "usage")
+    if usage is None:
+        return None, None
+    input_tokens, output_tokens = _get(usage, "input_tokens"), _get(usage, "output_tokens")
+    return (
+        input_tokens if isinstance(input_tokens, int) else None,
+        output_tokens if isinstance(output_tokens, int) else None,
+    )
+
+
+def _message_usage(message: Any) -> Tuple[Optional[int], Optional[int]]:
+    """LangChain 消息中的 token 用量：优先 usage_metadata，其次 ChatTongyi 的 response_metadata.token_usage"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        usage = (getattr(message, "response_metadata", None) or {}).get("token_usage")
+    if not usage:
+        return None, None
+    return usage.get("input_tokens"), usage.get("output_tokens")
+
+
+class _Run:
+    __slots__ = ("kind", "name", "started", "request_id", "timing", "first_token", "last_token", "gaps", "usage")
+
+    def __init__(self, kind: str, name: str, request_id: str, timing: Optional[RequestTiming] = None):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.request_id = request_id
+        self.timing = timing
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.gaps: List[float] = []
+        self.usage: Tuple[Optional[int], Optional[int]] = (None, None)
+
+
+class TelemetryCallbackHandler(AsyncCallbackHandler):
+    """聊天模型与 Agent 工具的遥测回调
+
+    同一个实例同时挂在模型与 Agent 运行配置上时，LangChain 按实例去重，不会重复记录。
+    被取消的调用（CancelledError 不触发 on_*_error）不会结束，进行中的调用数超过
+    max_runs 时淘汰最早的记录，避免其及引用的 RequestTiming 常驻进程。
+    """
+
+    def __init__(
+        self,
+        telemetry: ModelTelemetry = model_telemetry,
+        max_tool_calls: int = 1024,
+        max_runs: int = 1024,
+    ):
+        self.telemetry = telemetry
+        self.max_tool_calls = max_tool_calls
+        self.max_runs = max_runs
+        self._runs: Dict[UUID, _Run] = {}
+        self._tool_calls: Dict[str, int] = {}
+
+    def _start(self, run_id: UUID, kind: str, name: str) -> None:
+        while len(self._runs) >= self.max_runs:
+            stale = self._runs.pop(next(iter(self._runs)))
+            logger.debug(f"[TELEMETRY] Dropped unfinished {stale.kind}={stale.name} request_id={stale.request_id}")
+        self._runs[run_id] = _Run(kind, name, get_request_id(), current_timing())
+
+    def _finish(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        duration = time.perf_counter() - run.started
+        ttft = run.first_token - run.started if run.first_token is not None else None
+        input_tokens, output_tokens = run.usage
+        self.telemetry.record(
+            run.kind, run.name, duration,
+            ttft=ttft, inter_token=run.gaps, input_tokens=input_tokens, output_tokens=output_tokens,
+            error=error, request_id=run.request_id,
+        )
+        if run.timing is not None:
+            attrs: Dict[str, Any] = {}
+            if ttft is not None:
+                attrs["ttft_ms"] = round(ttft * 1000, 1)
+            if error is not None:
+                attrs["error"] = type(error).__name__
+            run.timing.add(f"{run.kind}.{run.name}", run.started, duration, **attrs)
+
+    # -------------------------------------------------------------- 聊天模型
+
+    async def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        invocation = kwargs.get("invocation_params") or {}
+        metadata = kwargs.get("metadata") or {}
+        name = invocation.get("model_name") or invocation.get("model") or metadata.get("ls_model_name") or "unknown"
+        self._start(run_id, "model", name)
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, chunk: Any = None, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is None:
+            return
+        now = time.perf_counter()
+        if run.first_token is None:
+            run.first_token = now
+        else:
+            run.gaps.append(now - run.last_token)
+        run.last_token = now
+        # DashScope 每个 chunk 携带截至当前的累计用量，保留最后一次
+        if chunk is not None:
+            usage = _message_usage(getattr(chunk, "message", None))
+            if usage != (None, None):
+                run.usage = usage
+
+    async def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is not None and run.usage == (None, None):
+            generations = getattr(response, "generations", None) or [[]]
+            if generations and generations[0]:
+                run.usage = _message_usage(getattr(generations[0][0], "message", None))
+            if run.usage == (None, None):
+                token_usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+                run.usage = (token_usage.get("input_tokens"), token_usage.get("output_tokens"))
+        self._finish(run_id)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error)
+
+    async def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.get(run_id)
+        if run is not None:
+            self.telemetry.record_retry(run.kind, run.name)
+
+    # -------------------------------------------------------------- 工具
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or "unknown"
+        self._start(run_id, "tool", name)
+        tool_call_id = kwargs.get("tool_call_id")
+        if tool_call_id:
+            # ToolRetryMiddleware 重新执行同一个工具调用
+            if tool_call_id in self._tool_calls:
+                self.telemetry.record_retry("tool", name)
+            elif len(self._tool_calls) >= self.max_tool_calls:
+                self._tool_calls.pop(next(iter(self._tool_calls)))
+            self._tool_calls[tool_call_id] = self._tool_calls.get(tool_call_id, 0) + 1
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        # ToolNode 捕获的异常以 status="error" 的 ToolMessage 返回
+        error = None
+        if getattr(output, "status", None) == "error":
+            error = RuntimeError(str(getattr(output, "content", ""))[:200])
+        self._finish(run_id, error)
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error)
+
+
+telemetry_callback = TelemetryCallbackHandler()
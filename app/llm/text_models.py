@@ -7,10 +7,12 @@
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any
 
-import dashscope
 from dashscope import AioGeneration, AioMultiModalConversation
 
 from app.config import settings
+from app.llm.http_pool import dashscope_http_pool
+from app.llm.telemetry import model_telemetry
+from app.llm.upstream_limiter import upstream_limiters
 
 
 # ============================================================================
@@ -28,9 +30,6 @@ class DashScopeModel(ABC):
         self.api_key = api_key or settings.qwen_api_key
         self.temperature = kwargs.get("temperature", 0.7)
         self.max_tokens = kwargs.get("max_tokens")
-        
-        # 配置 SDK
-        dashscope.api_key = self.api_key
     
     @abstractmethod
     async def ainvoke(self, **kwargs) -> Any:
@@ -57,9 +56,6 @@ class DashScopeTextModel(DashScopeModel):
         self.api_key = api_key or settings.qwen_api_key
         self.temperature = kwargs.get("temperature", 0.7)
         self.max_tokens = kwargs.get("max_tokens")
-        
-        # 配置 SDK
-        dashscope.api_key = self.api_key
         self.model_category = "text"
     
     @abstractmethod
@@ -81,7 +77,10 @@ class QwenVisionModel(DashScopeTextModel):
     
     async def ainvoke(self, messages: List[Dict[str, Any]], **kwargs) -> Any:
         """调用千问视觉理解模型"""
-        response = await AioMultiModalConversation.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioMultiModalConversation.call),
             model=self.model_name,
             messages=messages,
             temperature=self.temperature,
@@ -104,7 +103,10 @@ class QwenOCRModel(DashScopeTextModel):
     
     async def ainvoke(self, messages: List[Dict[str, Any]], **kwargs) -> Any:
         """调用千问 OCR 模型"""
-        response = await AioMultiModalConversation.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioMultiModalConversation.call),
             model=self.model_name,
             messages=messages,
             temperature=self.temperature,
@@ -128,7 +130,10 @@ class DashScopeCoderModel(DashScopeTextModel):
     
     async def ainvoke(self, messages: List[Dict[str, Any]], **kwargs) -> Any:
         """调用编程模型"""
-        response = await AioGeneration.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioGeneration.call),
             api_key=self.api_key,
             model=self.model_name,
             messages=messages,
@@ -156,7 +161,10 @@ class DashScopeTranslationModel(DashScopeTextModel):
         **kwargs
     ) -> Any:
         """调用翻译模型"""
-        response = await AioGeneration.call(
+        await dashscope_http_pool.ensure()
+        response = await upstream_limiters.call(
+            self.model_name,
+            model_telemetry.timed(self.model_name, AioGeneration.call),
             api_key=self.api_key,
             model=self.model_name,
             messages=messages,
@@ -0,0 +1,342 @@
+"""上游并发限制 - 按上游模型/服务自适应限流
+
+每个上游（DashScope 各模型、Tavily）一个 AdaptiveLimiter：
+
+- 并发窗口（AIMD）：请求成功时窗口加性增长（每满一个窗口 +1），
+  被上游限流（429 / Throttling）时窗口减半，最低 upstream_min_concurrency
+- 令牌桶 QPS：通过 Redis Lua 脚本在所有 worker 间共享，Redis 不可用时退化为进程内令牌桶
+- retry-after：被限流后在 Redis 中写入冷却键，冷却期内所有 worker 的新请求都等待
+- 公平排队：超出窗口的请求按调用方（用户）分队列，轮转放行，单个用户的突发不会饿死其他用户
+- 排队超过 upstream_queue_timeout 抛出 UpstreamBusyError，由调用方直接降级，不再重试
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的调用方标识（用户），用于公平排队；未设置时所有请求共用一个队列
+upstream_caller_var: ContextVar[str] = ContextVar("upstream_caller", default="")
+
+THROTTLE_CODES = ("throttling", "ratequota", "rate limit", "too many requests", "status_code: 429")
+
+TOKEN_BUCKET_SCRIPT = """
+local cooldown = redis.call('PTTL', KEYS[2])
+if cooldown > 0 then return tostring(cooldown / 1000) end
+local rate = tonumber(ARGV[1])
+if rate <= 0 then return '0' end
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class UpstreamBusyError(Exception):
+    """上游繁忙：排队等待超时"""
+
+    def __init__(self, upstream: str, waited: float):
+        super().__init__(f"Upstream {upstream} is busy (queued {waited:.1f}s)")
+        self.upstream = upstream
+
+
+def _status_code(obj: Any) -> Optional[int]:
+    for candidate in (obj, getattr(obj, "response", None)):
+        code = getattr(candidate, "status_code", None) or getattr(candidate, "status", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def is_throttled(result: Any) -> bool:
+    """判断异常或 DashScope 响应是否表示被上游限流"""
+    if _status_code(result) == 429:
+        return True
+    if isinstance(result, Exception):
+        if type(result).__name__ in ("UsageLimitExceededError", "RateLimitError"):
+            return True
+        text = str(result).lower()
+    else:
+        text = str(getattr(result, "code", "") or "").lower()
+    return any(code in text for code in THROTTLE_CODES)
+
+
+def retry_after(result: Any) -> Optional[float]:
+    """从异常或响应中提取 retry-after（秒），没有时返回 None"""
+    value = getattr(result, "retry_after_seconds", None)
+    if value is None:
+        for candidate in (result, getattr(result, "response", None)):
+            headers = getattr(candidate, "headers", None)
+            if headers is not None and hasattr(headers, "get"):
+                value = headers.get("Retry-After") or headers.get("retry-after")
+                if value is not None:
+                    break
+    if not isinstance(value, (int, float, str)):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class Slot:
+    """一次上游调用占用的并发槽"""
+
+    def __init__(self, limiter: "AdaptiveLimiter"):
+        self.limiter = limiter
+        self.throttle: Optional[float] = None
+        self.failed = False
+
+    def throttled(self, retry_after_seconds: Optional[float] = None) -> None:
+        self.throttle = retry_after_seconds or settings.upstream_default_retry_after
+
+    def inspect(self, result: Any) -> None:
+        """根据异常或响应记录限流信号"""
+        if is_throttled(result):
+            self.throttled(retry_after(result))
+
+
+class AdaptiveLimiter:
+    """单个上游的自适应限流器（worker 内并发窗口 + 跨 worker 令牌桶与冷却）"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        qps: float,
+        burst: Optional[float] = None,
+        min_concurrency: int = 1,
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.qps = qps
+        self.burst = burst or max(1.0, qps)
+        self.limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._tokens = self.burst
+        self._tokens_at = time.monotonic()
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self._script = None
+        self._stats = {"acquired": 0, "queued": 0, "throttled": 0, "rejected": 0, "errors": 0}
+
+    # -------------------------------------------------------------- 并发窗口
+
+    def _queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _wake(self) -> None:
+        """按调用方轮转放行排队的请求"""
+        while self._queues and self._in_flight < int(self.limit):
+            caller, queue = self._queues.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                self._queues[caller] = queue
+            if future.done():
+                continue
+            self._in_flight += 1
+            future.set_result(None)
+
+    async def _acquire_slot(self, caller: str) -> None:
+        if not self._queues and self._in_flight < int(self.limit):
+            self._in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(caller, deque()).append(future)
+        self._stats["queued"] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已被放行但调用方同时被取消：归还并发槽
+                self._release_slot()
+            else:
+                future.cancel()
+                queue = self._queues.get(caller)
+                if queue is not None and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._queues[caller]
+            raise
+
+    def _release_slot(self) -> None:
+        self._in_flight = max(0, self._in_flight - 1)
+        self._wake()
+
+    def _on_success(self) -> None:
+        if self.limit < self.max_concurrency:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def _on_throttle(self, delay: float) -> None:
+        now = time.monotonic()
+        self._stats["throttled"] += 1
+        self._cooldown_until = max(self._cooldown_until, now + delay)
+        # 同一批并发请求先后收到的限流只减半一次
+        if now - self._last_decrease >= delay:
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._last_decrease = now
+            logger.warning(
+                f"[UPSTREAM] {self.name} throttled, window -> {int(self.limit)}, cooldown {delay:.1f}s"
+            )
+
+    # -------------------------------------------------------------- 速率
+
+    def _local_reserve(self) -> float:
+        now = time.monotonic()
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        if self.qps <= 0:
+            return 0.0
+        self._tokens = min(self.burst, self._tokens + (now - self._tokens_at) * self.qps)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.qps
+
+    async def _reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数（0 表示已取得）"""
+        if settings.upstream_limiter_shared:
+            try:
+                from app.cache.redis import redis_client
+
+                if self._script is None:
+                    self._script = redis_client.client.register_script(TOKEN_BUCKET_SCRIPT)
+                wait = await self._script(
+                    keys=[f"upstream:{self.name}:bucket", f"upstream:{self.name}:cooldown"],
+                    args=[self.qps, self.burst],
+                )
+                return float(wait)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.debug(f"[UPSTREAM] Shared bucket unavailable for {self.name}: {e}")
+        return self._local_reserve()
+
+    async def _wait_for_token(self) -> None:
+        while True:
+            wait = await self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    async def _share_cooldown(self, delay: float) -> None:
+        if not settings.upstream_limiter_shared:
+            return
+        try:
+            from app.cache.redis import redis_client
+
+            await redis_client.client.set(f"upstream:{self.name}:cooldown", "1", px=int(delay * 1000))
+        except Exception as e:
+            logger.debug(f"[UPSTREAM] Failed to share cooldown for {self.name}: {e}")
+
+    # -------------------------------------------------------------- 对外接口
+
+    @asynccontextmanager
+    async def slot(self, caller: Optional[str] = None) -> AsyncIterator[Slot]:
+        """占用一个并发槽并取得令牌；调用方可通过 Slot 报告限流信号"""
+        if not settings.upstream_limiter_enabled:
+            yield Slot(self)
+            return
+
+        caller = caller if caller is not None else upstream_caller_var.get()
+        started = time.monotonic()
+        acquired = False
+        try:
+            async with asyncio.timeout(settings.upstream_queue_timeout):
+                await self._acquire_slot(caller)
+                acquired = True
+                await self._wait_for_token()
+        except TimeoutError:
+            if acquired:
+                self._release_slot()
+            self._stats["rejected"] += 1
+            raise UpstreamBusyError(self.name, time.monotonic() - started) from None
+        except BaseException:
+            if acquired:
+                self._release_slot()
+            raise
+
+        self._stats["acquired"] += 1
+        slot = Slot(self)
+        try:
+            yield slot
+        except Exception as e:
+            slot.failed = True
+            slot.inspect(e)
+            raise
+        finally:
+            if slot.throttle is not None:
+                self._on_throttle(slot.throttle)
+                await self._share_cooldown(slot.throttle)
+            elif not slot.failed:
+                self._on_success()
+            self._release_slot()
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """在限流槽内调用 func，并根据返回的响应（DashScope 不抛异常的 429）调整窗口"""
+        async with self.slot() as slot:
+            result = await func(*args, **kwargs)
+            slot.inspect(result)
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "window": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "qps": self.qps,
+            "in_flight": self._in_flight,
+            "queue_depth": self._queue_depth(),
+            "queued_callers": len(self._queues),
+            "cooldown_seconds": round(max(0.0, self._cooldown_until - now), 2),
+            **self._stats,
+        }
+
+
+class UpstreamLimiters:
+    """按上游名称创建并缓存限流器，参数取自 upstream_limits（未配置的使用 default）"""
+
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, name: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            config = settings.upstream_limits.get(name) or settings.upstream_limits.get("default", {})
+            limiter = AdaptiveLimiter(
+                name,
+                max_concurrency=config.get("max_concurrency", 16),
+                qps=config.get("qps", 0),
+                burst=config.get("burst"),
+                min_concurrency=settings.upstream_min_concurrency,
+            )
+            self._limiters[name] = limiter
+        return limiter
+
+    async def call(self, name: str, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        return await self.get(name).call(func, *args, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: limiter.get_stats() for name, limiter in self._limiters.items()}
+
+
+upstream_limiters = UpstreamLimiters()
@@ -5,7 +5,7 @@ import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from slowapi.errors import RateLimitExceeded
 
 from app.config import settings
@@ -16,10 +16,14 @@ from app.api.middleware import (
     limiter,
     RequestTracingMiddleware,
     RequestSizeLimitMiddleware,
+    MetricsMiddleware,
 )
 from app.api.exception_handlers import dragonai_exception_handler, rate_limit_exceeded_handler
 from app.agents.agent_factory import AgentFactory
 from app.llm.model_factory import ModelFactory
+from app.services.stream import run_registry
+from app.agents.checkpoint_maintenance import checkpoint_compactor
+from app.core.metrics import metrics_sampler, render_metrics
 from app.api.v1 import auth, conversations, files, knowledge, tools, models, chat, monitoring
 
 
@@ -43,17 +47,26 @@ async def lifespan(app: FastAPI):
         logger.warning(f"[AGENT] Warmup failed: {e}")
     await redis_client.connect()
     logger.info("Redis connected")
+    await run_registry.start_listener()
+    await checkpoint_compactor.start()
+    await metrics_sampler.start()
+    AgentFactory.start_skills_watcher()
     try:
         await cache_warmup.warmup_all()
     except Exception as e:
         logger.warning(f"[CACHE WARMUP] Cache warmup failed, continuing startup: {e}")
     yield
+    await run_registry.stop_listener()
+    await checkpoint_compactor.stop()
+    await metrics_sampler.stop()
+    await AgentFactory.stop_skills_watcher()
     await AgentFactory.close_checkpointer()
     await AgentFactory.close_store()
     await ModelFactory.close_all()
     await redis_client.close()
     await close_db()
     logger.info("Shutting down DragonAI")
+    stop_logging()
 
 
 def create_app():
@@ -85,7 +98,10 @@ def create_app():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Request-ID", "X-Run-ID"],
     )
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
     
     app.include_router(auth.router, prefix="/api/v1")
     app.include_router(conversations.router, prefix="/api/v1")
@@ -104,10 +120,29 @@ def create_app():
     async def health_check():
         return {"status": "healthy"}
     
+    if settings.metrics_enabled:
+        @app.get("/metrics", include_in_schema=False)
+        async def metrics():
+            # 仅供内网 Prometheus 抓取，nginx 不转发该路径
+            body, content_type = render_metrics()
+            return Response(content=body, media_type=content_type)
+    
     return app
 
 
 def setup_logging(log_level: str, log_dir: str, app_env: str):
     """配置日志"""
     from app.core.logging_config import setup_logging as _setup_logging
-    _setup_logging(log_level=log_level, log_dir=log_dir, app_env=app_env)
+    _setup_logging(
+        log_level=log_level,
+        log_dir=log_dir,
+        app_env=app_env,
+        use_queue=settings.log_queue_enabled,
+        sample_rates=settings.log_debug_sample_rates,
+    )
+
+
+def stop_logging():
+    """停止后台日志线程，写完剩余日志"""
+    from app.core.logging_config import stop_logging as _stop_logging
+    _stop_logging()
@@ -41,6 +41,7 @@ class ChatRequest(BaseModel):
     is_expert: Optional[bool] = Field(False, description="是否使用专家模型")
     enable_thinking: Optional[bool] = Field(False, description="是否启用深度思考模式")
     attachments: Optional[List[str]] = Field(None, description="附件列表（图片或文档路径）")
+    run_id: Optional[str] = Field(None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$", description="运行ID（用于取消），不传则由服务端生成")
 
 
 class ChatMessageItem(BaseModel):
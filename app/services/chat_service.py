@@ -60,11 +60,29 @@ class ChatService:
         content: str,
         is_expert: bool = False,
         enable_thinking: bool = False,
-        attachments: Optional[List[str]] = None
+        attachments: Optional[List[str]] = None,
+        run_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """生成 SSE 格式的流式响应"""
         async for chunk in self.sse_emitter.generate_sse_stream(
-            db, conversation_id, user_id, content, is_expert, enable_thinking, attachments
+            db, conversation_id, user_id, content, is_expert, enable_thinking, attachments, run_id
+        ):
+            yield chunk
+    
+    async def generate_ndjson_stream(
+        self,
+        db: AsyncSession,
+        conversation_id: int,
+        user_id: int,
+        content: str,
+        is_expert: bool = False,
+        enable_thinking: bool = False,
+        attachments: Optional[List[str]] = None,
+        run_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """生成 NDJSON 格式的流式响应（紧凑传输）"""
+        async for chunk in self.sse_emitter.generate_ndjson_stream(
+            db, conversation_id, user_id, content, is_expert, enable_thinking, attachments, run_id
         ):
             yield chunk
 
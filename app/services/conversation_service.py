@@ -1,19 +1,29 @@
 
+import asyncio
 import logging
-from typing import List, Optional
-from sqlalchemy import select, desc
+from typing import List, Optional, Set
+from sqlalchemy import event, select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from app.models.conversation import Conversation
 from app.schemas.conversation import ConversationCreate, ConversationUpdate
 from app.cache import redis_client, cache_aside
+from app.core.timing import traced
 from app.services.repositories.message_repository import MessageRepository
 
 logger = logging.getLogger(__name__)
 
+# 会话中等待提交后删除 checkpoint 线程的对话 ID
+PENDING_THREAD_DELETES_KEY = "pending_checkpoint_thread_deletes"
+
+# 提交后启动的删除任务，保留引用直到完成
+_thread_delete_tasks: Set[asyncio.Task] = set()
+
 
 class ConversationService:
     @staticmethod
+    @traced("get_conversation")
     async def get_conversation(db: AsyncSession, conversation_id: int, user_id: int) -> Optional[Conversation]:
         cache_key = f"conversation:{conversation_id}:{user_id}"
         
@@ -106,8 +116,52 @@ class ConversationService:
         await ConversationService._invalidate_conversation_cache(conversation_id, user_id)
         await ConversationService._invalidate_user_cache(user_id)
         await MessageRepository._invalidate_messages_cache(conversation_id, user_id)
+        ConversationService._delete_checkpoint_threads_after_commit(db, conversation_id)
         return True
 
+    @staticmethod
+    def _delete_checkpoint_threads_after_commit(db: AsyncSession, conversation_id: int) -> None:
+        """会话提交后再删除 checkpoint 线程
+
+        事务由 get_db 在响应后提交；提前删除时若事务回滚，对话仍在而历史已丢失。
+        回滚时丢弃待删除的 ID。
+        """
+        session = db.sync_session
+        pending = session.info.get(PENDING_THREAD_DELETES_KEY)
+        if pending is None:
+            pending = session.info[PENDING_THREAD_DELETES_KEY] = set()
+
+            def after_commit(sync_session: Session) -> None:
+                ids = sync_session.info[PENDING_THREAD_DELETES_KEY]
+                for cid in sorted(ids):
+                    task = asyncio.get_running_loop().create_task(
+                        ConversationService._delete_checkpoint_threads(cid)
+                    )
+                    _thread_delete_tasks.add(task)
+                    task.add_done_callback(_thread_delete_tasks.discard)
+                ids.clear()
+
+            def after_rollback(sync_session: Session) -> None:
+                sync_session.info[PENDING_THREAD_DELETES_KEY].clear()
+
+            event.listen(session, "after_commit", after_commit)
+            event.listen(session, "after_rollback", after_rollback)
+        pending.add(conversation_id)
+
+    @staticmethod
+    async def _delete_checkpoint_threads(conversation_id: int) -> None:
+        """删除对话的 checkpoint 线程；失败时由后台压缩任务兜底清理"""
+        from app.agents.checkpoint_maintenance import checkpoint_compactor
+
+        try:
+            report = await checkpoint_compactor.delete_conversation_threads([conversation_id])
+            logger.info(
+                f"[CHECKPOINT] Deleted thread of conversation {conversation_id}, "
+                f"reclaimed {report['reclaimed_bytes']} bytes"
+            )
+        except Exception as e:
+            logger.warning(f"[CHECKPOINT] Failed to delete thread of conversation {conversation_id}: {e}")
+
     @staticmethod
     async def pin_conversation(db: AsyncSession, conversation_id: int, user_id: int, pinned: bool) -> Optional[Conversation]:
         result = await db.execute(
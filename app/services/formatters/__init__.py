@@ -1,4 +1,4 @@
-from app.services.formatters.message_formatter import MessageFormatter
+from app.services.formatters.message_formatter import MessageFormatter, ToolCallDeltaBuffer
 from app.services.formatters.tool_result_formatter import ToolResultFormatter
 
-__all__ = ["MessageFormatter", "ToolResultFormatter"]
+__all__ = ["MessageFormatter", "ToolCallDeltaBuffer", "ToolResultFormatter"]
@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional
 from langchain_core.messages.ai import AIMessageChunk
 from langchain_core.messages.tool import ToolMessage
 from langchain_core.messages.human import HumanMessage
@@ -23,6 +23,51 @@ def _is_summarization_message(message) -> bool:
     return lc_source == 'summarization'
 
 
+class ToolCallDeltaBuffer:
+    """工具调用参数增量拼装缓冲区
+    
+    按 tool_call_chunks 的 index 拼装参数片段，工具名与 id 通常只出现在首个分片。
+    同一 index 出现新的 id 时视为下一次模型调用的新工具调用。
+    每个 Agent 流使用独立实例。
+    """
+    
+    def __init__(self):
+        self._calls: Dict[int, Dict[str, Any]] = {}
+    
+    def add_chunk(self, chunk: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """追加一个分片，返回本次增量（无新信息时返回 None）"""
+        index = chunk.get("index") or 0
+        call_id = chunk.get("id")
+        name = chunk.get("name")
+        args = chunk.get("args") or ""
+        
+        current = self._calls.get(index)
+        if current is None or (call_id and current["id"] and call_id != current["id"]):
+            current = {"id": call_id or "", "name": name or "", "args": ""}
+            self._calls[index] = current
+        else:
+            if call_id and not current["id"]:
+                current["id"] = call_id
+            if name and not current["name"]:
+                current["name"] = name
+        
+        if not (name or args):
+            return None
+        
+        current["args"] += args
+        return {
+            "id": current["id"],
+            "index": index,
+            "name": current["name"],
+            "args_delta": args,
+        }
+    
+    def get_args(self, index: int = 0) -> str:
+        """获取指定 index 已拼装的参数文本"""
+        current = self._calls.get(index)
+        return current["args"] if current else ""
+
+
 class MessageFormatter:
     """消息格式化器，负责从 LangChain 消息对象中提取和格式化内容"""
     
@@ -52,13 +97,19 @@ class MessageFormatter:
         return ""
     
     @staticmethod
-    def format_stream_message(message, metadata, include_thinking: bool) -> Optional[Dict[str, Any]]:
+    def format_stream_message(
+        message,
+        metadata,
+        include_thinking: bool,
+        tool_call_buffer: Optional[ToolCallDeltaBuffer] = None
+    ) -> Optional[Dict[str, Any]]:
         """格式化流式消息（stream_mode="messages"）
         
         Args:
             message: AIMessageChunk 或 ToolMessage
             metadata: 包含 langgraph_node 等信息
             include_thinking: 是否包含思考内容
+            tool_call_buffer: 工具调用增量缓冲区，提供时输出 tool_call_delta 事件
             
         Returns:
             格式化后的消息字典，如果不需要输出则返回 None
@@ -69,7 +120,16 @@ class MessageFormatter:
         if isinstance(message, AIMessageChunk):
             tool_call_chunks = getattr(message, 'tool_call_chunks', None)
             if tool_call_chunks:
-                return None
+                if tool_call_buffer is None:
+                    return None
+                deltas = [tool_call_buffer.add_chunk(chunk) for chunk in tool_call_chunks]
+                deltas = [delta for delta in deltas if delta]
+                if not deltas:
+                    return None
+                return {
+                    "type": "tool_call_delta",
+                    "data": {"calls": deltas}
+                }
             
             content = getattr(message, 'content', "")
             
@@ -93,84 +153,53 @@ class MessageFormatter:
         return None
     
     @staticmethod
-    def format_update(event: Dict, include_thinking: bool) -> List[Dict[str, Any]]:
-        """格式化更新事件（stream_mode="updates"）
+    def format_custom_event(event: Any) -> Optional[Dict[str, Any]]:
+        """格式化自定义事件（stream_mode="custom"）
+        
+        处理 ToolStreamEventsMiddleware 写入的工具生命周期事件：
+        - tool_start → tool_call（工具调用确认）
+        - tool_end   → tool_result（优先使用工具自带的结构化 artifact）
         
-        Args:
-            event: 事件字典，格式为 {"model": {"messages": [...]}} 或 {"tools": {"messages": [...]}}
-            include_thinking: 是否包含思考内容
-            
         Returns:
-            格式化后的事件列表，可能包含 thinking 和 content 两个事件
+            格式化后的事件，无法识别时返回 None
         """
-        for node_name, node_output in event.items():
-            if node_name in ("model", "agent"):
-                return MessageFormatter._format_model_update(node_output, include_thinking)
-            elif node_name == "tools":
-                return MessageFormatter._format_tools_update(node_output)
-        
-        return [{"type": "unknown", "data": event}]
-    
-    @staticmethod
-    def _format_model_update(node_output, include_thinking: bool) -> List[Dict[str, Any]]:
-        """格式化 model/agent 节点的更新"""
-        from app.services.formatters.tool_result_formatter import ToolResultFormatter
-        
-        messages = node_output.get("messages", []) if isinstance(node_output, dict) else []
-        
-        if not messages:
-            return []
-        
-        last_message = messages[-1]
-        if not hasattr(last_message, 'type') or last_message.type != "ai":
-            return []
-        
-        if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-            calls = []
-            for tc in last_message.tool_calls:
-                args = tc.get('args', {})
-                args_preview = ToolResultFormatter.get_args_preview(args)
-                calls.append({
-                    "id": tc.get('id', ''),
-                    "name": tc.get('name', ''),
-                    "args_preview": args_preview
-                })
-            if calls:
-                return [{"type": "tool_call", "data": {"calls": calls}}]
-        
-        results = []
-        
-        if include_thinking:
-            thinking_content = MessageFormatter.extract_thinking_content(last_message)
-            if thinking_content:
-                results.append({"type": "thinking", "data": {"content": thinking_content}})
-        
-        return results
-    
-    @staticmethod
-    def _format_tools_update(node_output) -> List[Dict[str, Any]]:
-        """格式化 tools 节点的更新"""
         from app.services.formatters.tool_result_formatter import ToolResultFormatter
         
-        messages = node_output.get("messages", []) if isinstance(node_output, dict) else []
+        if not isinstance(event, dict):
+            return None
         
-        if not messages:
-            return []
+        event_name = event.get("event")
+        name = event.get("name", "")
         
-        last_message = messages[-1]
-        if hasattr(last_message, 'type') and last_message.type == "tool":
-            name = getattr(last_message, 'name', None)
-            content = getattr(last_message, 'content', None)
-            
-            formatted = ToolResultFormatter.format_result(name, content)
-            
-            return [{
-                "type": "tool_result",
+        if event_name == "tool_start":
+            return {
+                "type": "tool_call",
                 "data": {
-                    "tool_call_id": getattr(last_message, 'tool_call_id', None),
-                    "name": name,
-                    **formatted
+                    "calls": [{
+                        "id": event.get("tool_call_id", ""),
+                        "name": name,
+                        "args_preview": ToolResultFormatter.get_args_preview(event.get("args", {}))
+                    }]
                 }
-            }]
+            }
+        
+        if event_name == "tool_end":
+            artifact = event.get("artifact")
+            if isinstance(artifact, dict):
+                formatted = ToolResultFormatter.format_payload(name, artifact)
+                if event.get("details") is not None:
+                    # 代码、译文等详情不写入 artifact，由中间件随事件单独发送
+                    formatted["details"] = event["details"]
+            else:
+                formatted = ToolResultFormatter.format_result(name, event.get("content"))
+            
+            data = {
+                "tool_call_id": event.get("tool_call_id"),
+                "name": name,
+                **formatted
+            }
+            if event.get("status") == "error":
+                data["status"] = "error"
+            return {"type": "tool_result", "data": data}
         
-        return []
+        return None
@@ -49,7 +49,19 @@ class ToolResultFormatter:
             格式化后的结果，包含 summary, links, details
         """
         parsed = ToolResultFormatter._parse_content(content)
+        return ToolResultFormatter.format_payload(tool_name, parsed)
+    
+    @staticmethod
+    def format_payload(tool_name: str, payload: Any) -> Dict[str, Any]:
+        """根据已解析的结构化结果格式化（工具直接提供的 artifact 无需再解析）
         
+        Args:
+            tool_name: 工具名称
+            payload: 结构化结果（dict/list）或纯文本
+            
+        Returns:
+            格式化后的结果，包含 summary, links, details
+        """
         formatters = {
             "web_search": ToolResultFormatter._format_web_search,
             "search_knowledge_base": ToolResultFormatter._format_knowledge,
@@ -68,12 +80,12 @@ class ToolResultFormatter:
         }
         
         formatter = formatters.get(tool_name, ToolResultFormatter._format_default)
-        return formatter(parsed)
+        return formatter(payload)
     
     @staticmethod
     def _parse_content(content: Any) -> Any:
-        """解析内容，尝试从 JSON 字符串解析"""
-        if isinstance(content, str):
+        """解析内容，尝试从 JSON 字符串解析（仅对形似 JSON 的文本尝试）"""
+        if isinstance(content, str) and content.lstrip()[:1] in ("{", "["):
             try:
                 return json.loads(content)
             except (json.JSONDecodeError, TypeError):
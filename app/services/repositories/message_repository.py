@@ -7,6 +7,7 @@ from app.models.message import Message
 from app.models.conversation import Conversation
 from app.schemas.message import MessageCreate
 from app.cache import redis_client, cache_aside
+from app.core.timing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +44,7 @@ class MessageRepository:
         return messages if messages else []
     
     @staticmethod
+    @traced("create_message")
     async def create_message(
         db: AsyncSession,
         conversation_id: int,
@@ -1,5 +1,34 @@
 from app.services.stream.stream_processor import StreamProcessor
-from app.services.stream.sse_emitter import SSEEmitter
-from app.services.stream.sse_heartbeat import sse_with_heartbeat, SSE_HEARTBEAT_INTERVAL
+from app.services.stream.fast_path import FastPathRouter, fast_path_router
+from app.services.stream.sse_emitter import (
+    SSEEmitter,
+    STREAM_FORMAT_SSE,
+    STREAM_FORMAT_NDJSON,
+    NDJSON_MEDIA_TYPE,
+)
+from app.services.stream.run_registry import RunRegistry, RunHandle, run_registry
+from app.services.stream.ws_session import ChatWebSocketSession
+from app.services.stream.sse_heartbeat import (
+    sse_with_heartbeat,
+    make_sse_heartbeat,
+    make_ndjson_heartbeat,
+    SSE_HEARTBEAT_INTERVAL,
+)
 
-__all__ = ["StreamProcessor", "SSEEmitter", "sse_with_heartbeat", "SSE_HEARTBEAT_INTERVAL"]
+__all__ = [
+    "StreamProcessor",
+    "FastPathRouter",
+    "fast_path_router",
+    "SSEEmitter",
+    "STREAM_FORMAT_SSE",
+    "STREAM_FORMAT_NDJSON",
+    "NDJSON_MEDIA_TYPE",
+    "RunRegistry",
+    "RunHandle",
+    "run_registry",
+    "ChatWebSocketSession",
+    "sse_with_heartbeat",
+    "make_sse_heartbeat",
+    "make_ndjson_heartbeat",
+    "SSE_HEARTBEAT_INTERVAL",
+]
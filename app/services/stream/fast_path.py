@@ -0,0 +1,144 @@
+"""快速路径 - 问候、闲聊等简单轮次直接流式调用模型
+
+不经过 Agent 图（摘要检查、文件系统/技能中间件、逐步 checkpoint），
+只读取一次线程状态、调用一次流式模型，结束后用一次 update_state
+把本轮的用户消息和回复追加到同一线程，后续完整 Agent 轮次看到的历史保持一致。
+回复固定由快速模型生成，结束时输出 model 事件，保存的回复按实际模型记录。
+"""
+
+import logging
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
+
+from app.agents.tool_selector import is_greeting
+from app.config import settings
+from app.llm.upstream_limiter import upstream_limiters
+from app.services.formatters.message_formatter import MessageFormatter
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_PROMPT = """你是一个友好的AI助手。用户正在和你打招呼或闲聊，请自然、简洁地回复。
+如果用户提出需要查询资料、处理文件或执行任务的请求，请告诉用户直接描述具体需求即可。"""
+
+PREFERENCES_KEY = "/preferences.txt"
+
+
+class FastPathRouter:
+    """简单轮次路由与处理"""
+
+    def __init__(self, formatter: Optional[MessageFormatter] = None):
+        self.formatter = formatter or MessageFormatter()
+
+    @staticmethod
+    def should_route(
+        content: str,
+        attachments: Optional[Sequence[str]],
+        enable_thinking: bool,
+        tools: Optional[Sequence[Any]],
+    ) -> bool:
+        """本地判断是否走快速路径：只由问候/致谢组成、未选中任何业务工具的短消息，且无附件、未开启深度思考
+
+        未选中工具本身不代表消息简单（实时、领域问题可能不含关键词），"继续"、"改短一点"等
+        短追问也依赖上下文和工具，因此只有 SMALL_TALK_PHRASES 中的问候/致谢才走快速路径。
+        """
+        if not settings.fast_path_enabled or attachments or enable_thinking:
+            return False
+        if tools is None or len(tools) > 0:
+            return False
+        if not 0 < len(content.strip()) <= settings.fast_path_max_chars:
+            return False
+        return is_greeting(content)
+
+    @staticmethod
+    def _recent_history(messages: List[BaseMessage]) -> List[BaseMessage]:
+        """取最近的纯文本问答，跳过工具调用与工具结果；摘要消息概括了更早的对话，始终保留在最前"""
+        summary: Optional[BaseMessage] = None
+        history: List[BaseMessage] = []
+        for message in messages:
+            if isinstance(message, HumanMessage) and message.additional_kwargs.get("lc_source") == "summarization":
+                summary = HumanMessage(content=message.content)
+            elif isinstance(message, HumanMessage):
+                history.append(HumanMessage(content=message.content))
+            elif isinstance(message, AIMessage) and not message.tool_calls and message.content:
+                history.append(AIMessage(content=message.content))
+        limit = settings.fast_path_history_messages
+        if limit <= 0:
+            return []
+        return [summary, *history[-limit:]] if summary is not None else history[-limit:]
+
+    @staticmethod
+    async def _load_preferences(agent_factory, user_id: Optional[int]) -> Optional[str]:
+        if user_id is None:
+            return None
+        try:
+            item = await agent_factory.get_store().aget((str(user_id), "memories"), PREFERENCES_KEY)
+        except Exception as e:
+            logger.debug(f"[FAST PATH] Failed to load preferences: {e}")
+            return None
+        if item is None:
+            return None
+        content = item.value.get("content")
+        return "\n".join(content) if isinstance(content, list) else content
+
+    @staticmethod
+    def _final_model_node(agent) -> str:
+        """模型步骤中最后执行的节点，写入状态时以它作为 as_node
+
+        after_model 钩子按中间件列表逆序执行，列表中第一个 after_model 节点最后执行；
+        没有 after_model 中间件时为 model 节点。不指定 as_node 时，新线程上会被推断为
+        __start__，checkpoint 留下待执行的 before_model 节点。
+        """
+        for name in agent.builder.nodes:
+            if name.endswith(".after_model"):
+                return name
+        return "model"
+
+    async def process(
+        self,
+        agent_factory,
+        conversation_id: int,
+        content: str,
+        user_id: Optional[int] = None,
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """直接流式调用快速模型，结束后把本轮消息写入线程状态
+
+        模型在产生任何输出前失败时抛出异常，由调用方回退到完整 Agent。
+        """
+        from app.llm.model_factory import ModelFactory
+
+        # 无业务工具的 Agent 图只用于读写线程状态，预热时已构建
+        agent = agent_factory.create_chat_agent(is_expert=False, enable_thinking=False, tools=[])
+        config, _ = agent_factory.get_agent_config(str(conversation_id), user_id=user_id)
+
+        state = await agent.aget_state(config)
+        history = self._recent_history((state.values or {}).get("messages", []))
+        system_prompt = FAST_PATH_PROMPT
+        preferences = await self._load_preferences(agent_factory, user_id)
+        if preferences:
+            system_prompt += f"\n\n用户偏好：\n{preferences}"
+
+        human = HumanMessage(content=content)
+        model = ModelFactory.get_general_model(is_expert=False, enable_thinking=False)
+        response: Optional[AIMessageChunk] = None
+        async with upstream_limiters.get(getattr(model, "model_name", "default")).slot():
+            async for chunk in model.astream([SystemMessage(content=system_prompt), *history, human]):
+                response = chunk if response is None else response + chunk
+                formatted = self.formatter.format_stream_message(chunk, {}, False)
+                if formatted:
+                    yield formatted
+
+        if response is None:
+            return
+        yield {"type": "model", "data": {"model": "fast", "model_name": getattr(model, "model_name", None)}}
+        reply = AIMessage(
+            content=response.content,
+            id=response.id,
+            response_metadata=response.response_metadata,
+            usage_metadata=response.usage_metadata,
+        )
+        await agent.aupdate_state(config, {"messages": [human, reply]}, as_node=self._final_model_node(agent))
+        logger.info(f"[FAST PATH] Handled conversation_id={conversation_id} with {len(history)} history messages")
+
+
+fast_path_router = FastPathRouter()
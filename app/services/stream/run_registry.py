@@ -0,0 +1,173 @@
+"""运行注册表 - 跟踪进行中的 Agent 运行，支持服务端取消"""
+
+import json
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from app.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+CANCEL_CHANNEL = "chat:run_cancel"
+
+
+@dataclass
+class RunHandle:
+    """进行中的运行"""
+    run_id: str
+    conversation_id: int
+    user_id: int
+    task: Optional[asyncio.Task] = None
+    on_cancel: Optional[Callable[[], None]] = None
+    cancel_requested: bool = False
+
+
+class RunRegistry:
+    """进程内运行注册表
+
+    - 路由在开始流式响应前登记运行（可附带取消回调，如退还限流额度）
+    - 流式生成器启动后绑定执行它的 Task
+    - 取消时标记 cancel_requested 并取消 Task，CancelledError 会沿
+      LangGraph 运行传播到挂起的模型/工具调用
+
+    运行不在本进程时，通过 Redis 广播取消请求，由持有该运行的 worker 执行。
+    """
+
+    def __init__(self):
+        self._runs: Dict[str, RunHandle] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def new_run_id() -> str:
+        return uuid.uuid4().hex
+
+    def register(
+        self,
+        run_id: str,
+        conversation_id: int,
+        user_id: int,
+        on_cancel: Optional[Callable[[], None]] = None,
+        task: Optional[asyncio.Task] = None,
+    ) -> RunHandle:
+        handle = RunHandle(
+            run_id=run_id,
+            conversation_id=conversation_id,
+            user_id=user_id,
+            task=task,
+            on_cancel=on_cancel,
+        )
+        self._runs[run_id] = handle
+        return handle
+
+    def attach(self, run_id: str, conversation_id: int, user_id: int) -> RunHandle:
+        """将运行绑定到当前 Task（未预先登记时自动登记）
+
+        流启动前已收到取消请求时立即取消当前 Task，CancelledError 在下一次 await 时抛出。
+        """
+        handle = self._runs.get(run_id)
+        if handle is None:
+            handle = self.register(run_id, conversation_id, user_id)
+        handle.task = asyncio.current_task()
+        if handle.cancel_requested and handle.task is not None:
+            logger.info(f"[RUN] Run cancelled before start, run_id={run_id}")
+            handle.task.cancel()
+        return handle
+
+    def get(self, run_id: str) -> Optional[RunHandle]:
+        return self._runs.get(run_id)
+
+    def unregister(self, run_id: str) -> None:
+        self._runs.pop(run_id, None)
+
+    def cancel(
+        self,
+        run_id: str,
+        conversation_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> bool:
+        """取消本进程内的运行
+
+        Returns:
+            bool: 是否找到并取消了运行
+        """
+        handle = self._runs.get(run_id)
+        if handle is None:
+            return False
+        if conversation_id is not None and handle.conversation_id != conversation_id:
+            return False
+        if user_id is not None and handle.user_id != user_id:
+            return False
+        if handle.cancel_requested:
+            return True
+
+        handle.cancel_requested = True
+        if handle.on_cancel is not None:
+            try:
+                handle.on_cancel()
+            except Exception as e:
+                logger.warning(f"[RUN] on_cancel callback failed, run_id={run_id}: {e}")
+        if handle.task is not None and not handle.task.done():
+            handle.task.cancel()
+        logger.info(f"[RUN] Run cancelled, run_id={run_id}, conversation_id={handle.conversation_id}")
+        return True
+
+    async def request_cancel(self, run_id: str, conversation_id: int, user_id: int) -> bool:
+        """取消运行：本进程命中则直接取消，否则广播给其他 worker
+
+        Returns:
+            bool: 是否在本进程内完成取消
+        """
+        if self.cancel(run_id, conversation_id, user_id):
+            return True
+        try:
+            await redis_client.client.publish(CANCEL_CHANNEL, json.dumps({
+                "run_id": run_id,
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+            }))
+        except Exception as e:
+            logger.warning(f"[RUN] Failed to broadcast cancel, run_id={run_id}: {e}")
+        return False
+
+    async def start_listener(self) -> None:
+        """启动跨 worker 取消监听"""
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen(self) -> None:
+        pubsub = redis_client.client.pubsub()
+        try:
+            await pubsub.subscribe(CANCEL_CHANNEL)
+            logger.info("[RUN] Cancel listener started")
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    payload = json.loads(message["data"])
+                    self.cancel(payload["run_id"], payload.get("conversation_id"), payload.get("user_id"))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"[RUN] Invalid cancel message: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[RUN] Cancel listener stopped: {e}")
+        finally:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+
+run_registry = RunRegistry()
@@ -1,19 +1,34 @@
 import json
 import asyncio
 import logging
-from typing import AsyncGenerator, Optional, List
+from typing import AsyncGenerator, Optional, List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.metrics import track_stream
+from app.core.timing import current_timing, span
 from app.services.stream.stream_processor import StreamProcessor
+from app.services.stream.run_registry import run_registry
 from app.services.repositories.message_repository import MessageRepository
 from app.schemas.message import MessageCreate
 
 logger = logging.getLogger(__name__)
 
+STREAM_FORMAT_SSE = "sse"
+STREAM_FORMAT_NDJSON = "ndjson"
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# SSE 协议下这些事件的 content 为嵌套的 JSON 字符串（保持前端兼容）
+_NESTED_JSON_EVENTS = ("tool_call", "tool_call_delta", "tool_result", "model", "timing")
+
 
 class SSEEmitter:
-    """SSE 输出器，负责生成 SSE 格式的流式响应"""
-    
+    """SSE 输出器，负责生成 SSE 格式的流式响应
+
+    内部先产出统一的事件模型 {"type": ..., "data": {...}}，
+    再由 SSE / NDJSON 编码器各做一次序列化。
+    """
+
     def __init__(
         self,
         stream_processor: Optional[StreamProcessor] = None,
@@ -21,13 +36,37 @@ class SSEEmitter:
     ):
         self.stream_processor = stream_processor or StreamProcessor()
         self.message_repository = message_repository or MessageRepository()
-    
+
     @staticmethod
     def make_sse_event(event_type: str, content: str = "") -> str:
         """生成 SSE 格式的事件"""
         return f"data: {json.dumps({'type': event_type, 'data': {'content': content}}, ensure_ascii=False)}\n\n"
-    
-    async def generate_sse_stream(
+
+    @staticmethod
+    def make_ndjson_event(event_type: str, data: Optional[Dict[str, Any]] = None) -> str:
+        """生成 NDJSON 格式的事件（单次编码，data 为原生对象）"""
+        event = {"type": event_type}
+        if data is not None:
+            event["data"] = data
+        return json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    @classmethod
+    def encode_sse(cls, event: Dict[str, Any]) -> str:
+        """将事件模型编码为 SSE 帧"""
+        event_type = event["type"]
+        if event_type == "done":
+            return "data: [DONE]\n\n"
+        data = event.get("data") or {}
+        if event_type in _NESTED_JSON_EVENTS:
+            return cls.make_sse_event(event_type, json.dumps(data, ensure_ascii=False))
+        return cls.make_sse_event(event_type, data.get("content", ""))
+
+    @classmethod
+    def encode_ndjson(cls, event: Dict[str, Any]) -> str:
+        """将事件模型编码为 NDJSON 行"""
+        return cls.make_ndjson_event(event["type"], event.get("data"))
+
+    async def generate_events(
         self,
         db: AsyncSession,
         conversation_id: int,
@@ -35,20 +74,31 @@ class SSEEmitter:
         content: str,
         is_expert: bool = False,
         enable_thinking: bool = False,
-        attachments: Optional[List[str]] = None
-    ) -> AsyncGenerator[str, None]:
-        """生成 SSE 格式的流式响应
-        
-        封装了完整的 SSE 流式响应逻辑，包括：
+        attachments: Optional[List[str]] = None,
+        run_id: Optional[str] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """生成与传输格式无关的事件流
+
+        封装了完整的流式响应逻辑，包括：
         - 调用 StreamProcessor 获取原始流
-        - 转换为 SSE 格式
+        - 转换为统一的事件模型
         - 累积响应并保存到数据库
+
+        传入 run_id 时运行登记到 run_registry，可被服务端取消：
+        取消后保存已生成的部分回复，并输出 cancelled / done 事件。
+        请求允许查看耗时明细时，done 之前输出 timing 事件（各阶段耗时，见 app.core.timing）。
         """
         full_response = ""
         thinking_content = ""
         chunk_count = 0
         tool_calls = []
-        
+        # 实际生成回复的模型（快速路径固定为快速模型），默认按用户选择记录
+        model = "expert" if is_expert else "fast"
+        hedged = False
+        run = run_registry.attach(run_id, conversation_id, user_id) if run_id else None
+        # 逐 token 的调试日志：级别未开启时跳过 f-string 构造
+        debug = logger.isEnabledFor(logging.DEBUG)
+
         try:
             async for event in self.stream_processor.process_message(
                 conversation_id=conversation_id,
@@ -60,26 +110,33 @@ class SSEEmitter:
             ):
                 if isinstance(event, dict):
                     event_type = event.get("type")
-                    logger.debug(f"[SSE] Processing event: type={event_type}")
-                    
+                    if debug:
+                        logger.debug(f"[SSE] Processing event: type={event_type}")
+
                     if event_type == "thinking":
                         thinking_chunk = event.get("data", {}).get("content", "")
                         thinking_content += thinking_chunk
-                        logger.debug(f"[SSE] Sending thinking chunk: {len(thinking_chunk)} chars")
-                        yield self.make_sse_event("thinking", thinking_chunk)
-                        
+                        if debug:
+                            logger.debug(f"[SSE] Sending thinking chunk: {len(thinking_chunk)} chars")
+                        yield {"type": "thinking", "data": {"content": thinking_chunk}}
+
                     elif event_type == "thinking_end":
-                        logger.debug(f"[SSE] Sending thinking_end")
-                        yield self.make_sse_event("thinking_end")
-                        
+                        if debug:
+                            logger.debug("[SSE] Sending thinking_end")
+                        yield {"type": "thinking_end", "data": {"content": ""}}
+
                     elif event_type == "token":
                         token_content = event.get("data", {}).get("content", "")
                         if token_content:
                             full_response += token_content
                             chunk_count += 1
-                            logger.debug(f"[SSE] Sending chunk {chunk_count}: {len(token_content)} chars")
-                            yield self.make_sse_event("content", token_content)
-                    
+                            if debug:
+                                logger.debug(f"[SSE] Sending chunk {chunk_count}: {len(token_content)} chars")
+                            yield {"type": "content", "data": {"content": token_content}}
+
+                    elif event_type == "tool_call_delta":
+                        yield {"type": "tool_call_delta", "data": event.get("data", {})}
+
                     elif event_type == "tool_call":
                         calls = event.get("data", {}).get("calls", [])
                         for call in calls:
@@ -87,48 +144,106 @@ class SSEEmitter:
                             if tool_id:
                                 placeholder = f"[TOOL_CALL:{tool_id}]"
                                 full_response += placeholder
-                                yield self.make_sse_event("content", placeholder)
+                                yield {"type": "content", "data": {"content": placeholder}}
                             tool_calls.append({
                                 "id": call.get("id", ""),
                                 "name": call.get("name", ""),
                                 "status": "pending"
                             })
-                        yield self.make_sse_event("tool_call", json.dumps({"calls": calls}, ensure_ascii=False))
-                    
+                        yield {"type": "tool_call", "data": {"calls": calls}}
+
                     elif event_type == "tool_result":
                         data = event.get("data", {})
                         tool_call_id = data.get("tool_call_id")
                         for tc in tool_calls:
                             if tc.get("id") == tool_call_id:
-                                tc["status"] = "success"
+                                tc["status"] = data.get("status", "success")
                                 tc["summary"] = data.get("summary", "")
                                 tc["links"] = data.get("links", [])
                                 tc["details"] = data.get("details", "")
                                 break
-                        yield self.make_sse_event("tool_result", json.dumps(data, ensure_ascii=False))
-                    
+                        yield {"type": "tool_result", "data": data}
+
+                    elif event_type == "model":
+                        model = event.get("data", {}).get("model", model)
+                        hedged = hedged or bool(event.get("data", {}).get("hedged"))
+                        yield {"type": "model", "data": event.get("data", {})}
+
                     elif event_type == "error":
-                        yield self.make_sse_event("error", event.get("data", {}).get("message", ""))
-                        
+                        yield {"type": "error", "data": {"content": event.get("data", {}).get("message", "")}}
+
                 else:
                     full_response += event
                     chunk_count += 1
-                    logger.debug(f"[SSE] Sending chunk {chunk_count}: {len(event)} chars")
-                    yield self.make_sse_event("content", event)
+                    if debug:
+                        logger.debug(f"[SSE] Sending chunk {chunk_count}: {len(event)} chars")
+                    yield {"type": "content", "data": {"content": event}}
                 await asyncio.sleep(0.01)
-            
+
             logger.info(f"[SSE] Stream complete, total chunks: {chunk_count}, response length: {len(full_response)}")
-            
+
             if thinking_content:
                 logger.debug(f"[SSE] Sending thinking_end, total thinking: {len(thinking_content)} chars")
-                yield self.make_sse_event("thinking_end")
-            
-            extra_data = {"model": "expert" if is_expert else "fast"}
-            if thinking_content:
-                extra_data["thinking_content"] = thinking_content
-            if tool_calls:
-                extra_data["tool_calls"] = tool_calls
-            
+                yield {"type": "thinking_end", "data": {"content": ""}}
+
+            await self._save_response(
+                db, conversation_id, user_id, full_response, thinking_content, tool_calls, model, hedged
+            )
+            timing = current_timing()
+            if timing is not None and timing.expose:
+                yield {"type": "timing", "data": timing.summary()}
+            yield {"type": "done"}
+        except asyncio.CancelledError:
+            if run is None or not run.cancel_requested:
+                logger.info(f"[SSE] Request cancelled, conversation_id={conversation_id}")
+                raise
+
+            # 服务端取消：吞掉本次取消，保存部分输出后正常结束流
+            asyncio.current_task().uncancel()
+            logger.info(
+                f"[SSE] Run cancelled by request, run_id={run_id}, "
+                f"partial response length: {len(full_response)}"
+            )
+            for tc in tool_calls:
+                if tc["status"] == "pending":
+                    tc["status"] = "cancelled"
+            await self._save_response(
+                db, conversation_id, user_id, full_response, thinking_content, tool_calls, model, hedged,
+                cancelled=True
+            )
+            yield {"type": "cancelled", "data": {"run_id": run_id}}
+            timing = current_timing()
+            if timing is not None and timing.expose:
+                yield {"type": "timing", "data": timing.summary()}
+            yield {"type": "done"}
+        finally:
+            if run_id:
+                run_registry.unregister(run_id)
+
+    async def _save_response(
+        self,
+        db: AsyncSession,
+        conversation_id: int,
+        user_id: int,
+        full_response: str,
+        thinking_content: str,
+        tool_calls: List[Dict[str, Any]],
+        model: str,
+        hedged: bool = False,
+        cancelled: bool = False
+    ) -> None:
+        """保存助手回复，model 为实际生成回复的模型（expert / fast），hedged 表示有调用被对冲到快速模型"""
+        extra_data = {"model": model}
+        if hedged:
+            extra_data["hedged"] = True
+        if thinking_content:
+            extra_data["thinking_content"] = thinking_content
+        if tool_calls:
+            extra_data["tool_calls"] = tool_calls
+        if cancelled:
+            extra_data["cancelled"] = True
+
+        with span("persist"):
             await self.message_repository.create_message(
                 db,
                 conversation_id=conversation_id,
@@ -139,7 +254,43 @@ class SSEEmitter:
                 ),
                 user_id=user_id
             )
-            yield "data: [DONE]\n\n"
-        except asyncio.CancelledError:
-            logger.info(f"[SSE] Request cancelled, conversation_id={conversation_id}")
-            raise
+
+    async def generate_sse_stream(
+        self,
+        db: AsyncSession,
+        conversation_id: int,
+        user_id: int,
+        content: str,
+        is_expert: bool = False,
+        enable_thinking: bool = False,
+        attachments: Optional[List[str]] = None,
+        run_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """生成 SSE 格式的流式响应"""
+        events = self.generate_events(
+            db, conversation_id, user_id, content, is_expert, enable_thinking, attachments, run_id
+        )
+        async for event in track_stream(events, STREAM_FORMAT_SSE):
+            yield self.encode_sse(event)
+
+    async def generate_ndjson_stream(
+        self,
+        db: AsyncSession,
+        conversation_id: int,
+        user_id: int,
+        content: str,
+        is_expert: bool = False,
+        enable_thinking: bool = False,
+        attachments: Optional[List[str]] = None,
+        run_id: Optional[str] = None
+    ) -> AsyncGenerator[str, None]:
+        """生成 NDJSON 格式的流式响应
+
+        每行一个 JSON 事件，tool_call / tool_result 的 data 直接内嵌为对象，
+        不再二次编码为字符串。
+        """
+        events = self.generate_events(
+            db, conversation_id, user_id, content, is_expert, enable_thinking, attachments, run_id
+        )
+        async for event in track_stream(events, STREAM_FORMAT_NDJSON):
+            yield self.encode_ndjson(event)
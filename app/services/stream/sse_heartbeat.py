@@ -1,14 +1,25 @@
 import asyncio
 import json
 import time
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Callable, Optional
 
 SSE_HEARTBEAT_INTERVAL = 15
 
 
+def make_sse_heartbeat() -> str:
+    """生成 SSE 格式的心跳消息"""
+    return f"data: {json.dumps({'type': 'heartbeat', 'timestamp': time.time()}, ensure_ascii=False)}\n\n"
+
+
+def make_ndjson_heartbeat() -> str:
+    """生成 NDJSON 格式的心跳消息"""
+    return json.dumps({"type": "heartbeat", "timestamp": time.time()}, separators=(",", ":")) + "\n"
+
+
 async def sse_with_heartbeat(
     stream_generator: AsyncGenerator[str, None],
-    heartbeat_interval: int = SSE_HEARTBEAT_INTERVAL
+    heartbeat_interval: int = SSE_HEARTBEAT_INTERVAL,
+    make_heartbeat: Optional[Callable[[], str]] = None
 ) -> AsyncGenerator[str, None]:
     """带心跳的 SSE 生成器
     
@@ -18,10 +29,12 @@ async def sse_with_heartbeat(
     Args:
         stream_generator: 原始 SSE 数据生成器
         heartbeat_interval: 心跳间隔（秒）
+        make_heartbeat: 心跳消息生成函数，默认为 SSE 格式
         
     Yields:
         SSE 格式的数据或心跳消息
     """
+    make_heartbeat = make_heartbeat or make_sse_heartbeat
     queue: asyncio.Queue = asyncio.Queue()
     stream_done = False
     
@@ -44,8 +57,7 @@ async def sse_with_heartbeat(
                     timeout=heartbeat_interval + 1
                 )
                 if not stream_done:
-                    heartbeat_msg = f"data: {json.dumps({'type': 'heartbeat', 'timestamp': time.time()}, ensure_ascii=False)}\n\n"
-                    await queue.put(heartbeat_msg)
+                    await queue.put(make_heartbeat())
             except asyncio.CancelledError:
                 break
     
@@ -1,10 +1,17 @@
 import asyncio
 import logging
+import time
 from typing import AsyncGenerator, Dict, Any, Optional, List
 
-from app.services.formatters.message_formatter import MessageFormatter
+from app.services.formatters.message_formatter import MessageFormatter, ToolCallDeltaBuffer
 from app.agents.error_classifier import AgentErrorClassifier
+from app.agents.memory_store import memory_run_scope
+from app.agents.tool_selector import tool_selector
+from app.llm.upstream_limiter import upstream_caller_var
+from app.services.stream.fast_path import fast_path_router
 from app.config import settings
+from app.core.metrics import observe_agent_run
+from app.core.timing import current_timing
 
 logger = logging.getLogger(__name__)
 
@@ -23,26 +30,36 @@ class StreamProcessor:
         enable_thinking: bool,
         context = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        """统一的 Agent 流处理逻辑"""
+        """统一的 Agent 流处理逻辑（单遍）
         
-        async for stream_mode, data in agent.astream(
-            {"messages": [{"role": "user", "content": full_context}]},
-            config,
-            context=context,
-            stream_mode=["messages", "updates"]
-        ):
-            if stream_mode == "messages":
-                message, metadata = data
-                formatted = self.formatter.format_stream_message(message, metadata, enable_thinking)
-                if formatted:
-                    yield formatted
-            elif stream_mode == "updates":
-                for source, update in data.items():
-                    if source in ("model", "tools"):
-                        formatted_list = self.formatter.format_update({source: update}, enable_thinking)
-                        for formatted in formatted_list:
-                            if formatted.get("type") not in ("unknown", None):
-                                yield formatted
+        - messages 流：文本、思考与工具调用参数增量
+        - custom 流：工具开始（调用确认）与工具结束（结构化结果摘要）
+        
+        整个运行处于同一记忆缓存作用域内，热点记忆文件只读取一次。
+        """
+        tool_call_buffer = ToolCallDeltaBuffer()
+        
+        with memory_run_scope():
+            async for stream_mode, data in agent.astream(
+                {"messages": [{"role": "user", "content": full_context}]},
+                config,
+                context=context,
+                stream_mode=["messages", "custom"]
+            ):
+                if stream_mode == "messages":
+                    message, metadata = data
+                    answered_by = self._answering_model(message)
+                    if answered_by:
+                        yield answered_by
+                    formatted = self.formatter.format_stream_message(
+                        message, metadata, enable_thinking, tool_call_buffer
+                    )
+                    if formatted:
+                        yield formatted
+                elif stream_mode == "custom":
+                    formatted = self.formatter.format_custom_event(data)
+                    if formatted:
+                        yield formatted
     
     async def process_message(
         self,
@@ -55,8 +72,14 @@ class StreamProcessor:
         user_id: Optional[int] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """处理用户消息 - 支持多模态输入和Agent工具调用"""
+        started = time.perf_counter()
+        timing = current_timing()
+        # 未正常结束或出错时（客户端断开、运行被取消）记为 cancelled
+        run_path, outcome = "agent", "cancelled"
         try:
             logger.info(f"[STREAM] 开始处理消息: conversation_id={conversation_id}, user_id={user_id}")
+            # 上游限流按用户公平排队
+            upstream_caller_var.set(f"user:{user_id}" if user_id is not None else f"conversation:{conversation_id}")
 
             full_context = self._build_context(content, attachments)
             logger.debug(f"[STREAM] 上下文准备完成，长度: {len(full_context)}")
@@ -65,9 +88,43 @@ class StreamProcessor:
                 from app.agents.agent_factory import AgentFactory
                 agent_factory = AgentFactory
             
-            agent = agent_factory.create_chat_agent(
+            tools = None
+            if settings.tool_selector_enabled:
+                tools = tool_selector.select(content, attachments, conversation_id=conversation_id)
+
+            if (
+                fast_path_router.should_route(content, attachments, enable_thinking, tools)
+                and not self._matches_skill(agent_factory, content)
+            ):
+                handled = False
+                try:
+                    async with asyncio.timeout(settings.agent_timeout):
+                        async for event in fast_path_router.process(
+                            agent_factory, conversation_id, full_context, user_id=user_id
+                        ):
+                            handled = True
+                            run_path = "fast_path"
+                            yield event
+                    if handled:
+                        outcome = "ok"
+                        return
+                except asyncio.TimeoutError:
+                    run_path, outcome = "fast_path", "timeout"
+                    logger.error(f"[STREAM] 快速路径超时，conversation_id={conversation_id}")
+                    yield {"type": "error", "data": {"message": "请求处理超时，请稍后重试"}}
+                    return
+                except Exception as e:
+                    if handled:
+                        raise
+                    run_path = "agent"
+                    logger.warning(f"[STREAM] 快速路径失败，回退到完整 Agent: {e}")
+
+            # 缓存未命中时 create_agent 同步编译图（数十毫秒），放到线程中避免阻塞事件循环
+            agent = await asyncio.to_thread(
+                agent_factory.create_chat_agent,
                 is_expert=is_expert,
-                enable_thinking=enable_thinking
+                enable_thinking=enable_thinking,
+                tools=tools
             )
             config, context = agent_factory.get_agent_config(str(conversation_id), user_id=user_id)
 
@@ -80,13 +137,16 @@ class StreamProcessor:
                     ):
                         yield event
             except asyncio.TimeoutError:
+                outcome = "timeout"
                 logger.error(f"[STREAM] Agent执行超时，conversation_id={conversation_id}")
                 yield {"type": "error", "data": {"message": "请求处理超时，请稍后重试"}}
                 return
 
+            outcome = "ok"
             logger.info(f"[STREAM] Agent流式执行完成")
             
         except Exception as e:
+            outcome = "error"
             error_type = AgentErrorClassifier.classify(e)
             logger.error(f"[STREAM] 处理消息时出错: type={error_type.value}, error={str(e)}", exc_info=True)
             user_message = AgentErrorClassifier.get_user_message(
@@ -94,7 +154,33 @@ class StreamProcessor:
                 is_production=(settings.app_env == "production")
             )
             yield {"type": "error", "data": {"message": user_message}}
+        finally:
+            duration = time.perf_counter() - started
+            observe_agent_run(run_path, outcome, duration)
+            if timing is not None:
+                timing.add("process_message", started, duration, path=run_path, outcome=outcome)
     
+    @staticmethod
+    def _answering_model(message) -> Optional[Dict[str, Any]]:
+        """对冲模型在胜出方首个 chunk 上标记实际回答的模型，转换为 model 事件"""
+        hedge = (getattr(message, "response_metadata", None) or {}).get("hedge")
+        if not hedge:
+            return None
+        return {
+            "type": "model",
+            "data": {
+                "model": "fast" if hedge.get("fallback") else "expert",
+                "model_name": hedge.get("model_name"),
+                "hedged": bool(hedge.get("fallback")),
+            },
+        }
+
+    @staticmethod
+    def _matches_skill(agent_factory, content: str) -> bool:
+        """匹配到技能的请求需要完整 Agent 执行技能流程"""
+        get_skills_index = getattr(agent_factory, "get_skills_index", None)
+        return get_skills_index is not None and get_skills_index().match(content) is not None
+
     def _build_context(self, content: str, attachments: Optional[List[str]]) -> str:
         """构建消息上下文"""
         context_parts = [content]
@@ -0,0 +1,249 @@
+"""WebSocket 聊天会话 - 单连接复用多个对话与并发运行"""
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from app.config import settings
+from app.core.database import get_db_session
+from app.core.metrics import track_stream
+from app.models.user import User
+from app.schemas.message import ChatRequest, MessageCreate
+from app.services.conversation_service import conversation_service
+from app.services.stream.sse_emitter import SSEEmitter
+from app.services.stream.run_registry import run_registry
+
+logger = logging.getLogger(__name__)
+
+WS_POLICY_VIOLATION = 1008
+
+
+class ChatWebSocketSession:
+    """WebSocket 聊天会话
+
+    连接建立时完成一次认证，之后通过消息类型多路复用：
+    - chat: 在指定对话上发起一次运行（可携带 run_id / interrupt）
+    - cancel: 按 run_id 取消运行
+    - interrupt: 取消指定对话上的全部运行
+    - ping: 保活
+
+    每次运行使用独立的数据库会话，并复用 SSEEmitter 的事件模型，
+    服务端帧格式为 {"type", "run_id", "conversation_id", "data"}。
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: User,
+        sse_emitter: Optional[SSEEmitter] = None,
+        session_factory: Optional[Callable] = None,
+        max_concurrent_runs: Optional[int] = None,
+        token_expires_at: Optional[float] = None,
+        rate_limiter: Optional[Callable[[], bool]] = None,
+        rate_limit_release: Optional[Callable[[], None]] = None,
+    ):
+        self.websocket = websocket
+        self.user_id = user.id
+        self.sse_emitter = sse_emitter or SSEEmitter()
+        self.session_factory = session_factory or get_db_session
+        self.max_concurrent_runs = max_concurrent_runs or settings.ws_max_concurrent_runs
+        self.token_expires_at = token_expires_at
+        self.rate_limiter = rate_limiter
+        self.rate_limit_release = rate_limit_release
+        self._runs: Dict[str, asyncio.Task] = {}
+        self._run_conversations: Dict[str, int] = {}
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def send_event(
+        self,
+        event_type: str,
+        data: Optional[Dict[str, Any]] = None,
+        run_id: Optional[str] = None,
+        conversation_id: Optional[int] = None,
+    ) -> None:
+        """发送一帧事件（单次 JSON 编码，多个运行共享同一连接需串行写入）"""
+        frame: Dict[str, Any] = {"type": event_type}
+        if run_id is not None:
+            frame["run_id"] = run_id
+            frame["conversation_id"] = conversation_id
+        if data is not None:
+            frame["data"] = data
+        async with self._send_lock:
+            await self.websocket.send_text(
+                json.dumps(frame, ensure_ascii=False, separators=(",", ":"))
+            )
+
+    async def send_error(self, message: str, code: str, run_id: Optional[str] = None,
+                         conversation_id: Optional[int] = None) -> None:
+        await self.send_event("error", {"content": message, "code": code}, run_id, conversation_id)
+
+    async def serve(self) -> None:
+        """消息主循环，直到客户端断开"""
+        try:
+            while not self._closed:
+                raw = await self.websocket.receive_text()
+                try:
+                    message = json.loads(raw)
+                except json.JSONDecodeError:
+                    await self.send_error("Invalid JSON", "invalid_message")
+                    continue
+                if not isinstance(message, dict):
+                    await self.send_error("Message must be a JSON object", "invalid_message")
+                    continue
+                await self.handle_message(message)
+        except WebSocketDisconnect:
+            logger.info(f"[WS] Client disconnected, user_id={self.user_id}")
+        finally:
+            await self.close()
+
+    async def handle_message(self, message: Dict[str, Any]) -> None:
+        """分发客户端消息"""
+        message_type = message.get("type")
+
+        if message_type == "chat":
+            await self._start_run(message)
+        elif message_type == "cancel":
+            run_id = message.get("run_id")
+            if not await self.cancel_run(run_id):
+                await self.send_error("Run not found", "run_not_found", run_id=run_id)
+        elif message_type == "interrupt":
+            conversation_id = message.get("conversation_id")
+            cancelled = await self.interrupt_conversation(conversation_id)
+            await self.send_event("interrupted", {"conversation_id": conversation_id, "cancelled": cancelled})
+        elif message_type == "ping":
+            await self.send_event("pong", {"timestamp": time.time()})
+        else:
+            await self.send_error(f"Unknown message type: {message_type}", "invalid_message")
+
+    async def _start_run(self, message: Dict[str, Any]) -> None:
+        if self.token_expires_at is not None and time.time() >= self.token_expires_at:
+            await self.send_error("Token expired", "token_expired")
+            self._closed = True
+            await self.websocket.close(code=WS_POLICY_VIOLATION)
+            return
+
+        try:
+            chat_request = ChatRequest.model_validate(message)
+        except ValidationError as e:
+            await self.send_error(str(e), "invalid_message")
+            return
+
+        run_id = chat_request.run_id or uuid.uuid4().hex
+        conversation_id = chat_request.conversation_id
+
+        if run_id in self._runs or run_registry.get(run_id):
+            await self.send_error("Duplicate run_id", "duplicate_run", run_id, conversation_id)
+            return
+
+        if conversation_id in self._run_conversations.values():
+            if not message.get("interrupt"):
+                await self.send_error("Conversation has an active run", "conversation_busy", run_id, conversation_id)
+                return
+            await self.interrupt_conversation(conversation_id)
+
+        if len(self._runs) >= self.max_concurrent_runs:
+            await self.send_error("Too many concurrent runs", "too_many_runs", run_id, conversation_id)
+            return
+
+        if self.rate_limiter is not None and not self.rate_limiter():
+            await self.send_error("请求过于频繁，请稍后再试", "rate_limited", run_id, conversation_id)
+            return
+
+        self._run_conversations[run_id] = conversation_id
+        task = asyncio.create_task(self._run(run_id, chat_request))
+        self._runs[run_id] = task
+        # 登记到全局注册表，HTTP 取消接口同样可以取消 WebSocket 运行
+        run_registry.register(
+            run_id, conversation_id, self.user_id, on_cancel=self.rate_limit_release, task=task
+        )
+        # 任务在开始执行前被取消时不会进入 _run 的 finally，统一在完成回调中注销
+        task.add_done_callback(lambda _: run_registry.unregister(run_id))
+
+    async def _run(self, run_id: str, chat_request: ChatRequest) -> None:
+        conversation_id = chat_request.conversation_id
+        try:
+            async with self.session_factory() as db:
+                conv = await conversation_service.get_conversation(
+                    db, conversation_id=conversation_id, user_id=self.user_id
+                )
+                if not conv:
+                    await self.send_error("Conversation not found", "not_found", run_id, conversation_id)
+                    return
+
+                await self.sse_emitter.message_repository.create_message(
+                    db,
+                    conversation_id=conversation_id,
+                    message_create=MessageCreate(
+                        role="user",
+                        content=chat_request.content,
+                        extra_data={"attachments": chat_request.attachments} if chat_request.attachments else None
+                    ),
+                    user_id=self.user_id
+                )
+                # 先提交用户消息，避免运行被取消时一起回滚
+                await db.commit()
+
+                await self.send_event("run_started", None, run_id, conversation_id)
+                events = self.sse_emitter.generate_events(
+                    db,
+                    conversation_id=conversation_id,
+                    user_id=self.user_id,
+                    content=chat_request.content,
+                    is_expert=chat_request.is_expert,
+                    enable_thinking=chat_request.enable_thinking,
+                    attachments=chat_request.attachments,
+                    run_id=run_id
+                )
+                async for event in track_stream(events, "websocket"):
+                    await self.send_event(event["type"], event.get("data"), run_id, conversation_id)
+        except asyncio.CancelledError:
+            logger.info(f"[WS] Run cancelled, run_id={run_id}, conversation_id={conversation_id}")
+            if not self._closed:
+                try:
+                    await self.send_event("cancelled", None, run_id, conversation_id)
+                except Exception:
+                    pass
+            raise
+        except Exception as e:
+            logger.error(f"[WS] Run failed, run_id={run_id}: {e}", exc_info=True)
+            if not self._closed:
+                await self.send_error("Run failed", "run_failed", run_id, conversation_id)
+        finally:
+            self._runs.pop(run_id, None)
+            self._run_conversations.pop(run_id, None)
+
+    async def cancel_run(self, run_id: Optional[str]) -> bool:
+        """取消指定运行并等待其清理完成（保存部分输出并退还限流额度）"""
+        task = self._runs.get(run_id) if run_id is not None else None
+        if task is None:
+            return False
+        if not run_registry.cancel(run_id):
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def interrupt_conversation(self, conversation_id: Optional[int]) -> int:
+        """取消指定对话上的全部运行，返回取消数量"""
+        run_ids = [
+            run_id for run_id, conv_id in list(self._run_conversations.items())
+            if conv_id == conversation_id
+        ]
+        for run_id in run_ids:
+            await self.cancel_run(run_id)
+        return len(run_ids)
+
+    async def close(self) -> None:
+        """连接关闭时取消全部运行"""
+        self._closed = True
+        tasks = list(self._runs.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
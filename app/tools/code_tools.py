@@ -1,12 +1,14 @@
 """编程工具 - 代码生成和协助"""
 
 import json
+from typing import Any, Dict, Tuple
 from langchain_core.tools import tool
+from app.cache.tool_cache import tool_result_cache
 from app.llm.model_factory import ModelFactory
 
 
-@tool
-async def code_assist(prompt: str, language: str = "python") -> str:
+@tool(response_format="content_and_artifact")
+async def code_assist(prompt: str, language: str = "python") -> Tuple[str, Dict[str, Any]]:
     """
     编程工具
     适用场景：当用户需要编写代码、解决编程问题、理解代码或优化代码时使用此工具。
@@ -34,18 +36,35 @@ async def code_assist(prompt: str, language: str = "python") -> str:
         {"role": "user", "content": prompt}
     ]
     try:
-        result = await model.ainvoke(messages)
+        async def generate() -> Any:
+            result = await model.ainvoke(messages)
+            return result.content
         
-        return json.dumps({
+        code = await tool_result_cache.get_or_compute(
+            "code_assist",
+            model.model_name,
+            {"prompt": prompt, "language": language.lower()},
+            generate,
+        )
+        
+        payload = {
             "type": "code",
             "language": language,
             "prompt": prompt,
-            "code": result.content
-        })
+            "code": code
+        }
     except Exception as e:
-        return json.dumps({
+        payload = {
             "type": "error",
             "language": language,
             "prompt": prompt,
             "error": str(e)
-        })
+        }
+    # artifact 只保留摘要字段；代码正文放在 details 中，
+    # 由 ToolStreamEventsMiddleware 随 tool_end 事件发送，不写入 checkpoint
+    summary = {"type": payload["type"], "language": language}
+    if "error" in payload:
+        summary["error"] = payload["error"][:200]
+    else:
+        summary["details"] = payload["code"]
+    return json.dumps(payload), summary
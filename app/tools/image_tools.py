@@ -1,12 +1,13 @@
 """图像工具 - 图像生成和编辑"""
 
 import json
+from typing import Any, Dict, Tuple
 from langchain_core.tools import tool
 from app.llm.model_factory import ModelFactory
 
 
-@tool
-async def generate_image(prompt: str, size: str = "1664*928", n: int = 1) -> str:
+@tool(response_format="content_and_artifact")
+async def generate_image(prompt: str, size: str = "1664*928", n: int = 1) -> Tuple[str, Dict[str, Any]]:
     """
     根据文本描述生成图像。
 
@@ -24,17 +25,27 @@ async def generate_image(prompt: str, size: str = "1664*928", n: int = 1) -> str
     model = ModelFactory.get_text_to_image_model()
     urls = await model.agenerate(prompt=prompt, size=size, n=n)
     
-    return json.dumps({
+    payload = {
         "type": "image_generated",
         "prompt": prompt,
         "size": size,
         "urls": urls,
         "count": len(urls)
-    })
+    }
+    # artifact 只保留摘要与链接；提示词放在 details 中，
+    # 由 ToolStreamEventsMiddleware 随 tool_end 事件发送，不写入 checkpoint
+    summary = {
+        "type": "image_generated",
+        "size": size,
+        "urls": urls,
+        "count": len(urls),
+        "details": f"提示词: {prompt}\n尺寸: {size}",
+    }
+    return json.dumps(payload), summary
 
 
-@tool
-async def edit_image(image_url: str, prompt: str) -> str:
+@tool(response_format="content_and_artifact")
+async def edit_image(image_url: str, prompt: str) -> Tuple[str, Dict[str, Any]]:
     """
     根据编辑指令修改现有图像。
 
@@ -52,9 +63,18 @@ async def edit_image(image_url: str, prompt: str) -> str:
     model = ModelFactory.get_image_edit_model()
     url = await model.aedit(image_url=image_url, prompt=prompt)
     
-    return json.dumps({
+    payload = {
         "type": "image_edited",
         "prompt": prompt,
         "original_image": image_url,
         "url": url
-    })
+    }
+    # artifact 只保留摘要与链接；提示词放在 details 中，
+    # 由 ToolStreamEventsMiddleware 随 tool_end 事件发送，不写入 checkpoint
+    summary = {
+        "type": "image_edited",
+        "original_image": image_url,
+        "url": url,
+        "details": f"提示词: {prompt}\n原图: {image_url}",
+    }
+    return json.dumps(payload), summary
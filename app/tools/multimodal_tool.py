@@ -1,6 +1,7 @@
 """多模态工具 - 图片理解和 OCR"""
 
 from langchain_core.tools import tool
+from app.cache.tool_cache import tool_result_cache
 from app.llm.model_factory import ModelFactory
 from app.utils.image_utils import build_openai_image_content_async
 
@@ -22,11 +23,15 @@ async def understand_image(image_url: str) -> str:
     model = ModelFactory.get_vision_model(is_ocr=False)
     
     prompt = "请详细描述这张图片的内容，包括场景、物体、人物、颜色等细节。"
-    content = await build_openai_image_content_async(image_url, prompt)
-    messages = [{"role": "user", "content": content}]
     
-    result = await model.ainvoke(messages)
-    return result.content
+    async def describe():
+        content = await build_openai_image_content_async(image_url, prompt)
+        result = await model.ainvoke([{"role": "user", "content": content}])
+        return result.content
+    
+    return await tool_result_cache.get_or_compute(
+        "understand_image", model.model_name, {"prompt": prompt}, describe, files=[image_url]
+    )
 
 
 @tool
@@ -46,8 +51,12 @@ async def ocr_document(image_url: str) -> str:
     model = ModelFactory.get_vision_model(is_ocr=True)
     
     prompt = "请提取这张图片中的所有文字内容，保持原有格式。"
-    content = await build_openai_image_content_async(image_url, prompt)
-    messages = [{"role": "user", "content": content}]
     
-    result = await model.ainvoke(messages)
-    return result.content
+    async def recognize():
+        content = await build_openai_image_content_async(image_url, prompt)
+        result = await model.ainvoke([{"role": "user", "content": content}])
+        return result.content
+    
+    return await tool_result_cache.get_or_compute(
+        "ocr_document", model.model_name, {"prompt": prompt}, recognize, files=[image_url]
+    )
@@ -1,15 +1,16 @@
 """RAG工具 - 知识库检索"""
 
 import json
+from typing import Any, Dict, Tuple
 from langchain_core.tools import tool
 from app.services.knowledge_service import get_knowledge_service
 
 
-@tool
+@tool(response_format="content_and_artifact")
 async def search_knowledge_base(
     query: str,
     k: int = 4,
-) -> str:
+) -> Tuple[str, Dict[str, Any]]:
     """
     从扫地/扫拖机器人知识库中搜索相关文档。
 
@@ -26,12 +27,13 @@ async def search_knowledge_base(
     documents = await service.asearch(query, k=k)
 
     if not documents:
-        return json.dumps({
+        empty = {
             "type": "knowledge",
             "query": query,
             "count": 0,
             "documents": []
-        })
+        }
+        return json.dumps(empty), empty
 
     formatted = []
     for i, doc in enumerate(documents, 1):
@@ -42,9 +44,11 @@ async def search_knowledge_base(
             "content": doc.page_content
         })
 
-    return json.dumps({
+    # artifact 只保留来源信息，文档正文仅发送给模型
+    summary = {
         "type": "knowledge",
         "query": query,
         "count": len(documents),
-        "documents": formatted
-    })
+        "documents": [{"index": d["index"], "source": d["source"]} for d in formatted]
+    }
+    return json.dumps({**summary, "documents": formatted}), summary
@@ -1,12 +1,14 @@
 """翻译工具 - 文本翻译"""
 
 import json
+from typing import Any, Dict, Tuple
 from langchain_core.tools import tool
+from app.cache.tool_cache import tool_result_cache
 from app.llm.model_factory import ModelFactory
 
 
-@tool
-async def translate_text(text: str, target_lang: str, source_lang: str = None) -> str:
+@tool(response_format="content_and_artifact")
+async def translate_text(text: str, target_lang: str, source_lang: str = None) -> Tuple[str, Dict[str, Any]]:
     """
     将文本翻译成目标语言。
 
@@ -31,12 +33,30 @@ async def translate_text(text: str, target_lang: str, source_lang: str = None) -
         "target_lang": target_lang,
     }
     
-    translated_text = await model.ainvoke(messages, translation_options=translation_options)
+    async def translate() -> Any:
+        result = await model.ainvoke(messages, translation_options=translation_options)
+        return result.content
     
-    return json.dumps({
+    translated_text = await tool_result_cache.get_or_compute(
+        "translate_text",
+        model.model_name,
+        {"text": text, "options": translation_options},
+        translate,
+    )
+    
+    payload = {
         "type": "translation",
         "source_lang": source_lang or "auto",
         "target_lang": target_lang,
         "original_text": text[:200] + "..." if len(text) > 200 else text,
-        "translated_text": translated_text.content
-    })
+        "translated_text": translated_text
+    }
+    # artifact 只保留摘要字段；译文放在 details 中，
+    # 由 ToolStreamEventsMiddleware 随 tool_end 事件发送，不写入 checkpoint
+    summary = {
+        "type": "translation",
+        "source_lang": payload["source_lang"],
+        "target_lang": target_lang,
+        "details": translated_text,
+    }
+    return json.dumps(payload), summary
@@ -1,15 +1,17 @@
 """联网搜索工具"""
 
 import json
+from typing import Any, Dict, Tuple
 from langchain_core.tools import tool
 from tavily import AsyncTavilyClient
 from app.config import settings
+from app.llm.upstream_limiter import upstream_limiters
 
 async_tavily_client = AsyncTavilyClient(api_key=settings.tavily_api_key)
 
     
-@tool
-async def web_search(query: str, max_results: int = 5) -> str:
+@tool(response_format="content_and_artifact")
+async def web_search(query: str, max_results: int = 5) -> Tuple[str, Dict[str, Any]]:
     """
     使用联网搜索获取最新信息。
 
@@ -22,7 +24,9 @@ async def web_search(query: str, max_results: int = 5) -> str:
     Returns:
         搜索结果（JSON格式）
     """
-    results = await async_tavily_client.search(
+    results = await upstream_limiters.call(
+        "tavily",
+        async_tavily_client.search,
         query, 
         search_depth="advanced",
         include_raw_content=False, 
@@ -38,10 +42,11 @@ async def web_search(query: str, max_results: int = 5) -> str:
             "url": item.get("url", "")
         })
     
-    return json.dumps({
+    # artifact 仅供前端摘要使用，不包含完整结果，不会发送给模型
+    summary = {
         "type": "search_results",
         "query": query,
         "count": len(result_list),
         "links": links,
-        "results": result_list
-    })
+    }
+    return json.dumps({**summary, "results": result_list}), summary
@@ -288,6 +288,28 @@ export const useChatStore = defineStore('chat', () => {
             } else if (typeof decoded === 'object' && decoded.type === 'content') {
               const contentStr = decoded.data?.content || decoded.content || ''
               newContent += contentStr
+            } else if (typeof decoded === 'object' && decoded.type === 'tool_call_delta') {
+              // 工具调用参数增量 - 工具名一出现就展示 pending 卡片
+              const currentMsgs = messagesMap.value[conversationId]
+              const currentMsg = currentMsgs?.find((m) => m.id === assistantMessageId)
+              const existingToolCalls = currentMsg?.tool_calls || []
+              
+              const deltaData = JSON.parse(decoded.data?.content || '{}')
+              const deltas = deltaData.calls || []
+              
+              const newCalls: ToolCall[] = deltas
+                .filter((delta: any) => delta.id && delta.name && !existingToolCalls.some((t: ToolCall) => t.id === delta.id))
+                .map((delta: any) => ({
+                  id: delta.id,
+                  name: delta.name,
+                  status: 'pending' as const
+                }))
+              
+              if (newCalls.length > 0) {
+                updateMessage({
+                  tool_calls: [...existingToolCalls, ...newCalls]
+                })
+              }
             } else if (typeof decoded === 'object' && decoded.type === 'tool_call') {
               // 工具调用开始 - 解析完整信息
               const currentMsgs = messagesMap.value[conversationId]
@@ -298,12 +320,14 @@ export const useChatStore = defineStore('chat', () => {
               const callData = JSON.parse(decoded.data?.content || '{}')
               const calls = callData.calls || []
               
-              // 添加新的 pending 工具调用
-              const newCalls: ToolCall[] = calls.map((call: any) => ({
-                id: call.id || '',
-                name: call.name || '',
-                status: 'pending' as const
-              }))
+              // 添加新的 pending 工具调用（已由 tool_call_delta 提前展示的跳过）
+              const newCalls: ToolCall[] = calls
+                .filter((call: any) => !call.id || !existingToolCalls.some((t: ToolCall) => t.id === call.id))
+                .map((call: any) => ({
+                  id: call.id || '',
+                  name: call.name || '',
+                  status: 'pending' as const
+                }))
               
               updateMessage({
                 tool_calls: [...existingToolCalls, ...newCalls]
@@ -4,6 +4,7 @@ import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 
 from app.agents.agent_factory import AgentFactory
+from app.agents.agent_cache import AgentCache, config_fingerprint
 
 
 class TestAgentFactoryWarmup:
@@ -15,7 +16,7 @@ class TestAgentFactoryWarmup:
 
     @pytest.mark.asyncio
     async def test_warmup_creates_all_configs(self):
-        """测试预热创建全部 4 种配置"""
+        """测试预热创建 4 种模型配置 × 全部工具/无业务工具"""
         with patch.object(AgentFactory, 'get_checkpointer') as mock_checkpointer, \
              patch.object(AgentFactory, 'get_store') as mock_store, \
              patch('app.agents.agent_factory.create_agent') as mock_create_agent, \
@@ -28,11 +29,14 @@ class TestAgentFactoryWarmup:
             
             await AgentFactory.warmup()
             
-            assert len(AgentFactory._agent_cache) == 4
-            assert "expert_False_thinking_False" in AgentFactory._agent_cache
-            assert "expert_True_thinking_False" in AgentFactory._agent_cache
-            assert "expert_False_thinking_True" in AgentFactory._agent_cache
-            assert "expert_True_thinking_True" in AgentFactory._agent_cache
+            assert len(AgentFactory._agent_cache) == 8
+            labels = {key.split("@")[0] for key in AgentFactory._agent_cache.keys()}
+            assert labels == {
+                "expert_False_thinking_False",
+                "expert_True_thinking_False",
+                "expert_False_thinking_True",
+                "expert_True_thinking_True",
+            }
 
     @pytest.mark.asyncio
     async def test_warmup_continues_on_failure(self):
@@ -58,15 +62,15 @@ class TestAgentFactoryWarmup:
             
             await AgentFactory.warmup()
             
-            assert mock_create_agent.call_count == 4
-            assert len(AgentFactory._agent_cache) == 3
+            assert mock_create_agent.call_count == 8
+            assert len(AgentFactory._agent_cache) == 7
 
     @pytest.mark.asyncio
     async def test_warmup_uses_concurrent_execution(self):
-        """测试预热使用并发执行"""
-        import asyncio
+        """测试预热在线程池中构建，不阻塞事件循环"""
+        import threading
         
-        execution_times = []
+        build_threads = []
         
         with patch.object(AgentFactory, 'get_checkpointer') as mock_checkpointer, \
              patch.object(AgentFactory, 'get_store') as mock_store, \
@@ -78,28 +82,45 @@ class TestAgentFactoryWarmup:
             mock_model.return_value = MagicMock()
             
             def track_execution(*args, **kwargs):
-                execution_times.append(asyncio.get_event_loop().time())
+                build_threads.append(threading.current_thread().name)
                 return MagicMock()
             
             mock_create_agent.side_effect = track_execution
             
             await AgentFactory.warmup()
             
-            assert mock_create_agent.call_count == 4
+            assert mock_create_agent.call_count == 8
+            assert all(name.startswith("agent-warmup") for name in build_threads)
+
+    @pytest.mark.asyncio
+    async def test_warmup_reports_step_timings(self):
+        """测试预热返回各步骤耗时，单步失败不影响其他步骤"""
+        with patch.object(AgentFactory, 'get_checkpointer') as mock_checkpointer, \
+             patch.object(AgentFactory, 'get_store'), \
+             patch('app.agents.agent_factory.create_agent', return_value=MagicMock()), \
+             patch('app.agents.agent_factory.ModelFactory.get_general_model'), \
+             patch('app.agents.agent_factory.ModelFactory.warmup_connections',
+                   new=AsyncMock(side_effect=ConnectionError("offline"))):
+            
+            mock_checkpointer.return_value.aget_tuple = AsyncMock(return_value=None)
+            
+            timings = await AgentFactory.warmup()
+            
+            assert set(timings) == {"agents", "connections", "skills", "checkpointer", "total"}
+            assert len(AgentFactory._agent_cache) == 8
+            mock_checkpointer.return_value.aget_tuple.assert_awaited_once()
 
     def test_get_cache_stats(self):
         """测试获取缓存状态"""
-        AgentFactory._agent_cache = {
-            "expert_False_thinking_False": MagicMock(),
-            "expert_True_thinking_True": MagicMock(),
-        }
+        AgentFactory._agent_cache.get_or_create("expert_False_thinking_False@a", MagicMock)
+        AgentFactory._agent_cache.get_or_create("expert_True_thinking_True@b", MagicMock)
         
         stats = AgentFactory.get_cache_stats()
         
         assert stats["total"] == 2
-        assert stats["max"] == 4
-        assert "expert_False_thinking_False" in stats["cached_agents"]
-        assert "expert_True_thinking_True" in stats["cached_agents"]
+        assert stats["max"] == AgentFactory._agent_cache.max_size
+        assert "expert_False_thinking_False@a" in stats["cached_agents"]
+        assert "expert_True_thinking_True@b" in stats["cached_agents"]
 
     def test_get_cache_stats_empty(self):
         """测试空缓存状态"""
@@ -108,13 +129,13 @@ class TestAgentFactoryWarmup:
         stats = AgentFactory.get_cache_stats()
         
         assert stats["total"] == 0
-        assert stats["max"] == 4
+        assert stats["max"] == AgentFactory._agent_cache.max_size
         assert stats["cached_agents"] == []
 
     @pytest.mark.asyncio
     async def test_close_clears_cache(self):
         """测试关闭时清理缓存"""
-        AgentFactory._agent_cache = {"test": MagicMock()}
+        AgentFactory._agent_cache.get_or_create("test", MagicMock)
         AgentFactory._context_manager = None
         
         await AgentFactory.close_checkpointer()
@@ -140,6 +161,188 @@ class TestAgentFactoryWarmup:
             assert agent1 is agent2
             assert mock_create_agent.call_count == 1
 
+    @pytest.mark.asyncio
+    async def test_cache_key_changes_with_model_config(self):
+        """测试模型配置变化时生成新的缓存键"""
+        with patch.object(AgentFactory, 'get_checkpointer'), \
+             patch.object(AgentFactory, 'get_store'), \
+             patch('app.agents.agent_factory.create_agent') as mock_create_agent, \
+             patch('app.agents.agent_factory.ModelFactory.get_general_model'):
+            
+            mock_create_agent.side_effect = lambda **kwargs: MagicMock()
+            
+            agent1 = AgentFactory.create_chat_agent()
+            with patch('app.agents.agent_factory.settings.model_general_fast', "other-model"):
+                agent2 = AgentFactory.create_chat_agent()
+            
+            assert agent1 is not agent2
+            assert len(AgentFactory._agent_cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_cache_key_changes_with_tool_subset(self):
+        """测试按工具子集签名缓存，并只绑定选中的工具"""
+        from app.tools import web_search, code_assist
+        
+        with patch.object(AgentFactory, 'get_checkpointer'), \
+             patch.object(AgentFactory, 'get_store'), \
+             patch('app.agents.agent_factory.create_agent') as mock_create_agent, \
+             patch('app.agents.agent_factory.ModelFactory.get_general_model'):
+            
+            mock_create_agent.side_effect = lambda **kwargs: MagicMock()
+            
+            search_agent = AgentFactory.create_chat_agent(tools=[web_search])
+            chat_agent = AgentFactory.create_chat_agent(tools=[])
+            search_agent_again = AgentFactory.create_chat_agent(tools=[web_search])
+            AgentFactory.create_chat_agent(tools=[code_assist, web_search])
+            AgentFactory.create_chat_agent(tools=[web_search, code_assist])
+            
+            assert search_agent is search_agent_again
+            assert search_agent is not chat_agent
+            assert len(AgentFactory._agent_cache) == 3
+            bound = [call.kwargs["tools"] for call in mock_create_agent.call_args_list]
+            assert bound[0] == [web_search]
+            assert bound[1] == []
+
+
+class TestAgentCache:
+    """AgentCache LRU 与单次构建测试"""
+
+    def test_lru_eviction(self):
+        """超过容量时淘汰最久未使用的条目"""
+        cache = AgentCache(max_size=2)
+        cache.get_or_create("a", lambda: "A")
+        cache.get_or_create("b", lambda: "B")
+        cache.get_or_create("a", lambda: "A2")
+        cache.get_or_create("c", lambda: "C")
+        
+        assert cache.keys() == ["a", "c"]
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 3
+        assert stats["evictions"] == 1
+
+    def test_build_failure_not_cached(self):
+        """构建失败不缓存，下次重新构建"""
+        cache = AgentCache(max_size=2)
+        
+        def fail():
+            raise RuntimeError("boom")
+        
+        with pytest.raises(RuntimeError):
+            cache.get_or_create("a", fail)
+        
+        assert cache.get_or_create("a", lambda: "A") == "A"
+        assert cache.get_stats()["build_errors"] == 1
+
+    def test_single_flight_under_concurrency(self):
+        """并发获取同一键时只构建一次"""
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        
+        cache = AgentCache(max_size=2)
+        builds = []
+        lock = threading.Lock()
+        
+        def build():
+            with lock:
+                builds.append(1)
+            time.sleep(0.05)
+            return object()
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: cache.get_or_create("a", build), range(8)))
+        
+        assert len(builds) == 1
+        assert all(r is results[0] for r in results)
+
+    def test_skills_index_single_init_under_concurrency(self, tmp_path):
+        """预热线程与请求并发获取技能后端和索引时只创建一次"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from app.agents import agent_factory
+
+        created = []
+
+        class SlowBackend:
+            def __init__(self, root_dir, virtual_mode):
+                created.append(self)
+                time.sleep(0.05)
+                self.cwd = root_dir
+
+        with patch.object(AgentFactory, "_skills_backend", None), \
+             patch.object(AgentFactory, "_skills_index", None), \
+             patch.object(agent_factory, "FilesystemBackend", SlowBackend), \
+             patch.object(agent_factory.settings, "storage_dir", str(tmp_path)):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                indexes = list(pool.map(lambda _: AgentFactory.get_skills_index(), range(8)))
+
+        assert len(created) == 1
+        assert all(index is indexes[0] for index in indexes)
+
+    def test_config_fingerprint_is_stable(self):
+        """指纹与维度顺序无关"""
+        assert config_fingerprint("x", a=1, b=[1, 2]) == config_fingerprint("x", b=[1, 2], a=1)
+        assert config_fingerprint("x", a=1) != config_fingerprint("x", a=2)
+
+
+class TestCheckpointerPool:
+    """checkpointer 连接池测试"""
+
+    def teardown_method(self):
+        AgentFactory._checkpointer = None
+        AgentFactory._context_manager = None
+
+    @pytest.mark.asyncio
+    async def test_init_checkpointer_uses_configured_pool(self):
+        """按配置创建连接池并在其上构建 DedupPostgresSaver"""
+        mock_pool = MagicMock()
+        mock_pool.open = AsyncMock()
+        with patch('app.agents.agent_factory.AsyncConnection.connect', new=AsyncMock()), \
+             patch('app.agents.agent_factory.AsyncConnectionPool', return_value=mock_pool) as mock_pool_cls, \
+             patch('app.agents.agent_factory.DedupPostgresSaver') as mock_saver, \
+             patch('app.agents.agent_factory.settings.database_url', "postgresql://u:p@db/app"), \
+             patch('app.agents.agent_factory.settings.checkpointer_pool_max_size', 16):
+            mock_saver.return_value.setup = AsyncMock()
+            
+            assert await AgentFactory.init_checkpointer() is True
+        
+        kwargs = mock_pool_cls.call_args.kwargs
+        assert kwargs["max_size"] == 16
+        assert kwargs["check"] is not None
+        assert kwargs["kwargs"]["prepare_threshold"] == 0
+        mock_pool.open.assert_awaited_once()
+        mock_saver.assert_called_once_with(mock_pool)
+
+    @pytest.mark.asyncio
+    async def test_init_checkpointer_falls_back_when_pool_fails(self):
+        """连接池打开失败时关闭连接池并回退到 InMemorySaver"""
+        from langgraph.checkpoint.memory import InMemorySaver
+        
+        mock_pool = MagicMock()
+        mock_pool.open = AsyncMock(side_effect=TimeoutError("no database"))
+        mock_pool.close = AsyncMock()
+        with patch('app.agents.agent_factory.AsyncConnection.connect', new=AsyncMock()), \
+             patch('app.agents.agent_factory.AsyncConnectionPool', return_value=mock_pool), \
+             patch('app.agents.agent_factory.settings.database_url', "postgresql://u:p@db/app"):
+            assert await AgentFactory.init_checkpointer() is False
+        
+        assert isinstance(AgentFactory.get_checkpointer(), InMemorySaver)
+        mock_pool.close.assert_awaited_once()
+
+    def test_get_pool_stats(self):
+        """连接池指标包含 psycopg_pool 统计与关闭状态"""
+        from psycopg_pool import AsyncConnectionPool
+        
+        mock_pool = MagicMock(spec=AsyncConnectionPool)
+        mock_pool.get_stats.return_value = {"pool_size": 2, "pool_available": 1}
+        mock_pool.closed = False
+        AgentFactory._context_manager = mock_pool
+        
+        stats = AgentFactory.get_pool_stats()
+        
+        assert stats["checkpointer"] == {"pool_size": 2, "pool_available": 1, "closed": False}
+
 
 class TestAgentFactoryConfig:
     """AgentFactory 配置测试"""
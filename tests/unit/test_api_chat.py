@@ -14,7 +14,7 @@
 
 import pytest
 import pytest_asyncio
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 
 
 # =============================================================================
@@ -188,6 +188,29 @@ class TestSendChatMessage:
             assert response.headers["cache-control"] == "no-cache"
             mock_stream.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_send_message_negotiates_ndjson(self, authenticated_client, test_conversation):
+        """正向测试: Accept 为 NDJSON 时返回紧凑流"""
+        async def _mock_ndjson_stream():
+            yield '{"type":"content","data":{"content":"Hello"}}\n'
+            yield '{"type":"done"}\n'
+        
+        with patch('app.services.chat_service.chat_service.generate_ndjson_stream') as mock_stream, \
+             patch('app.services.chat_service.chat_service.generate_sse_stream') as mock_sse:
+            mock_stream.return_value = _mock_ndjson_stream()
+            
+            response = await authenticated_client.post(
+                "/api/v1/chat/send",
+                json={"conversation_id": test_conversation["id"], "content": "Hello"},
+                headers={"Accept": "application/x-ndjson"}
+            )
+            
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("application/x-ndjson")
+            assert response.text.splitlines()[-1] == '{"type":"done"}'
+            mock_stream.assert_called_once()
+            mock_sse.assert_not_called()
+
     @pytest.mark.asyncio
     async def test_send_message_with_attachments(self, authenticated_client, test_conversation):
         """正向测试: 发送带附件的消息 - 使用正确的附件格式"""
@@ -422,3 +445,59 @@ class TestChatFlowIntegration:
         history_data = history_response.json()
         # 应该有用户消息（3条）
         assert history_data["total"] >= 3
+
+
+class TestCancelChatRun:
+    """取消运行 API 测试"""
+
+    @pytest.mark.asyncio
+    async def test_send_message_returns_run_id(self, authenticated_client, test_conversation):
+        """正向测试: 响应头返回运行ID，并透传给流生成器"""
+        with patch('app.services.chat_service.chat_service.generate_sse_stream') as mock_stream:
+            mock_stream.return_value = _mock_sse_stream()
+            
+            response = await authenticated_client.post(
+                "/api/v1/chat/send",
+                json={"conversation_id": test_conversation["id"], "content": "Hello", "run_id": "client-run-1"}
+            )
+            
+            assert response.status_code == 200
+            assert response.headers["x-run-id"] == "client-run-1"
+            assert mock_stream.call_args.kwargs["run_id"] == "client-run-1"
+
+    @pytest.mark.asyncio
+    async def test_cancel_local_run(self, authenticated_client, test_conversation):
+        """正向测试: 取消本进程内的运行并执行取消回调"""
+        from app.services.stream import run_registry
+        
+        me = await authenticated_client.get("/api/v1/auth/me")
+        on_cancel = MagicMock()
+        run_registry.register("run-local", test_conversation["id"], me.json()["id"], on_cancel=on_cancel)
+        try:
+            response = await authenticated_client.post(
+                f"/api/v1/chat/conversations/{test_conversation['id']}/runs/run-local/cancel"
+            )
+        finally:
+            run_registry.unregister("run-local")
+        
+        assert response.status_code == 202
+        assert response.json()["status"] == "cancelled"
+        on_cancel.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_cancel_unknown_run_is_broadcast(self, authenticated_client, test_conversation):
+        """正向测试: 本进程没有该运行时转发给其他 worker"""
+        with patch('app.services.stream.run_registry.RunRegistry.request_cancel', new=AsyncMock(return_value=False)):
+            response = await authenticated_client.post(
+                f"/api/v1/chat/conversations/{test_conversation['id']}/runs/unknown/cancel"
+            )
+        
+        assert response.status_code == 202
+        assert response.json()["status"] == "cancel_requested"
+
+    @pytest.mark.asyncio
+    async def test_cancel_conversation_not_found_returns_404(self, authenticated_client):
+        """异常测试: 会话不存在返回 404"""
+        response = await authenticated_client.post("/api/v1/chat/conversations/99999/runs/r/cancel")
+        
+        assert response.status_code == 404
@@ -133,6 +133,109 @@ class TestChatService:
             
             assert len(chunks) >= 1
 
+    @pytest.mark.asyncio
+    async def test_generate_ndjson_stream(self, db_session, test_user, test_conversation, mock_redis, mock_agent_factory_stream):
+        import json
+        with patch('app.agents.agent_factory.AgentFactory') as mock_factory:
+            mock_factory.create_chat_agent.return_value = mock_agent_factory_stream
+            mock_factory.get_agent_config.return_value = ({"configurable": {"thread_id": "test"}}, None)
+            
+            lines = []
+            async for chunk in chat_service.generate_ndjson_stream(
+                db=db_session,
+                conversation_id=test_conversation.id,
+                user_id=test_user.id,
+                content="Hello"
+            ):
+                assert chunk.endswith("\n")
+                lines.append(json.loads(chunk))
+            
+            contents = [line["data"]["content"] for line in lines if line["type"] == "content"]
+            assert "".join(contents) == "Hello World"
+            assert lines[-1] == {"type": "done"}
+
+
+class TestSSEEmitterEncoding:
+    """SSEEmitter 事件编码测试"""
+
+    def test_encode_sse_nests_tool_payload_as_string(self):
+        """SSE 编码保持 tool_call 的嵌套字符串格式"""
+        import json
+        from app.services.stream import SSEEmitter
+        
+        event = {"type": "tool_call", "data": {"calls": [{"id": "c1", "name": "web_search"}]}}
+        frame = SSEEmitter.encode_sse(event)
+        
+        assert frame.startswith("data: ") and frame.endswith("\n\n")
+        payload = json.loads(frame[len("data: "):])
+        assert isinstance(payload["data"]["content"], str)
+        assert json.loads(payload["data"]["content"]) == event["data"]
+
+    def test_encode_ndjson_single_pass(self):
+        """NDJSON 编码直接内嵌 data 对象"""
+        import json
+        from app.services.stream import SSEEmitter
+        
+        event = {"type": "tool_result", "data": {"tool_call_id": "c1", "summary": "完成"}}
+        line = SSEEmitter.encode_ndjson(event)
+        
+        assert line.count("\n") == 1
+        assert json.loads(line) == event
+        assert "完成" in line
+
+    def test_encode_done(self):
+        """结束事件编码"""
+        from app.services.stream import SSEEmitter
+        
+        assert SSEEmitter.encode_sse({"type": "done"}) == "data: [DONE]\n\n"
+        assert SSEEmitter.encode_ndjson({"type": "done"}) == '{"type":"done"}\n'
+
+
+class TestSSEEmitterAnsweringModel:
+    """保存回复时记录实际生成回复的模型"""
+
+    @staticmethod
+    async def run(stream_events, is_expert):
+        from app.services.stream import SSEEmitter
+
+        async def process_message(**kwargs):
+            for event in stream_events:
+                yield event
+
+        processor = MagicMock()
+        processor.process_message = process_message
+        repository = MagicMock(create_message=AsyncMock())
+        emitter = SSEEmitter(stream_processor=processor, message_repository=repository)
+        events = [e async for e in emitter.generate_events(AsyncMock(), 1, 1, "你好", is_expert=is_expert)]
+        return events, repository.create_message.call_args.kwargs["message_create"].extra_data
+
+    @pytest.mark.asyncio
+    async def test_defaults_to_requested_model(self):
+        _, extra_data = await self.run([{"type": "token", "data": {"content": "hi"}}], is_expert=True)
+        assert extra_data["model"] == "expert"
+
+    @pytest.mark.asyncio
+    async def test_model_event_overrides_requested_model(self):
+        model_event = {"type": "model", "data": {"model": "fast", "model_name": "qwen-fast"}}
+        events, extra_data = await self.run(
+            [{"type": "token", "data": {"content": "hi"}}, model_event], is_expert=True
+        )
+        assert extra_data["model"] == "fast"
+        assert model_event in events
+
+    @pytest.mark.asyncio
+    async def test_hedged_answer_is_tagged(self):
+        from app.services.stream.stream_processor import StreamProcessor
+        from langchain_core.messages import AIMessageChunk
+
+        chunk = AIMessageChunk(content="hi", response_metadata={"hedge": {"model_name": "qwen-fast", "fallback": True}})
+        model_event = StreamProcessor._answering_model(chunk)
+        assert model_event == {"type": "model", "data": {"model": "fast", "model_name": "qwen-fast", "hedged": True}}
+        assert StreamProcessor._answering_model(AIMessageChunk(content="hi")) is None
+
+        _, extra_data = await self.run([model_event, {"type": "token", "data": {"content": "hi"}}], is_expert=True)
+        assert extra_data["model"] == "fast" and extra_data["hedged"] is True
+
 
 class TestAgentErrorClassifier:
     """AgentErrorClassifier 错误分类测试"""
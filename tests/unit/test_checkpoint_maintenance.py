@@ -0,0 +1,253 @@
+"""Checkpoint 压缩与保留测试"""
+
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock, patch
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from app.agents.checkpoint_maintenance import (
+    COMPACTION_LOCK_KEY,
+    CheckpointCompactor,
+    DELETE_BLOBS_SQL,
+    DELETE_CONTENT_BLOBS_SQL,
+    DELETE_OLD_CHECKPOINTS_SQL,
+    DELETE_WRITES_SQL,
+    OVERSIZED_THREADS_SQL,
+    REFERENCED_BLOBS_SQL,
+    REFERENCED_CONTENT_SQL,
+    TRY_LOCK_SQL,
+    UNLOCK_SQL,
+    thread_id_for,
+)
+
+
+class FakeCursor:
+    """按 SQL 返回预设结果，并记录执行的语句"""
+
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+        self._last = None
+        self.connection = MagicMock()
+
+        @asynccontextmanager
+        async def transaction():
+            yield
+
+        self.connection.transaction = transaction
+
+    async def execute(self, sql, params=None, prepare=None):
+        self.executed.append((sql, params))
+        self._last = self.results.get(sql, [])
+
+    async def fetchall(self):
+        return self._last
+
+    async def fetchone(self):
+        return self._last[0] if self._last else None
+
+
+class FakeConnection:
+    """连接池中的连接：维护语句使用 cursor()，advisory lock 使用 execute()"""
+
+    def __init__(self, cursor, locked=True):
+        self._cursor = cursor
+        self.locked = locked
+        self.executed = []
+
+    @asynccontextmanager
+    async def cursor(self, **kwargs):
+        yield self._cursor
+
+    async def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        result = MagicMock()
+
+        async def fetchone():
+            return {"locked": self.locked}
+
+        result.fetchone = fetchone
+        return result
+
+
+def make_saver(cursor, locked=True):
+    saver = MagicMock(spec=AsyncPostgresSaver)
+
+    @asynccontextmanager
+    async def _cursor(pipeline=False):
+        raise AssertionError("saver._cursor() holds saver.lock and must not be used for maintenance")
+        yield
+
+    saver._cursor = _cursor
+    saver.conn = FakeConnection(cursor, locked)
+    return saver
+
+
+@pytest.fixture(autouse=True)
+def direct_connections():
+    @asynccontextmanager
+    async def get_connection(conn):
+        yield conn
+
+    with patch("app.agents.checkpoint_maintenance._ainternal.get_connection", get_connection):
+        yield
+
+
+class TestCompactThread:
+    """单线程压缩测试"""
+
+    @pytest.mark.asyncio
+    async def test_deletes_old_checkpoints_writes_and_unreferenced_blobs(self):
+        cursor = FakeCursor({
+            DELETE_OLD_CHECKPOINTS_SQL: [
+                {"checkpoint_ns": "", "checkpoint_id": "c1", "versions": {"messages": "1", "files": "1"}, "size": 100},
+                {"checkpoint_ns": "", "checkpoint_id": "c2", "versions": {"messages": "2", "files": "1"}, "size": 120},
+            ],
+            DELETE_WRITES_SQL: [{"rows": 3, "bytes": 30, "refs": []}],
+            # files@1 仍被保留的 checkpoint 引用
+            REFERENCED_BLOBS_SQL: [{"channel": "files", "version": "1"}, {"channel": "messages", "version": "3"}],
+            DELETE_BLOBS_SQL: [{"rows": 2, "bytes": 500, "refs": []}],
+        })
+        compactor = CheckpointCompactor(keep_latest=2)
+
+        report = await compactor.compact_thread(make_saver(cursor), "conversation_1")
+
+        assert report["threads_compacted"] == 1
+        assert report["checkpoints_deleted"] == 2
+        assert report["writes_deleted"] == 3
+        assert report["blobs_deleted"] == 2
+        assert report["reclaimed_bytes"] == 100 + 120 + 30 + 500
+
+        assert cursor.executed[0][1] == ("conversation_1", "conversation_1", 2)
+        blob_deletes = [params for sql, params in cursor.executed if sql == DELETE_BLOBS_SQL]
+        assert len(blob_deletes) == 1
+        assert blob_deletes[0][2] == "messages"
+        assert sorted(blob_deletes[0][3]) == ["1", "2"]
+        # 被删数据没有引用正文时不检查正文表
+        assert all(sql != REFERENCED_CONTENT_SQL for sql, _ in cursor.executed)
+
+    @pytest.mark.asyncio
+    async def test_deletes_content_blobs_no_longer_referenced(self):
+        cursor = FakeCursor({
+            DELETE_OLD_CHECKPOINTS_SQL: [
+                {"checkpoint_ns": "", "checkpoint_id": "c1", "versions": {"messages": "1"}, "size": 100},
+            ],
+            DELETE_WRITES_SQL: [{"rows": 1, "bytes": 10, "refs": ["h_write"]}],
+            REFERENCED_BLOBS_SQL: [{"channel": "messages", "version": "2"}],
+            DELETE_BLOBS_SQL: [{"rows": 1, "bytes": 50, "refs": ["h_removed", "h_kept"]}],
+            # h_kept 仍被保留的 messages 版本引用
+            REFERENCED_CONTENT_SQL: [{"hash": "h_kept"}],
+            DELETE_CONTENT_BLOBS_SQL: [{"rows": 2, "bytes": 4000}],
+        })
+        compactor = CheckpointCompactor(keep_latest=1)
+
+        report = await compactor.compact_thread(make_saver(cursor), "conversation_1")
+
+        content_deletes = [params for sql, params in cursor.executed if sql == DELETE_CONTENT_BLOBS_SQL]
+        assert content_deletes == [("conversation_1", ["h_removed", "h_write"])]
+        assert [params for sql, params in cursor.executed if sql == REFERENCED_CONTENT_SQL] == [
+            ("conversation_1", "conversation_1")
+        ]
+        assert report["blobs_deleted"] == 1 + 2
+        assert report["reclaimed_bytes"] == 100 + 10 + 50 + 4000
+
+    @pytest.mark.asyncio
+    async def test_noop_when_within_retention(self):
+        cursor = FakeCursor({})
+        compactor = CheckpointCompactor(keep_latest=5)
+
+        report = await compactor.compact_thread(make_saver(cursor), "conversation_1")
+
+        assert report["threads_compacted"] == 0
+        assert report["reclaimed_bytes"] == 0
+        assert len(cursor.executed) == 1
+
+
+class TestDeleteThreads:
+    """线程删除测试"""
+
+    @pytest.mark.asyncio
+    async def test_delete_conversation_threads_in_memory(self):
+        saver = InMemorySaver()
+        config = {"configurable": {"thread_id": thread_id_for(7), "checkpoint_ns": ""}}
+        await saver.aput(config, empty_checkpoint(), {}, {})
+        assert await saver.aget_tuple(config) is not None
+
+        compactor = CheckpointCompactor(keep_latest=1)
+        with patch.object(CheckpointCompactor, "_get_checkpointer", return_value=saver):
+            report = await compactor.delete_conversation_threads([7])
+
+        assert report["threads_deleted"] == 1
+        assert await saver.aget_tuple(config) is None
+
+    @pytest.mark.asyncio
+    async def test_delete_threads_postgres_reports_reclaimed_bytes(self):
+        cursor = FakeCursor({})
+
+        async def fetchone():
+            return {"rows": 2, "bytes": 64}
+
+        cursor.fetchone = fetchone
+        compactor = CheckpointCompactor(keep_latest=1)
+        with patch.object(CheckpointCompactor, "_get_checkpointer", return_value=make_saver(cursor)):
+            report = await compactor.delete_threads(["conversation_1", "conversation_2"])
+
+        assert report["threads_deleted"] == 2
+        assert report["checkpoints_deleted"] == 2
+        # channel blob 与内容寻址正文都计入 blobs_deleted
+        assert report["blobs_deleted"] == 4
+        assert report["writes_deleted"] == 2
+        assert report["reclaimed_bytes"] == 4 * 64
+        assert all(params == (["conversation_1", "conversation_2"],) for _, params in cursor.executed)
+
+
+class TestRunOnce:
+    """后台任务单轮执行测试"""
+
+    @pytest.mark.asyncio
+    async def test_run_once_skips_non_postgres_checkpointer(self):
+        compactor = CheckpointCompactor(keep_latest=3)
+        with patch.object(CheckpointCompactor, "_get_checkpointer", return_value=InMemorySaver()):
+            report = await compactor.run_once()
+
+        assert "skipped" in report
+        assert compactor.last_report is report
+        assert report["keep_latest"] == 3
+
+    @pytest.mark.asyncio
+    async def test_run_once_skips_when_another_worker_holds_lock(self):
+        cursor = FakeCursor({})
+        saver = make_saver(cursor, locked=False)
+        compactor = CheckpointCompactor(keep_latest=3)
+        with patch.object(CheckpointCompactor, "_get_checkpointer", return_value=saver):
+            report = await compactor.run_once()
+
+        assert report["skipped"] == "compaction is running in another worker"
+        assert cursor.executed == []
+        assert saver.conn.executed == [(TRY_LOCK_SQL, (COMPACTION_LOCK_KEY,))]
+
+    @pytest.mark.asyncio
+    async def test_run_once_releases_lock_after_compaction(self):
+        cursor = FakeCursor({})
+        saver = make_saver(cursor, locked=True)
+        compactor = CheckpointCompactor(keep_latest=3)
+        with patch.object(CheckpointCompactor, "_get_checkpointer", return_value=saver), \
+             patch.object(CheckpointCompactor, "_find_orphan_threads", return_value=[]):
+            report = await compactor.run_once()
+
+        assert "skipped" not in report
+        assert [sql for sql, _ in cursor.executed] == [OVERSIZED_THREADS_SQL]
+        assert saver.conn.executed == [
+            (TRY_LOCK_SQL, (COMPACTION_LOCK_KEY,)),
+            (UNLOCK_SQL, (COMPACTION_LOCK_KEY,)),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_start_disabled_with_zero_interval(self):
+        compactor = CheckpointCompactor(keep_latest=3)
+        await compactor.start(interval=0)
+        assert compactor._task is None
+        await compactor.stop()
@@ -0,0 +1,210 @@
+"""Checkpoint 压缩与内容寻址序列化测试"""
+
+from contextlib import asynccontextmanager
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.agents.checkpoint_serde import (
+    CAS_SUFFIX,
+    MISSING_BODY_PLACEHOLDER,
+    ZSTD_SUFFIX,
+    CompressedSerializer,
+    DedupPostgresSaver,
+    refs_in_type,
+)
+
+BIG = "搜索结果 " * 2000
+
+
+@pytest.fixture
+def serde():
+    return CompressedSerializer(
+        compression_min_bytes=256,
+        compression_level=3,
+        blob_min_bytes=1024,
+        cache_max_bytes=1024 * 1024,
+    )
+
+
+def _messages():
+    return [
+        HumanMessage(content="帮我搜索一下", id="h1"),
+        ToolMessage(content=BIG, tool_call_id="call_1", id="t1"),
+        AIMessage(content="总结如下", id="a1"),
+    ]
+
+
+class TestCompressedSerializer:
+    """序列化器测试"""
+
+    def test_small_values_are_not_compressed(self, serde):
+        type_, _ = serde.dumps_typed({"k": "v"})
+        assert not type_.endswith(ZSTD_SUFFIX)
+        assert serde.loads_typed((type_, _)) == {"k": "v"}
+
+    def test_large_values_are_compressed_and_round_trip(self, serde):
+        serde.blob_min_bytes = 0
+        type_, data = serde.dumps_typed(_messages())
+
+        assert type_.endswith(ZSTD_SUFFIX)
+        assert CAS_SUFFIX not in type_
+        assert len(data) < len(BIG.encode())
+        assert [m.content for m in serde.loads_typed((type_, data))] == [m.content for m in _messages()]
+
+    def test_unregistered_bodies_stay_inline(self, serde):
+        """未持久化的正文不会被替换为引用"""
+        type_, data = serde.dumps_typed(_messages())
+        assert CAS_SUFFIX not in type_
+        assert refs_in_type(type_, data) == []
+
+    def test_registered_bodies_are_referenced(self, serde):
+        messages = _messages()
+        digest = serde.content_hash(messages[1])
+        serde.remember(digest, BIG)
+
+        type_, data = serde.dumps_typed(messages)
+
+        assert CAS_SUFFIX in type_
+        assert refs_in_type(type_, data) == [digest]
+        # 引用后的数据远小于正文
+        assert len(data) < 1024
+        # 原对象未被修改
+        assert messages[1].content == BIG
+
+        loaded = serde.loads_typed((type_, data))
+        assert loaded[1].content == BIG
+        assert loaded[1].tool_call_id == "call_1"
+
+    def test_missing_body_uses_placeholder(self, serde):
+        """正文已被清理时会话仍可读取，缺失的正文以占位内容代替"""
+        messages = _messages()
+        serde.remember(serde.content_hash(messages[1]), BIG)
+        type_, data = serde.dumps_typed(messages)
+
+        fresh = CompressedSerializer(compression_min_bytes=256, blob_min_bytes=1024)
+        loaded = fresh.loads_typed((type_, data))
+
+        assert loaded[1].content == MISSING_BODY_PLACEHOLDER
+        assert loaded[1].tool_call_id == "call_1"
+        assert [loaded[0].content, loaded[2].content] == ["帮我搜索一下", "总结如下"]
+
+    def test_legacy_types_are_readable(self, serde):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        legacy = JsonPlusSerializer().dumps_typed(_messages())
+        assert serde.loads_typed(legacy)[1].content == BIG
+
+    def test_cache_is_bounded_by_bytes(self):
+        serde = CompressedSerializer(blob_min_bytes=1, cache_max_bytes=10)
+        serde.remember("a", "x" * 6)
+        serde.remember("b", "y" * 6)
+        assert serde.lookup("a") is None
+        assert serde.lookup("b") == "y" * 6
+
+
+class TestDedupPostgresSaver:
+    """saver 正文持久化测试"""
+
+    @staticmethod
+    def _saver_with_table(serde):
+        """内存中的 checkpoint_content_blobs，按 (thread_id, hash) 存储"""
+        table = {}
+        inserted = []
+
+        class Cursor:
+            async def execute(self, sql, params):
+                thread_id, digests = params
+                self.rows = [{"hash": d} for d in digests if (thread_id, d) in table]
+
+            async def fetchall(self):
+                return self.rows
+
+            async def executemany(self, sql, rows):
+                for thread_id, digest, data in rows:
+                    table.setdefault((thread_id, digest), data)
+                inserted.extend(rows)
+
+        @asynccontextmanager
+        async def _cursor(pipeline=False):
+            yield Cursor()
+
+        saver = DedupPostgresSaver(MagicMock(), serde=serde)
+        saver._cursor = _cursor
+        return saver, table, inserted
+
+    @pytest.mark.asyncio
+    async def test_persist_bodies_writes_each_body_once(self, serde):
+        saver, _, inserted = self._saver_with_table(serde)
+
+        await saver._persist_bodies("conversation_1", [_messages()])
+        await saver._persist_bodies("conversation_1", [_messages()])
+
+        assert len(inserted) == 1
+        thread_id, digest, data = inserted[0]
+        assert thread_id == "conversation_1"
+        assert serde.decompress(data).decode() == BIG
+        assert serde.lookup(digest) == BIG
+
+        # 其他线程需要写入自己的正文行
+        await saver._persist_bodies("conversation_2", [_messages()])
+        assert len(inserted) == 2
+
+    @pytest.mark.asyncio
+    async def test_body_deleted_after_caching_is_written_again(self, serde):
+        """正文已在缓存中但被 checkpoint 压缩清理后，再次出现时重新写入"""
+        saver, table, inserted = self._saver_with_table(serde)
+
+        await saver._persist_bodies("conversation_1", [_messages()])
+        digest = inserted[0][1]
+        assert serde.lookup(digest) == BIG
+
+        table.pop(("conversation_1", digest))
+        await saver._persist_bodies("conversation_1", [_messages()])
+
+        assert len(inserted) == 2
+        assert ("conversation_1", digest) in table
+
+    @pytest.mark.asyncio
+    async def test_pooled_reads_run_concurrently(self, serde):
+        """连接池模式下 aget_tuple 不经过 saver.lock，两个读取可以同时进行"""
+        import asyncio
+
+        from psycopg_pool import AsyncConnectionPool
+
+        active = {"now": 0, "max": 0}
+        both_started = asyncio.Event()
+
+        class Cursor:
+            async def execute(self, sql, params=None, binary=False):
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+                if active["now"] == 2:
+                    both_started.set()
+                await asyncio.wait_for(both_started.wait(), timeout=1)
+
+            async def fetchone(self):
+                active["now"] -= 1
+                return None
+
+        class Connection:
+            @asynccontextmanager
+            async def cursor(self, **kwargs):
+                yield Cursor()
+
+        pool = MagicMock(spec=AsyncConnectionPool)
+
+        @asynccontextmanager
+        async def connection():
+            yield Connection()
+
+        pool.connection = connection
+        saver = DedupPostgresSaver(pool, serde=serde)
+
+        results = await asyncio.gather(*[
+            saver.aget_tuple({"configurable": {"thread_id": f"conversation_{i}"}}) for i in range(2)
+        ])
+
+        assert results == [None, None]
+        assert active["max"] == 2
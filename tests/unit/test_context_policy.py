@@ -0,0 +1,90 @@
+"""上下文编辑策略测试"""
+
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain.agents.middleware import ContextEditingMiddleware
+
+from app.agents.context_policy import (
+    StaleToolOutputEdit,
+    build_context_editing_middleware,
+)
+
+
+def _turn(n: int, tool: str, content: str):
+    call_id = f"call_{n}"
+    return [
+        HumanMessage(content=f"问题 {n}"),
+        AIMessage(content="", tool_calls=[{"id": call_id, "name": tool, "args": {}}]),
+        ToolMessage(content=content, tool_call_id=call_id, name=tool),
+        AIMessage(content=f"回答 {n}"),
+    ]
+
+
+def _conversation(*turns):
+    messages = []
+    for n, (tool, content) in enumerate(turns, start=1):
+        messages.extend(_turn(n, tool, content))
+    return messages
+
+
+def _tool_contents(messages):
+    return [m.content for m in messages if isinstance(m, ToolMessage)]
+
+
+LONG = "result " * 4000
+
+
+class TestStaleToolOutputEdit:
+    """StaleToolOutputEdit 测试"""
+
+    def test_single_turn_untouched(self):
+        messages = _conversation(("web_search", LONG))
+        StaleToolOutputEdit(keep_turns=0).apply(messages, count_tokens=count_tokens_approximately)
+        assert _tool_contents(messages) == [LONG]
+
+    def test_clears_outputs_older_than_keep_turns(self):
+        messages = _conversation(("web_search", "old"), ("read_pdf", "mid"), ("web_search", "new"))
+        StaleToolOutputEdit(keep_turns=1).apply(messages, count_tokens=count_tokens_approximately)
+
+        contents = _tool_contents(messages)
+        assert "已清理" in contents[0] and "web_search" in contents[0]
+        assert contents[1:] == ["mid", "new"]
+
+    def test_truncates_recent_outputs_over_budget(self):
+        messages = _conversation(("read_pdf", LONG), ("web_search", LONG))
+        edit = StaleToolOutputEdit(keep_turns=2, tool_budgets={"read_pdf": 100})
+        edit.apply(messages, count_tokens=count_tokens_approximately)
+
+        pdf, current = _tool_contents(messages)
+        assert "已截断" in pdf
+        assert count_tokens_approximately([ToolMessage(content=pdf, tool_call_id="x")]) < 200
+        # 当前轮不截断
+        assert current == LONG
+
+    def test_excluded_tools_are_kept(self):
+        messages = _conversation(("read_pdf", LONG), ("web_search", "x"), ("web_search", "y"))
+        StaleToolOutputEdit(keep_turns=0, exclude_tools=("read_pdf",)).apply(
+            messages, count_tokens=count_tokens_approximately
+        )
+        assert _tool_contents(messages)[0] == LONG
+
+    def test_tool_name_resolved_from_tool_calls(self):
+        messages = _conversation(("web_search", "old"), ("web_search", "new"))
+        messages[2] = ToolMessage(content="old", tool_call_id="call_1")
+        StaleToolOutputEdit(keep_turns=0).apply(messages, count_tokens=count_tokens_approximately)
+        assert "web_search" in _tool_contents(messages)[0]
+
+
+class TestBuildContextEditingMiddleware:
+    """中间件构建测试"""
+
+    def test_builds_middleware_from_settings(self):
+        middleware = build_context_editing_middleware()
+        assert isinstance(middleware, ContextEditingMiddleware)
+        assert isinstance(middleware.edits[0], StaleToolOutputEdit)
+
+    def test_disabled_with_negative_keep_turns(self):
+        with patch("app.agents.context_policy.settings.context_edit_keep_turns", -1):
+            assert build_context_editing_middleware() is None
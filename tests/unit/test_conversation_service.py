@@ -145,6 +145,32 @@ class TestConversationService:
         )
         assert conv is None
 
+    @pytest.mark.asyncio
+    async def test_delete_conversation_removes_threads_after_commit(self, db_session, test_user, mock_redis):
+        import asyncio
+        from app.services.conversation_service import ConversationService
+
+        kept = await conversation_service.create_conversation(db_session, ConversationCreate(title="a"), test_user.id)
+        deleted = await conversation_service.create_conversation(db_session, ConversationCreate(title="b"), test_user.id)
+        await db_session.commit()
+        user_id, kept_id, deleted_id = test_user.id, kept.id, deleted.id
+
+        with patch.object(ConversationService, "_delete_checkpoint_threads", new_callable=AsyncMock) as mock_delete:
+            # 回滚的删除不会清理线程
+            await conversation_service.delete_conversation(db_session, kept_id, user_id)
+            await db_session.rollback()
+            await db_session.commit()
+            await asyncio.sleep(0)
+            mock_delete.assert_not_called()
+
+            await conversation_service.delete_conversation(db_session, deleted_id, user_id)
+            await asyncio.sleep(0)
+            mock_delete.assert_not_called()
+
+            await db_session.commit()
+            await asyncio.sleep(0)
+            mock_delete.assert_awaited_once_with(deleted_id)
+
     @pytest.mark.asyncio
     async def test_delete_conversation_not_found(self, db_session, test_user, mock_redis):
         result = await conversation_service.delete_conversation(
@@ -0,0 +1,164 @@
+"""对冲请求测试"""
+
+import asyncio
+from typing import Any, List, Optional
+from unittest.mock import patch
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.llm.hedging import HedgedChatModel, TTFTTracker, ttft_tracker
+
+
+class FakeStreamModel(BaseChatModel):
+    """首个 chunk 前等待 delay 秒的流式模型"""
+
+    model_name: str
+    delay: float = 0.0
+    chunks: List[str] = ["a", "b"]
+    error: Optional[str] = None
+    cancelled: List[bool] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-stream"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        raise NotImplementedError
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(True)
+            raise
+        if self.error:
+            raise RuntimeError(self.error)
+        for text in self.chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=f"{self.model_name}:{text}"))
+
+
+@pytest.fixture(autouse=True)
+def local_limiter():
+    with patch("app.llm.upstream_limiter.settings.upstream_limiter_shared", False):
+        yield
+
+
+def hedged(primary: FakeStreamModel, fallback: FakeStreamModel, deadline: float = 0.05) -> HedgedChatModel:
+    return HedgedChatModel(primary=primary, fallback=fallback, model_name=primary.model_name, hedge_deadline=deadline)
+
+
+async def collect(model: HedgedChatModel) -> List[str]:
+    chunks = [chunk.content async for chunk in model.astream([HumanMessage(content="hi")])]
+    return [content for content in chunks if content]
+
+
+class TestHedgedChatModel:
+    """HedgedChatModel 测试"""
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_is_not_hedged(self):
+        fallback = FakeStreamModel(model_name="hedge-fast-fb")
+        model = hedged(FakeStreamModel(model_name="hedge-fast"), fallback)
+
+        assert await collect(model) == ["hedge-fast:a", "hedge-fast:b"]
+        assert "hedged" not in ttft_tracker.get_stats()["hedge-fast"]
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_loses_to_fallback(self):
+        primary = FakeStreamModel(model_name="hedge-slow", delay=1.0, cancelled=[])
+        model = hedged(primary, FakeStreamModel(model_name="hedge-slow-fb"))
+
+        assert await collect(model) == ["hedge-slow-fb:a", "hedge-slow-fb:b"]
+        assert primary.cancelled == [True]
+        stats = ttft_tracker.get_stats()["hedge-slow"]
+        assert stats["hedged"] == 1 and stats["fallback_won"] == 1
+
+    @pytest.mark.asyncio
+    async def test_primary_wins_after_hedge(self):
+        fallback = FakeStreamModel(model_name="hedge-race-fb", delay=1.0, cancelled=[])
+        model = hedged(FakeStreamModel(model_name="hedge-race", delay=0.1), fallback)
+
+        assert await collect(model) == ["hedge-race:a", "hedge-race:b"]
+        assert fallback.cancelled == [True]
+        assert ttft_tracker.get_stats()["hedge-race"]["primary_won"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedged_primary_error_uses_fallback(self):
+        primary = FakeStreamModel(model_name="hedge-err", delay=0.1, error="boom")
+        model = hedged(primary, FakeStreamModel(model_name="hedge-err-fb", delay=0.2))
+
+        assert await collect(model) == ["hedge-err-fb:a", "hedge-err-fb:b"]
+
+    @pytest.mark.asyncio
+    async def test_both_fail_raises_first_error(self):
+        primary = FakeStreamModel(model_name="hedge-fail", delay=0.1, error="primary")
+        model = hedged(primary, FakeStreamModel(model_name="hedge-fail-fb", delay=0.2, error="fallback"))
+
+        with pytest.raises(RuntimeError, match="primary"):
+            await collect(model)
+
+    @pytest.mark.asyncio
+    async def test_ainvoke_aggregates_winner(self):
+        model = hedged(FakeStreamModel(model_name="hedge-invoke", delay=1.0), FakeStreamModel(model_name="hedge-invoke-fb"))
+        result = await model.ainvoke([HumanMessage(content="hi")])
+        assert result.content == "hedge-invoke-fb:ahedge-invoke-fb:b"
+        assert result.response_metadata["hedge"] == {"model_name": "hedge-invoke-fb", "fallback": True}
+
+    @pytest.mark.asyncio
+    async def test_winner_tagged_on_first_chunk(self):
+        model = hedged(FakeStreamModel(model_name="hedge-tag"), FakeStreamModel(model_name="hedge-tag-fb"))
+        chunks = [chunk async for chunk in model.astream([HumanMessage(content="hi")])]
+        assert chunks[0].response_metadata["hedge"] == {"model_name": "hedge-tag", "fallback": False}
+        assert all("hedge" not in chunk.response_metadata for chunk in chunks[1:])
+
+    @pytest.mark.asyncio
+    async def test_fallback_wins_do_not_shrink_deadline(self):
+        """主模型落败时记录取消时的等待时长，截止时间不会被快请求拉低到下限"""
+        tracker = TTFTTracker()
+        fallback = FakeStreamModel(model_name="hedge-drift-fb")
+        with patch("app.llm.hedging.ttft_tracker", tracker), \
+             patch("app.llm.hedging.settings.model_hedge_min_samples", 5), \
+             patch("app.llm.hedging.settings.model_hedge_deadline", 0.05), \
+             patch("app.llm.hedging.settings.model_hedge_min_deadline", 0.001):
+            for i in range(10):
+                primary = FakeStreamModel(model_name="hedge-drift", delay=1.0 if i % 5 == 0 else 0.0)
+                model = HedgedChatModel(primary=primary, fallback=fallback, model_name="hedge-drift")
+                await collect(model)
+
+            assert tracker.get_stats()["hedge-drift"]["fallback_won"] == 2
+            assert tracker.deadline("hedge-drift") >= 0.05
+
+
+class TestTTFTTracker:
+    """TTFTTracker 测试"""
+
+    def test_deadline_uses_default_until_enough_samples(self):
+        tracker = TTFTTracker()
+        with patch("app.llm.hedging.settings.model_hedge_min_samples", 5), \
+             patch("app.llm.hedging.settings.model_hedge_deadline", 3.0):
+            for _ in range(4):
+                tracker.record("m", 0.5)
+            assert tracker.deadline("m") == 3.0
+
+    def test_deadline_is_clamped_p90(self):
+        tracker = TTFTTracker()
+        with patch("app.llm.hedging.settings.model_hedge_min_samples", 5), \
+             patch("app.llm.hedging.settings.model_hedge_min_deadline", 1.0), \
+             patch("app.llm.hedging.settings.model_hedge_max_deadline", 10.0):
+            for value in range(1, 11):
+                tracker.record("m", float(value) / 2)
+            assert tracker.deadline("m") == 4.5
+
+            tracker.record("fast", 0.1)
+            for _ in range(5):
+                tracker.record("fast", 0.1)
+            assert tracker.deadline("fast") == 1.0
+
+    def test_window_is_bounded(self):
+        tracker = TTFTTracker(window=3)
+        for value in (9.0, 1.0, 1.0, 1.0):
+            tracker.record("m", value)
+        assert tracker.percentile("m", 100) == 1.0
@@ -0,0 +1,97 @@
+"""DashScope HTTP 连接池测试"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from dashscope.api_entities import aio_session, http_request
+
+from app.llm.http_pool import DashScopeHTTPPool
+
+
+@pytest.fixture
+def pool():
+    return DashScopeHTTPPool()
+
+
+class TestDashScopeHTTPPool:
+    """DashScopeHTTPPool 测试"""
+
+    @pytest.mark.asyncio
+    async def test_aio_session_registered_with_sdk(self, pool):
+        with patch("app.llm.http_pool.settings.dashscope_pool_limit_per_host", 7), \
+             patch("app.llm.http_pool.settings.dashscope_pool_keepalive", 42.0):
+            session = await pool.get_aio_session()
+        try:
+            # SDK 的 Aio* 调用取到的就是本连接池
+            assert await aio_session.get_shared_aio_session() is session
+            assert await pool.get_aio_session() is session
+            assert session.connector.limit_per_host == 7
+            assert session.connector._keepalive_timeout == 42.0
+        finally:
+            await pool.close()
+        assert session.closed
+
+    def test_sync_session_registered_with_sdk(self, pool):
+        with patch("app.llm.http_pool.settings.dashscope_pool_limit_per_host", 5):
+            session = pool.get_sync_session()
+        try:
+            assert http_request._get_shared_sync_session() is session
+            assert pool.get_sync_session() is session
+            assert session.get_adapter("https://dashscope.aliyuncs.com")._pool_maxsize == 5
+        finally:
+            http_request.close_shared_sync_session()
+
+    @pytest.mark.asyncio
+    async def test_ensure_creates_pools_once(self, pool):
+        try:
+            await pool.ensure()
+            session = await aio_session.get_shared_aio_session()
+            await pool.ensure()
+            assert await aio_session.get_shared_aio_session() is session
+            assert pool.get_stats()["sync_session"] is True
+        finally:
+            await pool.close()
+        assert pool.get_stats()["aio_sessions"] == 0
+
+
+class TestModelsUseSharedPool:
+    """模型调用前确保共享连接池就绪，且不修改全局 api_key"""
+
+    @pytest.mark.asyncio
+    async def test_coder_model(self):
+        import dashscope
+        from app.llm.text_models import DashScopeCoderModel
+
+        dashscope.api_key = None
+        response = MagicMock()
+        response.output.choices = [MagicMock(message="ok")]
+        with patch("app.llm.text_models.dashscope_http_pool.ensure", new=AsyncMock()) as ensure, \
+             patch("app.llm.text_models.AioGeneration.call", new=AsyncMock(return_value=response)) as call:
+            model = DashScopeCoderModel(model_name="qwen-coder", api_key="key")
+            assert await model.ainvoke([{"role": "user", "content": "hi"}]) == "ok"
+
+        ensure.assert_awaited_once()
+        assert call.call_args.kwargs["api_key"] == "key"
+        assert dashscope.api_key is None
+
+
+class TestSDKCompatibility:
+    """SDK 内部实现变化时回退到默认会话"""
+
+    @pytest.mark.asyncio
+    async def test_missing_internals_fall_back(self, pool, caplog):
+        from app.llm import http_pool
+
+        http_pool._warned.clear()
+        with patch.object(aio_session, "_aio_sessions", None), \
+             patch.object(http_request, "_KeepAliveHTTPAdapter", None):
+            del aio_session._aio_sessions
+            del http_request._KeepAliveHTTPAdapter
+            await pool.ensure()
+            await pool.ensure()
+            assert await pool.get_aio_session() is None
+            assert pool.get_sync_session() is None
+
+        warnings = [r for r in caplog.records if "falling back" in r.getMessage()]
+        assert len(warnings) == 2
+        assert pool.get_stats()["aio_sessions"] == 0
@@ -0,0 +1,102 @@
+"""日志配置测试"""
+
+import json
+import logging
+
+import pytest
+
+from app.core.logging_config import AsyncQueueHandler, LogSampler, setup_logging, stop_logging
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def read(path) -> str:
+    return path.read_text(encoding="utf-8")
+
+
+class TestQueueLogging:
+    """队列日志管线"""
+
+    def test_root_only_has_queue_handler(self, root_logger, tmp_path):
+        setup_logging(log_dir=str(tmp_path), enable_console=False)
+        assert [type(h) for h in root_logger.handlers] == [AsyncQueueHandler]
+
+    def test_records_written_by_background_listener(self, root_logger, tmp_path):
+        setup_logging(log_level="INFO", log_dir=str(tmp_path), app_env="development")
+        logger = logging.getLogger("app.test.queue")
+        logger.info("hello %s", "world")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("failed")
+        stop_logging()
+
+        app_log = read(tmp_path / "app.log")
+        assert "app.test.queue - INFO - hello world" in app_log
+        # 控制台的颜色码不会写入文件
+        assert "\033[" not in app_log
+
+        records = [json.loads(line) for line in read(tmp_path / "structured.log").splitlines()]
+        assert records[0]["message"] == "hello world"
+        assert "ValueError: boom" in records[1]["exception"]
+
+    def test_stop_reattaches_handlers(self, root_logger, tmp_path):
+        """停止后台线程后的日志直接写入，不会滞留在队列中"""
+        setup_logging(
+            log_level="DEBUG", log_dir=str(tmp_path), enable_console=False,
+            sample_rates={"app.test.hot": 0.0},
+        )
+        stop_logging()
+
+        assert not any(isinstance(h, AsyncQueueHandler) for h in root_logger.handlers)
+        logging.getLogger("app.test.shutdown").warning("after shutdown")
+        logging.getLogger("app.test.hot").debug("sampled out")
+        assert "after shutdown" in read(tmp_path / "app.log")
+        assert "sampled out" not in read(tmp_path / "app.log")
+
+    def test_without_queue(self, root_logger, tmp_path):
+        setup_logging(log_dir=str(tmp_path), enable_console=False, use_queue=False)
+        assert not any(isinstance(h, AsyncQueueHandler) for h in root_logger.handlers)
+        logging.getLogger("app.test.sync").warning("direct")
+        assert "direct" in read(tmp_path / "app.log")
+
+
+class TestLogSampler:
+    """DEBUG 日志采样"""
+
+    def make_record(self, name: str, level: int) -> logging.LogRecord:
+        return logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+
+    def test_samples_debug_by_logger_prefix(self):
+        sampler = LogSampler({"app.services.stream": 0.0})
+        assert not sampler.filter(self.make_record("app.services.stream.sse_emitter", logging.DEBUG))
+        assert sampler.filter(self.make_record("app.services.stream.sse_emitter", logging.INFO))
+        assert sampler.filter(self.make_record("app.services.chat_service", logging.DEBUG))
+
+    def test_rate_keeps_fraction(self):
+        sampler = LogSampler({"hot": 0.1})
+        kept = sum(sampler.filter(self.make_record("hot", logging.DEBUG)) for _ in range(2000))
+        assert 100 < kept < 300
+
+    def test_sampling_in_pipeline(self, root_logger, tmp_path):
+        setup_logging(
+            log_level="DEBUG", log_dir=str(tmp_path), enable_console=False,
+            sample_rates={"app.test.hot": 0.0},
+        )
+        logging.getLogger("app.test.hot").debug("token")
+        logging.getLogger("app.test.hot").info("summary")
+        stop_logging()
+
+        app_log = read(tmp_path / "app.log")
+        assert "summary" in app_log and "token" not in app_log
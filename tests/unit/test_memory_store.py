@@ -0,0 +1,92 @@
+"""RunCachedStore 运行内读穿缓存测试"""
+
+import asyncio
+
+import pytest
+from langgraph.store.memory import InMemoryStore
+
+from app.agents.memory_store import RunCachedStore, memory_run_scope
+
+NAMESPACE = ("1", "memories")
+PREFERENCES = "/preferences.txt"
+
+
+class CountingStore(InMemoryStore):
+    """记录底层读取次数"""
+
+    def __init__(self):
+        super().__init__()
+        self.get_calls = 0
+
+    def get(self, *args, **kwargs):
+        self.get_calls += 1
+        return super().get(*args, **kwargs)
+
+    async def aget(self, *args, **kwargs):
+        self.get_calls += 1
+        return await super().aget(*args, **kwargs)
+
+
+@pytest.fixture
+def store():
+    inner = CountingStore()
+    inner.put(NAMESPACE, PREFERENCES, {"content": ["喜欢简洁回答"]})
+    inner.get_calls = 0
+    return RunCachedStore(inner)
+
+
+class TestRunCachedStore:
+    """RunCachedStore 测试"""
+
+    @pytest.mark.asyncio
+    async def test_reads_cached_within_run(self, store):
+        """运行作用域内重复读取只访问一次底层存储"""
+        with memory_run_scope():
+            first = await store.aget(NAMESPACE, PREFERENCES)
+            second = await store.aget(NAMESPACE, PREFERENCES)
+
+        assert first.value == second.value
+        assert store.store.get_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_no_cache_outside_run(self, store):
+        await store.aget(NAMESPACE, PREFERENCES)
+        await store.aget(NAMESPACE, PREFERENCES)
+
+        assert store.store.get_calls == 2
+
+    @pytest.mark.asyncio
+    async def test_only_configured_keys_cached(self, store):
+        store.store.put(NAMESPACE, "/notes.txt", {"content": ["x"]})
+        with memory_run_scope():
+            await store.aget(NAMESPACE, "/notes.txt")
+            await store.aget(NAMESPACE, "/notes.txt")
+
+        assert store.store.get_calls == 2
+
+    @pytest.mark.asyncio
+    async def test_write_invalidates_cache(self, store):
+        """写入后同一运行内读到新值"""
+        with memory_run_scope():
+            await store.aget(NAMESPACE, PREFERENCES)
+            await store.aput(NAMESPACE, PREFERENCES, {"content": ["喜欢详细回答"]})
+            item = await store.aget(NAMESPACE, PREFERENCES)
+
+        assert item.value == {"content": ["喜欢详细回答"]}
+
+    @pytest.mark.asyncio
+    async def test_cache_shared_with_worker_threads(self, store):
+        """同步读取在线程中执行时共享运行缓存（StoreBackend 的 ls/grep 走线程）"""
+        with memory_run_scope():
+            await asyncio.to_thread(store.get, NAMESPACE, PREFERENCES)
+            await asyncio.to_thread(store.get, NAMESPACE, PREFERENCES)
+
+        assert store.store.get_calls == 1
+
+    def test_missing_item_cached(self, store):
+        """不存在的条目同样缓存，避免重复查询"""
+        with memory_run_scope():
+            assert store.get(("2", "memories"), PREFERENCES) is None
+            assert store.get(("2", "memories"), PREFERENCES) is None
+
+        assert store.store.get_calls == 1
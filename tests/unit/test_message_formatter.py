@@ -0,0 +1,180 @@
+"""MessageFormatter 流式格式化测试"""
+
+from unittest.mock import patch
+
+import pytest
+from langchain_core.messages.ai import AIMessageChunk
+
+from app.services.formatters import MessageFormatter, ToolCallDeltaBuffer
+
+
+def _tool_chunk(name=None, args="", call_id=None, index=0):
+    return AIMessageChunk(
+        content="",
+        tool_call_chunks=[{"name": name, "args": args, "id": call_id, "index": index}],
+    )
+
+
+class TestToolCallDeltas:
+    """工具调用参数增量测试"""
+
+    def test_chunks_dropped_without_buffer(self):
+        """未提供缓冲区时保持旧行为"""
+        chunk = _tool_chunk(name="code_assist", call_id="call_1")
+        assert MessageFormatter.format_stream_message(chunk, {}, False) is None
+
+    def test_name_emitted_on_first_chunk(self):
+        """首个分片即输出工具名"""
+        buffer = ToolCallDeltaBuffer()
+        event = MessageFormatter.format_stream_message(
+            _tool_chunk(name="code_assist", call_id="call_1"), {}, False, buffer
+        )
+
+        assert event["type"] == "tool_call_delta"
+        assert event["data"]["calls"] == [
+            {"id": "call_1", "index": 0, "name": "code_assist", "args_delta": ""}
+        ]
+
+    def test_args_assembled_across_chunks(self):
+        """后续分片只携带参数片段，id 和工具名由缓冲区补全"""
+        buffer = ToolCallDeltaBuffer()
+        formatter = MessageFormatter()
+        formatter.format_stream_message(_tool_chunk(name="code_assist", call_id="call_1"), {}, False, buffer)
+        event = formatter.format_stream_message(_tool_chunk(args='{"prompt": "qu'), {}, False, buffer)
+        formatter.format_stream_message(_tool_chunk(args='ick sort"}'), {}, False, buffer)
+
+        assert event["data"]["calls"][0]["id"] == "call_1"
+        assert event["data"]["calls"][0]["name"] == "code_assist"
+        assert event["data"]["calls"][0]["args_delta"] == '{"prompt": "qu'
+        assert buffer.get_args(0) == '{"prompt": "quick sort"}'
+
+    def test_new_id_on_same_index_starts_new_call(self):
+        """同一 index 出现新 id 时开始新的工具调用"""
+        buffer = ToolCallDeltaBuffer()
+        buffer.add_chunk({"name": "web_search", "args": '{"q": 1}', "id": "call_1", "index": 0})
+        delta = buffer.add_chunk({"name": "translate_text", "args": "", "id": "call_2", "index": 0})
+
+        assert delta["id"] == "call_2"
+        assert delta["name"] == "translate_text"
+        assert buffer.get_args(0) == ""
+
+    def test_empty_chunk_ignored(self):
+        """没有新信息的分片不输出事件"""
+        buffer = ToolCallDeltaBuffer()
+        buffer.add_chunk({"name": "web_search", "args": "", "id": "call_1", "index": 0})
+        event = MessageFormatter.format_stream_message(_tool_chunk(), {}, False, buffer)
+        assert event is None
+
+
+class TestCustomEvents:
+    """custom 流工具生命周期事件测试"""
+
+    def test_tool_start_confirms_call(self):
+        event = MessageFormatter.format_custom_event({
+            "event": "tool_start",
+            "tool_call_id": "call_1",
+            "name": "web_search",
+            "args": {"query": "天气"},
+        })
+
+        assert event == {
+            "type": "tool_call",
+            "data": {"calls": [{"id": "call_1", "name": "web_search", "args_preview": "query=天气"}]},
+        }
+
+    def test_tool_end_uses_artifact_without_parsing(self):
+        """有 artifact 时直接使用，不解析 content"""
+        with patch("app.services.formatters.tool_result_formatter.json.loads") as mock_loads:
+            event = MessageFormatter.format_custom_event({
+                "event": "tool_end",
+                "tool_call_id": "call_1",
+                "name": "web_search",
+                "artifact": {"count": 3, "links": [{"title": "t", "url": "u"}]},
+                "content": '{"huge": "payload"}',
+                "status": "success",
+            })
+            mock_loads.assert_not_called()
+
+        assert event["type"] == "tool_result"
+        assert event["data"]["tool_call_id"] == "call_1"
+        assert event["data"]["summary"] == "找到 3 条结果"
+        assert "status" not in event["data"]
+
+    @pytest.mark.asyncio
+    async def test_code_assist_details_sent_with_event(self):
+        """代码正文作为 details 随事件发送，tool_result 不解析 content"""
+        import json
+        from unittest.mock import AsyncMock, MagicMock
+
+        from app.tools import code_assist
+
+        model = MagicMock(model_name="coder")
+        model.ainvoke = AsyncMock(return_value=MagicMock(content="print(1)"))
+
+        async def uncached(tool, model_name, args, compute):
+            return await compute()
+
+        with patch("app.tools.code_tools.ModelFactory.get_coder_model", return_value=model), \
+             patch("app.tools.code_tools.tool_result_cache.get_or_compute", side_effect=uncached):
+            content, artifact = await code_assist.coroutine(prompt="打印 1")
+
+        assert artifact == {"type": "code", "language": "python", "details": "print(1)"}
+        assert json.loads(content)["code"] == "print(1)"
+
+        details = artifact.pop("details")
+        with patch("app.services.formatters.tool_result_formatter.json.loads") as mock_loads:
+            event = MessageFormatter.format_custom_event({
+                "event": "tool_end", "tool_call_id": "call_3", "name": "code_assist",
+                "artifact": artifact, "details": details, "content": content, "status": "success",
+            })
+            mock_loads.assert_not_called()
+        assert event["data"]["summary"] == "python 代码生成完成"
+        assert event["data"]["details"] == "print(1)"
+
+    @pytest.mark.asyncio
+    async def test_image_prompt_sent_as_details(self):
+        """图片工具的提示词随 tool_end 事件发送，不写入 artifact"""
+        from unittest.mock import AsyncMock, MagicMock
+
+        from app.tools import edit_image, generate_image
+
+        model = MagicMock()
+        model.agenerate = AsyncMock(return_value=["https://img/1.png"])
+        model.aedit = AsyncMock(return_value="https://img/2.png")
+
+        with patch("app.tools.image_tools.ModelFactory.get_text_to_image_model", return_value=model), \
+             patch("app.tools.image_tools.ModelFactory.get_image_edit_model", return_value=model):
+            generated = await generate_image.coroutine(prompt="一只猫")
+            edited = await edit_image.coroutine(image_url="images/a.png", prompt="换成蓝色背景")
+
+        events = {}
+        for name, (content, artifact) in (("generate_image", generated), ("edit_image", edited)):
+            assert "prompt" not in artifact
+            details = artifact.pop("details")
+            events[name] = MessageFormatter.format_custom_event({
+                "event": "tool_end", "tool_call_id": "call_4", "name": name,
+                "artifact": artifact, "details": details, "content": content, "status": "success",
+            })["data"]
+
+        assert events["generate_image"]["details"] == "提示词: 一只猫\n尺寸: 1664*928"
+        assert events["generate_image"]["links"] == [{"title": "图片 1", "url": "https://img/1.png"}]
+        assert events["edit_image"]["details"] == "提示词: 换成蓝色背景\n原图: images/a.png"
+        assert events["edit_image"]["links"] == [{"title": "编辑后的图片", "url": "https://img/2.png"}]
+
+    def test_tool_end_falls_back_to_content(self):
+        """没有 artifact 的工具仍按内容格式化"""
+        event = MessageFormatter.format_custom_event({
+            "event": "tool_end",
+            "tool_call_id": "call_2",
+            "name": "read_pdf",
+            "artifact": None,
+            "content": "第一行\n第二行",
+            "status": "error",
+        })
+
+        assert event["data"]["summary"] == "读取 2 行"
+        assert event["data"]["status"] == "error"
+
+    def test_unknown_custom_event_ignored(self):
+        assert MessageFormatter.format_custom_event({"event": "other"}) is None
+        assert MessageFormatter.format_custom_event("text") is None
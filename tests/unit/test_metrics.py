@@ -0,0 +1,115 @@
+"""Prometheus 指标测试"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.api.middleware.metrics import MetricsMiddleware
+from app.core.metrics import record_cache, render_metrics, track_stream
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+async def events(*types, fail: bool = False):
+    for event_type in types:
+        yield {"type": event_type}
+    if fail:
+        raise RuntimeError("boom")
+
+
+class TestMetricsMiddleware:
+    """HTTP 指标中间件"""
+
+    def test_records_route_template(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: int):
+            return {"id": item_id}
+
+        labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+        before = sample("dragonai_http_request_duration_seconds_count", **labels)
+        client = TestClient(app)
+        client.get("/items/1")
+        client.get("/items/2")
+        client.get("/missing")
+
+        assert sample("dragonai_http_request_duration_seconds_count", **labels) == before + 2
+        assert sample("dragonai_http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+        assert sample("dragonai_http_requests_in_progress", method="GET") == 0
+
+
+class TestTrackStream:
+    """聊天流指标"""
+
+    @pytest.mark.asyncio
+    async def test_done_and_event_counts(self):
+        before = sample("dragonai_stream_duration_seconds_count", transport="sse", outcome="done")
+        tokens = sample("dragonai_stream_events_total", transport="sse", type="content")
+
+        assert [e["type"] async for e in track_stream(events("content", "content", "done"), "sse")]
+
+        assert sample("dragonai_stream_duration_seconds_count", transport="sse", outcome="done") == before + 1
+        assert sample("dragonai_stream_events_total", transport="sse", type="content") == tokens + 2
+
+    @pytest.mark.asyncio
+    async def test_error_and_disconnect(self):
+        errors = sample("dragonai_stream_duration_seconds_count", transport="ndjson", outcome="error")
+        with pytest.raises(RuntimeError):
+            async for _ in track_stream(events("content", fail=True), "ndjson"):
+                pass
+        assert sample("dragonai_stream_duration_seconds_count", transport="ndjson", outcome="error") == errors + 1
+
+        disconnected = sample("dragonai_stream_duration_seconds_count", transport="ndjson", outcome="disconnected")
+        stream = track_stream(events("content", "content", "done"), "ndjson")
+        await stream.__anext__()
+        await stream.aclose()
+        assert sample("dragonai_stream_duration_seconds_count", transport="ndjson", outcome="disconnected") == disconnected + 1
+
+
+class TestRedisInstrumentation:
+    """Redis 命令耗时"""
+
+    @pytest.mark.asyncio
+    async def test_command_duration(self):
+        from app.cache.redis import InstrumentedRedis
+
+        before = sample("dragonai_redis_command_duration_seconds_count", command="GET")
+        with patch("redis.asyncio.Redis.execute_command", AsyncMock(return_value="v")):
+            client = InstrumentedRedis()
+            assert await client.execute_command("get", "k") == "v"
+        assert sample("dragonai_redis_command_duration_seconds_count", command="GET") == before + 1
+
+
+class TestRenderMetrics:
+    """/metrics 输出"""
+
+    def test_exposition_format(self):
+        record_cache("redis", "hit")
+        body, content_type = render_metrics()
+        assert content_type.startswith("text/plain")
+        assert b'dragonai_cache_requests_total{cache="redis",result="hit"}' in body
+
+    def test_multiprocess_aggregation(self, tmp_path):
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        worker = "from app.core.metrics import record_cache; record_cache('redis', 'hit')"
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", worker], env=env, cwd=PROJECT_ROOT, check=True)
+
+        scrape = "import sys; from app.core.metrics import render_metrics; sys.stdout.buffer.write(render_metrics()[0])"
+        result = subprocess.run(
+            [sys.executable, "-c", scrape], env=env, cwd=PROJECT_ROOT, check=True, capture_output=True
+        )
+        assert b'dragonai_cache_requests_total{cache="redis",result="hit"} 2.0' in result.stdout
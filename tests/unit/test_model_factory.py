@@ -4,6 +4,7 @@ import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 
 from app.llm.model_factory import ModelFactory
+from app.config import settings
 
 
 class TestModelFactoryConnectionPool:
@@ -13,6 +14,7 @@ class TestModelFactoryConnectionPool:
         """每个测试前清理缓存"""
         ModelFactory._chat_clients.clear()
         ModelFactory._async_clients.clear()
+        ModelFactory._tool_models.clear()
 
     @pytest.mark.asyncio
     async def test_get_async_client_caches_client(self):
@@ -129,11 +131,26 @@ class TestModelFactoryConnectionPool:
             mock_chat_tongyi.side_effect = [mock_model1, mock_model2]
 
             model1 = ModelFactory.get_general_model(is_expert=False, enable_thinking=False)
-            model2 = ModelFactory.get_general_model(is_expert=True, enable_thinking=False)
+            model2 = ModelFactory.get_general_model(is_expert=True, enable_thinking=False, hedge=False)
 
             assert model1 is not model2
             assert mock_chat_tongyi.call_count == 2
 
+    def test_get_general_model_expert_is_hedged(self):
+        """测试开启对冲时专家模型包装为对冲模型，回退到同配置的快速模型；默认不对冲"""
+        from app.llm.hedging import HedgedChatModel
+
+        with patch.object(settings, "qwen_api_key", "test_key"):
+            default = ModelFactory.get_general_model(is_expert=True, enable_thinking=False, use_cache=False)
+            model = ModelFactory.get_general_model(is_expert=True, enable_thinking=False, use_cache=False, hedge=True)
+            plain = ModelFactory.get_general_model(is_expert=True, streaming=False, use_cache=False, hedge=True)
+
+        assert not isinstance(default, HedgedChatModel)
+        assert isinstance(model, HedgedChatModel)
+        assert model.model_name == settings.model_general_expert
+        assert model.fallback.model_name == settings.model_general_fast
+        assert not isinstance(plain, HedgedChatModel)
+
     def test_get_general_model_skip_cache(self):
         """测试跳过缓存"""
         with patch('app.llm.model_factory.ChatTongyi') as mock_chat_tongyi:
@@ -192,6 +209,79 @@ class TestModelFactoryConnectionPool:
         assert "test3" in stats["async_clients"]
 
 
+class TestToolModelCache:
+    """工具模型实例缓存测试"""
+
+    def setup_method(self):
+        ModelFactory._tool_models.clear()
+
+    def test_tool_models_are_cached(self):
+        assert ModelFactory.get_coder_model() is ModelFactory.get_coder_model()
+        assert ModelFactory.get_translation_model() is ModelFactory.get_translation_model()
+        assert ModelFactory.get_text_to_image_model() is ModelFactory.get_text_to_image_model()
+        assert ModelFactory.get_image_edit_model() is ModelFactory.get_image_edit_model()
+        assert len(ModelFactory._tool_models) == 4
+
+    def test_cache_key_includes_model_and_params(self):
+        vision = ModelFactory.get_vision_model(is_ocr=False)
+        ocr = ModelFactory.get_vision_model(is_ocr=True)
+        tuned = ModelFactory.get_vision_model(is_ocr=False, temperature=0.1)
+
+        assert vision is not ocr
+        assert vision is not tuned
+        assert tuned.temperature == 0.1
+        assert ModelFactory.get_vision_model(is_ocr=False, temperature=0.1) is tuned
+
+    def test_skip_cache(self):
+        model = ModelFactory.get_coder_model(use_cache=False)
+        assert model is not ModelFactory.get_coder_model(use_cache=False)
+        assert len(ModelFactory._tool_models) == 0
+
+    def test_image_model_class_follows_config(self):
+        with patch('app.llm.model_factory.settings.model_text_to_image', "wan2.2-t2i-flash"):
+            assert type(ModelFactory.get_text_to_image_model()).__name__ == "WanxImageGenerationModelV2"
+        with patch('app.llm.model_factory.settings.model_text_to_image', "qwen-image"):
+            assert type(ModelFactory.get_text_to_image_model()).__name__ == "QwenImageGenerationModel"
+
+    @pytest.mark.asyncio
+    async def test_close_all_clears_tool_models(self):
+        ModelFactory.get_coder_model()
+        assert ModelFactory.get_cache_stats()["total_tool"] == 1
+
+        with patch('app.llm.model_factory.dashscope_http_pool.close', new=AsyncMock()):
+            await ModelFactory.close_all()
+
+        assert ModelFactory.get_cache_stats()["total_tool"] == 0
+
+
+class TestModelFactoryWarmup:
+    """DashScope 连接预热测试"""
+
+    @pytest.mark.asyncio
+    async def test_warmup_connections_skipped_without_api_key(self):
+        """未配置 API Key 时跳过预热"""
+        with patch('app.llm.model_factory.settings.qwen_api_key', ""):
+            assert await ModelFactory.warmup_connections(count=2) == 0
+
+    @pytest.mark.asyncio
+    async def test_warmup_connections_opens_both_pools(self):
+        """同步与异步连接池各预建立 count 个连接，失败不抛出"""
+        sync_session = MagicMock()
+        aio_session = MagicMock()
+        aio_session.head.return_value.__aenter__ = AsyncMock(side_effect=OSError("unreachable"))
+        aio_session.head.return_value.__aexit__ = AsyncMock(return_value=False)
+
+        with patch('app.llm.model_factory.settings.qwen_api_key', "test_key"), \
+             patch('app.llm.model_factory.dashscope_http_pool.get_sync_session', return_value=sync_session), \
+             patch('app.llm.model_factory.dashscope_http_pool.get_aio_session',
+                   new=AsyncMock(return_value=aio_session)):
+            opened = await ModelFactory.warmup_connections(count=2)
+
+        assert opened == 2
+        assert sync_session.head.call_count == 2
+        assert aio_session.head.call_count == 2
+
+
 class TestAsyncClientConnectionPool:
     """AsyncOpenAI 客户端连接池测试"""
 
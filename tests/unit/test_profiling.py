@@ -0,0 +1,159 @@
+"""请求剖析测试"""
+
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.api.middleware.tracing import RequestTracingMiddleware
+from app.core.profiling import collapse_stack, request_profiler
+
+
+@pytest.fixture
+def profiling(tmp_path):
+    with patch("app.core.profiling.settings.profiling_enabled", True), \
+         patch("app.core.profiling.settings.profiling_token", "secret"), \
+         patch("app.core.profiling.settings.profiling_sample_rate", 0.0), \
+         patch("app.core.profiling.settings.profiling_interval", 0.001), \
+         patch("app.core.profiling.settings.log_dir", str(tmp_path)):
+        yield tmp_path / "profiles"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(RequestTracingMiddleware)
+
+    @app.get("/busy")
+    async def busy():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield f"data: {i}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return TestClient(app)
+
+
+def wait_for(path, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return path
+
+
+class TestRequestProfiling:
+    """RequestTracingMiddleware 剖析钩子"""
+
+    def test_disabled_by_default(self, client):
+        response = client.get("/busy", headers={"X-Profile": "secret"})
+        assert "X-Profile-ID" not in response.headers
+
+    def test_header_triggers_profile(self, profiling, client):
+        assert "X-Profile-ID" not in client.get("/busy", headers={"X-Profile": "wrong"}).headers
+
+        response = client.get("/busy", headers={"X-Profile": "secret"})
+        profile_id = response.headers["X-Profile-ID"]
+
+        summary = json.loads(wait_for(profiling / f"{profile_id}.json").read_text(encoding="utf-8"))
+        assert summary["reason"] == "header"
+        assert summary["status"] == 200 and summary["samples"] > 0
+
+        folded = (profiling / f"{profile_id}.folded").read_text(encoding="utf-8").splitlines()
+        assert any("busy" in line for line in folded)
+        stack, count = folded[0].rsplit(" ", 1)
+        assert ";" in stack and int(count) > 0
+
+    def test_stream_breakdown(self, profiling, client):
+        with patch("app.core.profiling.settings.profiling_sample_rate", 1.0):
+            response = client.get("/stream")
+        assert response.text.count("data:") == 3
+
+        summary = json.loads(wait_for(profiling / f"{response.headers['X-Profile-ID']}.json").read_text())
+        assert summary["reason"] == "sampled"
+        assert summary["stream"]["chunks"] == 3
+        assert summary["stream"]["producer_wait"] >= 0.02
+        assert summary["duration_seconds"] >= summary["stream"]["first_chunk"]
+
+    def test_list_and_fetch(self, profiling, client):
+        profile_id = client.get("/busy", headers={"X-Profile": "secret"}).headers["X-Profile-ID"]
+        wait_for(profiling / f"{profile_id}.json")
+
+        assert request_profiler.list_profiles()[0]["profile_id"] == profile_id
+        assert request_profiler.get_profile_path(profile_id).suffix == ".folded"
+        assert request_profiler.get_profile_path("../../etc/passwd") is None
+        assert request_profiler.get_profile_path(profile_id, "exe") is None
+
+    def test_old_profiles_pruned(self, profiling, client):
+        with patch("app.core.profiling.settings.profiling_max_files", 1):
+            first = client.get("/busy", headers={"X-Profile": "secret"}).headers["X-Profile-ID"]
+            wait_for(profiling / f"{first}.json")
+            second = client.get("/busy", headers={"X-Profile": "secret"}).headers["X-Profile-ID"]
+            wait_for(profiling / f"{second}.json")
+            time.sleep(0.05)
+
+        assert [p["profile_id"] for p in request_profiler.list_profiles()] == [second]
+
+
+@pytest.mark.asyncio
+async def test_finish_joins_sampler_off_loop(profiling):
+    import threading
+
+    from app.core.profiling import Profile
+
+    profile = Profile("req", "GET", "/x", "header")
+    profile.start()
+    joined_on = []
+    join = profile._sampler.join
+    profile._sampler.join = lambda: (joined_on.append(threading.get_ident()), join())
+
+    profile.finish()
+    for _ in range(200):
+        if (profiling / f"{profile.profile_id}.json").exists():
+            break
+        await asyncio.sleep(0.01)
+
+    assert joined_on and joined_on[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_unstarted_stream_finishes_after_max_duration(profiling):
+    """响应体从未开始迭代时，到达最长时长后结束剖析并释放名额"""
+    async def body():
+        yield b"never sent"
+
+    with patch("app.core.profiling.settings.profiling_max_duration", 0.05):
+        profile = request_profiler.maybe_start("req", "GET", "/stream", {"X-Profile": "secret"})
+    assert request_profiler._active == 1
+    profile.wrap_stream(body())
+
+    for _ in range(200):
+        if (profiling / f"{profile.profile_id}.json").exists() and request_profiler._active == 0:
+            break
+        await asyncio.sleep(0.01)
+
+    summary = json.loads((profiling / f"{profile.profile_id}.json").read_text(encoding="utf-8"))
+    assert summary["error"] == "MaxDurationExceeded"
+    assert profile._lag_task.cancelled()
+    assert not profile._sampler._thread.is_alive()
+    assert request_profiler._active == 0
+
+
+def test_collapse_stack_root_first():
+    import sys
+
+    stack = collapse_stack(sys._getframe())
+    assert stack.endswith("test_profiling:test_collapse_stack_root_first")
@@ -0,0 +1,138 @@
+"""运行注册表与服务端取消测试"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.stream import SSEEmitter
+from app.services.stream.run_registry import RunRegistry, run_registry
+
+
+class BlockingProcessor:
+    """模拟 StreamProcessor：输出一段内容和一个工具调用后阻塞"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def process_message(self, **kwargs):
+        yield {"type": "token", "data": {"content": "部分回复"}}
+        yield {"type": "tool_call", "data": {"calls": [{"id": "call_1", "name": "web_search"}]}}
+        self.started.set()
+        await asyncio.Event().wait()
+
+
+class TestRunRegistry:
+    """RunRegistry 测试"""
+
+    @pytest.mark.asyncio
+    async def test_cancel_runs_callback_and_cancels_task(self):
+        registry = RunRegistry()
+        on_cancel = MagicMock()
+        task = asyncio.create_task(asyncio.Event().wait())
+        registry.register("r1", conversation_id=1, user_id=2, on_cancel=on_cancel, task=task)
+
+        assert registry.cancel("r1", conversation_id=1, user_id=2) is True
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert task.cancelled()
+        assert registry.get("r1").cancel_requested is True
+        on_cancel.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_cancel_is_idempotent(self):
+        registry = RunRegistry()
+        on_cancel = MagicMock()
+        registry.register("r1", conversation_id=1, user_id=2, on_cancel=on_cancel)
+
+        registry.cancel("r1")
+        registry.cancel("r1")
+
+        on_cancel.assert_called_once()
+
+    def test_cancel_rejects_other_owner(self):
+        """会话或用户不匹配时不取消"""
+        registry = RunRegistry()
+        registry.register("r1", conversation_id=1, user_id=2)
+
+        assert registry.cancel("r1", conversation_id=1, user_id=3) is False
+        assert registry.cancel("r1", conversation_id=9, user_id=2) is False
+        assert registry.get("r1").cancel_requested is False
+
+    @pytest.mark.asyncio
+    async def test_request_cancel_broadcasts_when_not_local(self):
+        """运行不在本进程时通过 Redis 广播"""
+        registry = RunRegistry()
+        mock_client = MagicMock()
+        mock_client.publish = AsyncMock()
+        with patch("app.services.stream.run_registry.redis_client._client", mock_client):
+            cancelled = await registry.request_cancel("remote", 1, 2)
+
+        assert cancelled is False
+        mock_client.publish.assert_awaited_once()
+
+
+class TestEmitterCancellation:
+    """SSEEmitter 服务端取消测试"""
+
+    @pytest.mark.asyncio
+    async def test_cancel_persists_partial_output(self):
+        processor = BlockingProcessor()
+        repository = MagicMock()
+        repository.create_message = AsyncMock()
+        emitter = SSEEmitter(stream_processor=processor, message_repository=repository)
+        events = []
+
+        async def consume():
+            async for event in emitter.generate_events(MagicMock(), 1, 2, "hi", run_id="run-cancel"):
+                events.append(event)
+
+        task = asyncio.create_task(consume())
+        await processor.started.wait()
+        assert run_registry.cancel("run-cancel", conversation_id=1, user_id=2)
+        await task
+
+        assert [e["type"] for e in events[-2:]] == ["cancelled", "done"]
+        message_create = repository.create_message.await_args.kwargs["message_create"]
+        assert message_create.content == "部分回复[TOOL_CALL:call_1]"
+        assert message_create.extra_data["cancelled"] is True
+        assert message_create.extra_data["tool_calls"][0]["status"] == "cancelled"
+        assert run_registry.get("run-cancel") is None
+
+    @pytest.mark.asyncio
+    async def test_unrequested_cancel_propagates(self):
+        """客户端断开等非请求取消仍按原逻辑传播，不保存消息"""
+        processor = BlockingProcessor()
+        repository = MagicMock()
+        repository.create_message = AsyncMock()
+        emitter = SSEEmitter(stream_processor=processor, message_repository=repository)
+
+        async def consume():
+            async for _ in emitter.generate_events(MagicMock(), 1, 2, "hi", run_id="run-drop"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await processor.started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert task.cancelled()
+        repository.create_message.assert_not_awaited()
+        assert run_registry.get("run-drop") is None
+
+    @pytest.mark.asyncio
+    async def test_cancel_before_stream_starts(self):
+        """路由登记后、流启动前收到的取消在 attach 时生效"""
+        processor = BlockingProcessor()
+        repository = MagicMock()
+        repository.create_message = AsyncMock()
+        emitter = SSEEmitter(stream_processor=processor, message_repository=repository)
+        run_registry.register("run-early", conversation_id=1, user_id=2)
+        assert run_registry.cancel("run-early", conversation_id=1, user_id=2)
+
+        events = [e async for e in emitter.generate_events(MagicMock(), 1, 2, "hi", run_id="run-early")]
+
+        assert [e["type"] for e in events[-2:]] == ["cancelled", "done"]
+        assert not processor.started.is_set()
+        assert repository.create_message.await_args.kwargs["message_create"].extra_data["cancelled"] is True
+        assert run_registry.get("run-early") is None
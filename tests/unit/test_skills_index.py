@@ -0,0 +1,120 @@
+"""技能索引测试"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.agents.skills_index import IndexedSkillsMiddleware, SkillsIndex
+
+SKILL = """---
+name: "xhs-copywriting"
+description: "小红书文案创作专家。当用户需要创作小红书风格文案、种草笔记、产品推荐文案时调用此技能。"
+---
+
+# 小红书文案创作技能
+
+标题要有数字和表情。
+"""
+
+
+def _write_skill(root, name="xhs-copywriting", content=SKILL):
+    skill_dir = root / name
+    skill_dir.mkdir(parents=True, exist_ok=True)
+    (skill_dir / "SKILL.md").write_text(content, encoding="utf-8")
+    return skill_dir / "SKILL.md"
+
+
+@pytest.fixture
+def index(tmp_path):
+    _write_skill(tmp_path)
+    index = SkillsIndex(tmp_path, min_score=0.15)
+    index.load()
+    return index
+
+
+class TestSkillsIndex:
+    """SkillsIndex 测试"""
+
+    def test_load_parses_frontmatter_and_body(self, index):
+        metadata = index.metadata()
+        assert len(metadata) == 1
+        assert metadata[0]["name"] == "xhs-copywriting"
+        assert metadata[0]["path"] == "/skills/xhs-copywriting/SKILL.md"
+
+        entry = index.get("xhs-copywriting")
+        assert "标题要有数字和表情" in entry.body
+        assert len(entry.content_hash) == 64
+
+    def test_invalid_skill_is_skipped(self, tmp_path):
+        _write_skill(tmp_path, "broken", "no frontmatter")
+        index = SkillsIndex(tmp_path)
+        assert index.load() == 0
+
+    def test_match(self, index):
+        assert index.match("帮我写一篇小红书种草文案，推荐一款防晒霜").name == "xhs-copywriting"
+        assert index.match("你好") is None
+        assert index.match("帮我搜索一下今天的天气") is None
+
+    def test_reload_reuses_unchanged_entries(self, index, tmp_path):
+        entry = index.get("xhs-copywriting")
+        index.load()
+        assert index.get("xhs-copywriting") is entry
+
+        _write_skill(tmp_path, content=SKILL.replace("标题要有数字和表情", "标题要简短"))
+        index.load()
+        updated = index.get("xhs-copywriting")
+        assert updated is not entry
+        assert "标题要简短" in updated.body
+
+    @pytest.mark.asyncio
+    async def test_watcher_hot_reloads(self, index, tmp_path):
+        index.start_watching()
+        try:
+            await asyncio.sleep(0.2)
+            _write_skill(tmp_path, "code-review", SKILL.replace("xhs-copywriting", "code-review"))
+            for _ in range(50):
+                if index.get("code-review") is not None:
+                    break
+                await asyncio.sleep(0.1)
+            assert index.get("code-review") is not None
+        finally:
+            await index.stop_watching()
+        assert index.get_stats()["watching"] is False
+
+
+class TestIndexedSkillsMiddleware:
+    """IndexedSkillsMiddleware 测试"""
+
+    def _request(self, text):
+        request = MagicMock()
+        request.messages = [HumanMessage(content=text)]
+        request.system_message = SystemMessage(content="base")
+        request.override.side_effect = lambda **kwargs: kwargs
+        return request
+
+    def test_before_agent_uses_index_without_backend(self, index):
+        backend = MagicMock()
+        middleware = IndexedSkillsMiddleware(index=index, backend=backend, sources=["/skills/"])
+
+        update = middleware.before_agent({}, MagicMock(), {})
+        assert update["skills_metadata"] == index.metadata()
+        assert middleware.before_agent(update, MagicMock(), {}) is None
+        assert not backend.method_calls
+
+    def test_matched_skill_body_is_injected(self, index):
+        middleware = IndexedSkillsMiddleware(index=index, backend=MagicMock(), sources=["/skills/"])
+
+        result = middleware.modify_request(self._request("写一篇小红书种草笔记"))
+        prompt = result["system_message"].text
+        assert "xhs-copywriting" in prompt
+        assert "已加载技能" in prompt
+        assert "标题要有数字和表情" in prompt
+
+    def test_unmatched_request_lists_skills_only(self, index):
+        middleware = IndexedSkillsMiddleware(index=index, backend=MagicMock(), sources=["/skills/"])
+
+        prompt = middleware.modify_request(self._request("你好"))["system_message"].text
+        assert "xhs-copywriting" in prompt
+        assert "已加载技能" not in prompt
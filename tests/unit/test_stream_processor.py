@@ -0,0 +1,278 @@
+"""StreamProcessor 单遍事件管道测试"""
+
+import json
+import threading
+from typing import Any, List
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+
+from app.agents.stream_events import ToolStreamEventsMiddleware
+from app.services.stream.stream_processor import StreamProcessor
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按脚本依次返回消息的模型，流式时把工具调用拆成 tool_call_chunks"""
+
+    responses: List[Any]
+    index: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _next(self) -> AIMessage:
+        message = self.responses[self.index]
+        self.index += 1
+        return message
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self._next())])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._next()
+        if message.content:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content))
+        for idx, tool_call in enumerate(message.tool_calls):
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": tool_call["name"], "args": "", "id": tool_call["id"], "index": idx}
+            ]))
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": None, "args": json.dumps(tool_call["args"]), "id": None, "index": idx}
+            ]))
+
+
+@tool(response_format="content_and_artifact")
+async def web_search(query: str):
+    """搜索"""
+    summary = {"type": "search_results", "query": query, "count": 2, "links": [{"title": "a", "url": "u"}]}
+    return json.dumps({**summary, "results": ["r1", "r2"]}), summary
+
+
+class TestStreamProcessorPipeline:
+    """messages + custom 单遍管道测试"""
+
+    @pytest.mark.asyncio
+    async def test_tool_turn_events_in_order(self):
+        model = ScriptedChatModel(responses=[
+            AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"query": "x"}, "id": "call_1"}]),
+            AIMessage(content="答案"),
+        ])
+        agent = create_agent(model=model, tools=[web_search], middleware=[ToolStreamEventsMiddleware()])
+
+        events = [
+            event async for event in StreamProcessor().process_agent_stream(agent, {}, "hi", False)
+        ]
+        types = [event["type"] for event in events]
+
+        assert types == ["tool_call_delta", "tool_call_delta", "tool_call", "tool_result", "token"]
+        assert events[0]["data"]["calls"][0]["name"] == "web_search"
+        assert events[2]["data"]["calls"][0]["args_preview"] == "query=x"
+        assert events[3]["data"]["summary"] == "找到 2 条结果"
+        assert events[3]["data"]["links"] == [{"title": "a", "url": "u"}]
+        assert events[4]["data"]["content"] == "答案"
+
+
+    @pytest.mark.asyncio
+    async def test_tool_details_are_streamed_but_not_checkpointed(self):
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        @tool(response_format="content_and_artifact")
+        async def translate_text(text: str, target_lang: str):
+            """翻译"""
+            payload = {"type": "translation", "target_lang": target_lang, "translated_text": "hello"}
+            return json.dumps(payload), {"type": "translation", "target_lang": target_lang, "details": "hello"}
+
+        model = ScriptedChatModel(responses=[
+            AIMessage(content="", tool_calls=[
+                {"name": "translate_text", "args": {"text": "你好", "target_lang": "en"}, "id": "call_1"}
+            ]),
+            AIMessage(content="hello"),
+        ])
+        agent = create_agent(
+            model=model, tools=[translate_text], middleware=[ToolStreamEventsMiddleware()],
+            checkpointer=InMemorySaver(),
+        )
+        config = {"configurable": {"thread_id": "t1"}}
+
+        events = [
+            event async for event in StreamProcessor().process_agent_stream(agent, config, "翻译", False)
+        ]
+        result = next(event for event in events if event["type"] == "tool_result")
+        assert result["data"]["summary"] == "已翻译为英语"
+        assert result["data"]["details"] == "hello"
+
+        state = await agent.aget_state(config)
+        tool_message = state.values["messages"][2]
+        assert tool_message.artifact == {"type": "translation", "target_lang": "en"}
+
+
+class FakeAgentFactory:
+    """基于 InMemorySaver 的 AgentFactory 替身，记录完整 Agent 的调用"""
+
+    def __init__(self, agent_model, middleware=()):
+        from langgraph.checkpoint.memory import InMemorySaver
+        from langgraph.store.memory import InMemoryStore
+
+        self.checkpointer = InMemorySaver()
+        self.store = InMemoryStore()
+        self.agent = create_agent(
+            model=agent_model, tools=[], middleware=list(middleware), checkpointer=self.checkpointer
+        )
+        self.full_path_calls = 0
+        self.build_threads = []
+
+    def create_chat_agent(self, is_expert=False, enable_thinking=False, tools=None):
+        if tools is None or tools:
+            self.full_path_calls += 1
+            self.build_threads.append(threading.get_ident())
+        return self.agent
+
+    def get_agent_config(self, conversation_id, user_id=None):
+        return {"configurable": {"thread_id": f"conversation_{conversation_id}"}}, None
+
+    def get_store(self):
+        return self.store
+
+
+async def _collect(processor, factory, content, conversation_id=1, **kwargs):
+    return [
+        event async for event in processor.process_message(
+            conversation_id=conversation_id, content=content, agent_factory=factory, user_id=1, **kwargs
+        )
+    ]
+
+
+class TestFastPath:
+    """简单轮次快速路径测试"""
+
+    @pytest.mark.asyncio
+    async def test_small_talk_bypasses_agent_and_keeps_state(self):
+        from unittest.mock import patch
+
+        factory = FakeAgentFactory(ScriptedChatModel(responses=[AIMessage(content="今天天气晴")]))
+        fast_model = ScriptedChatModel(responses=[AIMessage(content="你好呀")])
+        processor = StreamProcessor()
+
+        with patch("app.llm.model_factory.ModelFactory.get_general_model", return_value=fast_model):
+            events = await _collect(processor, factory, "你好")
+
+        assert events == [
+            {"type": "token", "data": {"content": "你好呀"}},
+            {"type": "model", "data": {"model": "fast", "model_name": None}},
+        ]
+        assert factory.full_path_calls == 0
+
+        config, _ = factory.get_agent_config("1")
+        state = await factory.agent.aget_state(config)
+        assert [m.content for m in state.values["messages"]] == ["你好", "你好呀"]
+
+        # 后续完整 Agent 轮次在同一线程上继续
+        events = await _collect(processor, factory, "帮我搜索一下今天的天气")
+        assert events[-1]["data"]["content"] == "今天天气晴"
+        state = await factory.agent.aget_state(config)
+        assert [m.content for m in state.values["messages"]] == ["你好", "你好呀", "帮我搜索一下今天的天气", "今天天气晴"]
+
+    @pytest.mark.asyncio
+    async def test_new_thread_has_no_pending_nodes_with_middleware(self):
+        from unittest.mock import patch
+
+        from langchain.agents.middleware import (
+            ModelCallLimitMiddleware,
+            SummarizationMiddleware,
+            ToolCallLimitMiddleware,
+        )
+
+        agent_model = ScriptedChatModel(responses=[AIMessage(content="今天天气晴")])
+        factory = FakeAgentFactory(agent_model, middleware=[
+            SummarizationMiddleware(model=agent_model, trigger=("tokens", 8000)),
+            ToolCallLimitMiddleware(run_limit=5, exit_behavior="end"),
+            ModelCallLimitMiddleware(run_limit=50, exit_behavior="end"),
+        ])
+        fast_model = ScriptedChatModel(responses=[AIMessage(content="你好呀")])
+
+        with patch("app.llm.model_factory.ModelFactory.get_general_model", return_value=fast_model):
+            await _collect(StreamProcessor(), factory, "你好", conversation_id=3)
+
+        config, _ = factory.get_agent_config("3")
+        state = await factory.agent.aget_state(config)
+        assert state.next == ()
+        assert [m.content for m in state.values["messages"]] == ["你好", "你好呀"]
+
+        events = await _collect(StreamProcessor(), factory, "帮我搜索一下今天的天气", conversation_id=3)
+        assert events[-1]["data"]["content"] == "今天天气晴"
+
+    @pytest.mark.asyncio
+    async def test_agent_is_built_off_the_event_loop(self):
+        factory = FakeAgentFactory(ScriptedChatModel(responses=[AIMessage(content="晴")]))
+
+        await _collect(StreamProcessor(), factory, "北京明天会下雨吗", conversation_id=4)
+
+        assert factory.build_threads and threading.get_ident() not in factory.build_threads
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_agent_when_fast_model_fails(self):
+        from unittest.mock import MagicMock, patch
+
+        factory = FakeAgentFactory(ScriptedChatModel(responses=[AIMessage(content="完整回复")]))
+        broken = MagicMock()
+        broken.astream.side_effect = RuntimeError("upstream down")
+
+        with patch("app.llm.model_factory.ModelFactory.get_general_model", return_value=broken):
+            events = await _collect(StreamProcessor(), factory, "嗨", conversation_id=2)
+
+        assert events == [{"type": "token", "data": {"content": "完整回复"}}]
+
+    @pytest.mark.parametrize("content, attachments, thinking, tools, expected", [
+        ("你好", None, False, [], True),
+        ("你好", ["a.png"], False, [], False),
+        ("你好", None, True, [], False),
+        ("你好", None, False, None, False),
+        ("你好", None, False, [web_search], False),
+        ("嗯" * 100, None, False, [], False),
+        # 未选中工具但不是闲聊：实时、领域问题走完整 Agent
+        ("北京明天会下雨吗", None, False, [], False),
+        ("今天美元兑人民币汇率多少", None, False, [], False),
+        ("谢谢你", None, False, [], True),
+        ("好的，谢谢", None, False, [], True),
+        # 依赖上下文的短追问走完整 Agent
+        ("继续", None, False, [], False),
+        ("总结一下", None, False, [], False),
+        ("展开讲讲", None, False, [], False),
+        ("改短一点", None, False, [], False),
+        ("用英文回答", None, False, [], False),
+        ("写一首诗", None, False, [], False),
+        ("好的，用英文回答", None, False, [], False),
+    ])
+    def test_should_route(self, content, attachments, thinking, tools, expected):
+        from app.services.stream.fast_path import FastPathRouter
+
+        assert FastPathRouter.should_route(content, attachments, thinking, tools) is expected
+
+    def test_recent_history_keeps_summary(self):
+        from unittest.mock import patch
+
+        from langchain_core.messages import HumanMessage, ToolMessage
+
+        from app.services.stream.fast_path import FastPathRouter
+
+        messages = [
+            HumanMessage(content="此前对话摘要", additional_kwargs={"lc_source": "summarization"}),
+            HumanMessage(content="搜索天气"),
+            AIMessage(content="", tool_calls=[{"name": "web_search", "args": {}, "id": "c1"}]),
+            ToolMessage(content="晴", tool_call_id="c1"),
+            AIMessage(content="今天晴"),
+            HumanMessage(content="谢谢"),
+            AIMessage(content="不客气"),
+        ]
+        with patch("app.services.stream.fast_path.settings.fast_path_history_messages", 2):
+            history = FastPathRouter._recent_history(messages)
+
+        assert [m.content for m in history] == ["此前对话摘要", "谢谢", "不客气"]
@@ -0,0 +1,141 @@
+"""上游调用遥测测试"""
+
+import asyncio
+import logging
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+
+from app.core.request_context import request_id_var
+from app.llm.telemetry import Histogram, ModelTelemetry, TelemetryCallbackHandler
+
+
+@pytest.fixture
+def telemetry():
+    return ModelTelemetry()
+
+
+class TestHistogram:
+    """Histogram 测试"""
+
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot["buckets"] == {"0.1": 1, "1.0": 3, "+Inf": 4}
+        assert snapshot["count"] == 4 and snapshot["sum"] == 6.05
+        assert snapshot["p50"] == 1.0
+        assert snapshot["p99"] == float("inf")
+
+    def test_empty(self):
+        assert Histogram((1.0,)).snapshot()["p90"] is None
+
+
+class TestToolModelTelemetry:
+    """DashScope SDK 调用包装"""
+
+    @pytest.mark.asyncio
+    async def test_records_duration_and_usage(self, telemetry):
+        response = MagicMock(status_code=200, usage={"input_tokens": 120, "output_tokens": 30})
+        call = telemetry.timed("qwen-mt-flash", AsyncMock(return_value=response))
+
+        assert await call(model="qwen-mt-flash") is response
+
+        stats = telemetry.get_stats()["tool_model"]["qwen-mt-flash"]
+        assert stats["calls"] == 1 and stats["errors"] == 0
+        assert stats["input_tokens"]["sum"] == 120
+        assert stats["output_tokens"]["sum"] == 30
+
+    @pytest.mark.asyncio
+    async def test_errors_and_error_responses(self, telemetry):
+        failing = telemetry.timed("ocr", AsyncMock(side_effect=RuntimeError("boom")))
+        with pytest.raises(RuntimeError):
+            await failing()
+        await telemetry.timed("ocr", AsyncMock(return_value=MagicMock(status_code=400, usage=None)))()
+
+        stats = telemetry.get_stats()["tool_model"]["ocr"]
+        assert stats["calls"] == 2 and stats["errors"] == 2
+
+
+class TestTelemetryCallbackHandler:
+    """聊天模型与工具回调"""
+
+    @pytest.mark.asyncio
+    async def test_streaming_chat_model(self, telemetry):
+        handler = TelemetryCallbackHandler(telemetry)
+        model = GenericFakeChatModel(messages=iter([AIMessage(content="hello big world")]), callbacks=[handler])
+
+        chunks = [chunk async for chunk in model.astream("hi")]
+
+        stats = next(iter(telemetry.get_stats()["model"].values()))
+        assert stats["calls"] == 1
+        assert stats["ttft_seconds"]["count"] == 1
+        assert stats["inter_token_seconds"]["count"] == len([c for c in chunks if c.content]) - 1
+        assert not handler._runs
+
+    @pytest.mark.asyncio
+    async def test_tool_calls_retries_and_errors(self, telemetry):
+        handler = TelemetryCallbackHandler(telemetry)
+
+        @tool
+        async def lookup(query: str) -> str:
+            """查询"""
+            if query == "bad":
+                raise ValueError("bad query")
+            return "ok"
+
+        call = {"name": "lookup", "args": {"query": "x"}, "id": "call_1", "type": "tool_call"}
+        await lookup.ainvoke(call, config={"callbacks": [handler]})
+        await lookup.ainvoke(call, config={"callbacks": [handler]})
+        with pytest.raises(ValueError):
+            await lookup.ainvoke({"query": "bad"}, config={"callbacks": [handler]})
+
+        stats = telemetry.get_stats()["tool"]["lookup"]
+        assert stats["calls"] == 3
+        assert stats["retries"] == 1
+        assert stats["errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_tool_runs_are_bounded(self, telemetry):
+        """取消的工具调用不触发 on_tool_error，未结束的记录按 max_runs 淘汰"""
+        handler = TelemetryCallbackHandler(telemetry, max_runs=2)
+        started = asyncio.Event()
+
+        @tool
+        async def slow(query: str) -> str:
+            """慢查询"""
+            started.set()
+            await asyncio.Event().wait()
+            return "never"
+
+        for i in range(3):
+            started.clear()
+            task = asyncio.create_task(slow.ainvoke({"query": str(i)}, config={"callbacks": [handler]}))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert len(handler._runs) == 2
+        assert "tool" not in telemetry.get_stats()
+
+    @pytest.mark.asyncio
+    async def test_request_id_is_logged(self, telemetry, caplog):
+        handler = TelemetryCallbackHandler(telemetry)
+        model = GenericFakeChatModel(messages=iter([AIMessage(content="hi")]), callbacks=[handler])
+
+        token = request_id_var.set("req-123")
+        try:
+            with caplog.at_level(logging.DEBUG, logger="app.llm.telemetry"):
+                await model.ainvoke("hi")
+        finally:
+            request_id_var.reset(token)
+
+        records = [r for r in caplog.records if r.name == "app.llm.telemetry"]
+        assert records and records[-1].request_id == "req-123"
+        assert records[-1].extra_data["kind"] == "model"
@@ -0,0 +1,160 @@
+"""请求阶段耗时测试"""
+
+import logging
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.api.middleware.tracing import RequestTracingMiddleware
+from app.core.timing import RequestTiming, current_timing, request_timing_var, span, traced
+
+
+@pytest.fixture
+def timing():
+    timing = RequestTiming(expose=True)
+    token = request_timing_var.set(timing)
+    yield timing
+    request_timing_var.reset(token)
+
+
+class TestSpan:
+    """span API"""
+
+    def test_noop_outside_request(self):
+        assert current_timing() is None
+        with span("noop") as attrs:
+            attrs["rows"] = 1
+
+    @pytest.mark.asyncio
+    async def test_records_spans_and_errors(self, timing):
+        @traced("lookup")
+        async def lookup():
+            return 42
+
+        assert await lookup() == 42
+        with pytest.raises(ValueError):
+            with span("persist", table="message"):
+                raise ValueError("boom")
+
+        lookup_span, persist_span = timing.summary()["spans"]
+        assert lookup_span["name"] == "lookup" and lookup_span["duration_ms"] >= 0
+        assert persist_span == {**persist_span, "table": "message", "error": "ValueError"}
+
+    def test_server_timing_merges_by_name(self, timing):
+        timing.add("tool.web_search", timing.started, 0.01)
+        timing.add("tool.web_search", timing.started, 0.02)
+        timing.add("model.qwen max", timing.started, 0.5)
+
+        header = timing.server_timing_header()
+        assert 'tool.web_search;dur=30.0;desc="x2"' in header
+        assert "model.qwen_max;dur=500.0" in header
+        assert header.split(", ")[-1].startswith("total;dur=")
+
+
+class TestTimingMiddleware:
+    """Server-Timing 头与 [TIMING] 日志"""
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        app.add_middleware(RequestTracingMiddleware)
+
+        @app.get("/items")
+        @traced("handler")
+        async def items():
+            with span("query"):
+                pass
+            return {"ok": True}
+
+        @app.get("/stream")
+        async def stream():
+            async def body():
+                with span("persist"):
+                    yield "data: 1\n\n"
+
+            return StreamingResponse(body(), media_type="text/event-stream")
+
+        return TestClient(app)
+
+    def test_server_timing_header(self, client, caplog):
+        with caplog.at_level(logging.INFO, logger="app.api.middleware.tracing"):
+            response = client.get("/items", headers={"X-Request-ID": "req-1"})
+
+        names = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        assert names == ["query", "handler", "total"]
+
+        record = next(r for r in caplog.records if r.getMessage().startswith("[TIMING]"))
+        assert record.request_id == "req-1"
+        assert [s["name"] for s in record.extra_data["spans"]] == ["query", "handler"]
+
+    def test_hidden_in_production(self, client, caplog):
+        with patch("app.core.timing.settings.app_env", "production"), \
+             patch("app.core.timing.settings.profiling_token", "secret"), \
+             caplog.at_level(logging.INFO, logger="app.api.middleware.tracing"):
+            hidden = client.get("/items")
+            debug = client.get("/items", headers={"X-Profile": "secret"})
+
+        assert "Server-Timing" not in hidden.headers
+        assert "Server-Timing" in debug.headers
+        # 日志不受影响
+        assert sum(r.getMessage().startswith("[TIMING]") for r in caplog.records) == 2
+
+    def test_stream_spans_logged_after_body(self, client, caplog):
+        with caplog.at_level(logging.INFO, logger="app.api.middleware.tracing"):
+            response = client.get("/stream")
+
+        assert response.headers["Server-Timing"].startswith("total;")
+        record = next(r for r in caplog.records if r.getMessage().startswith("[TIMING]"))
+        assert [s["name"] for s in record.extra_data["spans"]] == ["persist"]
+
+
+class TestTimingEvent:
+    """聊天流 timing 事件"""
+
+    @staticmethod
+    def make_emitter():
+        from app.services.stream import SSEEmitter
+
+        async def process_message(**kwargs):
+            yield {"type": "token", "data": {"content": "hi"}}
+
+        processor = MagicMock()
+        processor.process_message = process_message
+        return SSEEmitter(stream_processor=processor, message_repository=MagicMock(create_message=AsyncMock()))
+
+    @pytest.mark.asyncio
+    async def test_timing_before_done(self, timing):
+        events = [e async for e in self.make_emitter().generate_events(AsyncMock(), 1, 1, "hi")]
+
+        assert [e["type"] for e in events][-2:] == ["timing", "done"]
+        assert [s["name"] for s in events[-2]["data"]["spans"]] == ["persist"]
+
+    @pytest.mark.asyncio
+    async def test_no_timing_event_when_not_exposed(self):
+        token = request_timing_var.set(RequestTiming(expose=False))
+        try:
+            events = [e async for e in self.make_emitter().generate_events(AsyncMock(), 1, 1, "hi")]
+        finally:
+            request_timing_var.reset(token)
+        assert "timing" not in [e["type"] for e in events]
+
+    @pytest.mark.asyncio
+    async def test_no_timing_outside_request(self):
+        events = [e async for e in self.make_emitter().generate_events(AsyncMock(), 1, 1, "hi")]
+        assert "timing" not in [e["type"] for e in events]
+
+
+@pytest.mark.asyncio
+async def test_telemetry_callback_records_tool_span(timing):
+    from app.llm.telemetry import ModelTelemetry, TelemetryCallbackHandler
+
+    handler = TelemetryCallbackHandler(ModelTelemetry())
+    run_id = uuid4()
+    await handler.on_tool_start({"name": "web_search"}, "q", run_id=run_id)
+    await handler.on_tool_end("ok", run_id=run_id)
+
+    assert [s["name"] for s in timing.summary()["spans"]] == ["tool.web_search"]
@@ -0,0 +1,160 @@
+"""工具结果缓存测试"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.cache.tool_cache import INDEX_KEY, ToolResultCache, file_fingerprint
+
+
+class FakeRedis:
+    """只实现工具缓存用到的命令"""
+
+    def __init__(self):
+        self.values = {}
+        self.index = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            if key == INDEX_KEY:
+                self.index.clear()
+
+    async def zadd(self, key, mapping):
+        self.index.update(mapping)
+
+    async def zcard(self, key):
+        return len(self.index)
+
+    async def zpopmin(self, key, count):
+        popped = sorted(self.index.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del self.index[member]
+        return popped
+
+    async def zrange(self, key, start, end):
+        return [member for member, _ in sorted(self.index.items(), key=lambda item: item[1])]
+
+
+@pytest.fixture
+def redis():
+    fake = FakeRedis()
+    client = MagicMock()
+    client.client = fake
+    with patch("app.cache.tool_cache.redis_client", client):
+        yield fake
+
+
+@pytest.fixture
+def cache():
+    return ToolResultCache()
+
+
+class TestToolResultCache:
+    """ToolResultCache 测试"""
+
+    @pytest.mark.asyncio
+    async def test_repeat_call_is_served_from_cache(self, redis, cache):
+        compute = AsyncMock(return_value="hello")
+
+        first = await cache.get_or_compute("translate_text", "qwen-mt", {"text": "你好 "}, compute)
+        second = await cache.get_or_compute("translate_text", "qwen-mt", {"text": " 你好"}, compute)
+
+        assert first == second == "hello"
+        compute.assert_awaited_once()
+        stats = cache.get_stats()["tools"]["translate_text"]
+        assert stats["hits"] == 1 and stats["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_key_depends_on_model_and_args(self, redis, cache):
+        base = await cache.make_key("code_assist", "coder", {"prompt": "x"})
+        assert base != await cache.make_key("code_assist", "coder-plus", {"prompt": "x"})
+        assert base != await cache.make_key("code_assist", "coder", {"prompt": "y"})
+        assert base != await cache.make_key("translate_text", "coder", {"prompt": "x"})
+
+    @pytest.mark.asyncio
+    async def test_file_content_hash_in_key(self, redis, cache, tmp_path):
+        a, b = tmp_path / "a.png", tmp_path / "b.png"
+        a.write_bytes(b"same image")
+        b.write_bytes(b"same image")
+
+        key_a = await cache.make_key("ocr_document", "ocr", {}, files=[str(a)])
+        assert key_a == await cache.make_key("ocr_document", "ocr", {}, files=[str(b)])
+
+        b.write_bytes(b"other image")
+        assert key_a != await cache.make_key("ocr_document", "ocr", {}, files=[str(b)])
+
+    @pytest.mark.asyncio
+    async def test_url_fingerprint_is_url(self):
+        assert await file_fingerprint("https://example.com/a.png") == "https://example.com/a.png"
+
+    @pytest.mark.asyncio
+    async def test_errors_are_not_cached(self, redis, cache):
+        compute = AsyncMock(side_effect=[RuntimeError("boom"), "ok"])
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("code_assist", "coder", {"prompt": "x"}, compute)
+        assert await cache.get_or_compute("code_assist", "coder", {"prompt": "x"}, compute) == "ok"
+
+    @pytest.mark.asyncio
+    async def test_oversized_result_is_skipped(self, redis, cache):
+        with patch("app.cache.tool_cache.settings.tool_cache_max_entry_bytes", 10):
+            await cache.get_or_compute("code_assist", "coder", {}, AsyncMock(return_value="x" * 100))
+        assert not redis.values
+        assert cache.get_stats()["tools"]["code_assist"]["skipped"] == 1
+
+    @pytest.mark.asyncio
+    async def test_oldest_entries_evicted(self, redis, cache):
+        with patch("app.cache.tool_cache.settings.tool_cache_max_entries", 2):
+            for i in range(3):
+                await cache.get_or_compute("code_assist", "coder", {"prompt": str(i)}, AsyncMock(return_value=i))
+
+        first = await cache.make_key("code_assist", "coder", {"prompt": "0"})
+        assert len(redis.index) == 2
+        assert first not in redis.values
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_calls_share_one_request(self, redis, cache):
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "text"
+
+        results = await asyncio.gather(
+            *[cache.get_or_compute("ocr_document", "ocr", {"prompt": "p"}, compute) for _ in range(3)]
+        )
+        assert results == ["text"] * 3
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_redis_unavailable_falls_back_to_model(self, cache):
+        client = MagicMock()
+        type(client).client = property(lambda self: (_ for _ in ()).throw(RuntimeError("not connected")))
+        with patch("app.cache.tool_cache.redis_client", client):
+            assert await cache.get_or_compute("code_assist", "coder", {}, AsyncMock(return_value="ok")) == "ok"
+        assert cache.get_stats()["tools"]["code_assist"]["errors"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, redis, cache):
+        compute = AsyncMock(return_value="ok")
+        with patch("app.cache.tool_cache.settings.tool_cache_enabled", False):
+            await cache.get_or_compute("code_assist", "coder", {}, compute)
+            await cache.get_or_compute("code_assist", "coder", {}, compute)
+        assert compute.await_count == 2
+        assert not redis.values
+
+    @pytest.mark.asyncio
+    async def test_clear(self, redis, cache):
+        await cache.get_or_compute("code_assist", "coder", {}, AsyncMock(return_value="ok"))
+        assert await cache.clear() == 1
+        assert not redis.values and not redis.index
@@ -0,0 +1,113 @@
+"""工具子集预选测试"""
+
+import pytest
+
+from app.agents.tool_selector import TOOL_GROUPS, ToolSelector, is_greeting, is_small_talk
+
+
+@pytest.fixture
+def selector():
+    return ToolSelector(min_score=0.06, small_talk_chars=6, cache_size=16)
+
+
+def _names(tools):
+    return {t.name for t in tools}
+
+
+class TestToolSelector:
+    """ToolSelector 测试"""
+
+    @pytest.mark.parametrize("message", ["你好", "讲个笑话", "谢谢你的帮助", "Hello!", "好的，谢谢"])
+    def test_chit_chat_binds_no_tools(self, selector, message):
+        assert selector.select(message) == []
+
+    @pytest.mark.parametrize("message", [
+        "北京明天会下雨吗",
+        "今天美元兑人民币汇率多少",
+        "帮我总结一下这篇文章的要点",
+    ])
+    def test_unmatched_questions_bind_all_tools(self, selector, message):
+        """未命中关键词的实时/领域问题保留全部工具"""
+        assert selector.select_groups(message) == frozenset(TOOL_GROUPS)
+
+    @pytest.mark.parametrize("message, expected", [
+        ("帮我搜索一下今天北京的天气", {"web_search"}),
+        ("扫地机器人滤网多久换一次", {"search_knowledge_base"}),
+        ("把这段话翻译成英文", {"translate_text"}),
+        ("写一个 Python 快速排序", {"code_assist"}),
+        ("帮我画一只猫", {"generate_image", "edit_image"}),
+        ("把这张图片改成卡通风格", {"understand_image", "ocr_document", "generate_image", "edit_image"}),
+        ("帮我把照片背景换成蓝色", {"understand_image", "ocr_document", "generate_image", "edit_image"}),
+        ("给这张照片加个滤镜", {"understand_image", "ocr_document", "generate_image", "edit_image"}),
+    ])
+    def test_keyword_selection(self, selector, message, expected):
+        assert _names(selector.select(message)) == expected
+        assert expected <= _names(selector.select(message, attachments=["a.png"]))
+
+    def test_similarity_selection(self, selector):
+        """未命中关键词时按工具描述相似度选择"""
+        assert "search_knowledge_base" in _names(selector.select("我的机器总是卡住不动怎么办"))
+
+    def test_similarity_only_when_no_keyword_matches(self, selector):
+        groups = selector.select_groups("搜索一下最新的python新闻")
+        assert "search" in groups
+        assert "knowledge" not in groups
+
+    def test_too_many_groups_bind_all_tools(self, selector):
+        """工具组合数限制在少数几档：超过 max_groups 时绑定全部工具"""
+        groups = selector.select_groups("搜索 python 代码并翻译", attachments=["a.pdf"])
+        assert groups == frozenset(TOOL_GROUPS)
+
+    def test_attachments_select_by_extension(self, selector):
+        tools = selector.select("帮我看看", attachments=["uploads/a.PDF", "uploads/b.png"])
+        assert _names(tools) == {
+            "read_pdf", "read_word", "understand_image", "ocr_document", "generate_image", "edit_image"
+        }
+
+    def test_long_unmatched_message_binds_all_tools(self, selector):
+        groups = selector.select_groups("嗯" * 300)
+        assert groups == frozenset(TOOL_GROUPS)
+
+    def test_previous_turn_groups_are_kept(self, selector):
+        selector.select("帮我搜索一下今天北京的天气", conversation_id=1)
+        assert _names(selector.select("上海的", conversation_id=1)) == {"web_search"}
+        # 只保留上一轮
+        assert selector.select("好的谢谢", conversation_id=1) == []
+        # 其他对话不受影响：没有上一轮可参考的追问绑定全部工具
+        assert selector.select_groups("那上海呢", conversation_id=2) == frozenset(TOOL_GROUPS)
+
+    def test_selection_cache(self, selector):
+        selector.select("帮我搜索 新闻")
+        selector.select("帮我搜索   新闻")
+        stats = selector.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("你好呀", True),
+    ("谢谢", True),
+    ("thank you so much", True),
+    ("嗯嗯", True),
+    ("你好，请问怎么退货", False),
+    ("hilton hotel price", False),
+    ("北京明天会下雨吗", False),
+    ("", False),
+])
+def test_is_small_talk(message, expected):
+    assert is_small_talk(message, max_chars=6) is expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("你好呀", True),
+    ("好的谢谢", True),
+    ("thank you so much", True),
+    ("嗯嗯", True),
+    ("继续", False),
+    ("总结一下", False),
+    ("好的，写一首诗", False),
+    ("hilton hotel price", False),
+    ("", False),
+])
+def test_is_greeting(message, expected):
+    assert is_greeting(message) is expected
@@ -0,0 +1,235 @@
+"""上游自适应限流测试"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.agents.error_classifier import AgentErrorClassifier, AgentErrorType
+from app.agents.upstream_limit import UpstreamBusyToolMiddleware, retry_unless_busy
+from app.llm.upstream_limiter import (
+    AdaptiveLimiter,
+    UpstreamBusyError,
+    UpstreamLimiters,
+    is_throttled,
+    retry_after,
+)
+
+
+@pytest.fixture(autouse=True)
+def local_only():
+    with patch("app.llm.upstream_limiter.settings.upstream_limiter_shared", False), \
+         patch("app.llm.upstream_limiter.settings.upstream_default_retry_after", 0.05):
+        yield
+
+
+class TestThrottleSignals:
+    """限流信号识别"""
+
+    def test_dashscope_response(self):
+        response = MagicMock(status_code=429, code="Throttling.RateQuota")
+        assert is_throttled(response)
+        assert not is_throttled(MagicMock(status_code=200, code=""))
+
+    def test_exceptions(self):
+        from tavily.errors import UsageLimitExceededError
+
+        assert is_throttled(UsageLimitExceededError("limit"))
+        assert is_throttled(RuntimeError("Requests rate limit exceeded"))
+        assert not is_throttled(ValueError("bad input"))
+
+    def test_retry_after_header(self):
+        error = RuntimeError("429")
+        error.response = MagicMock(headers={"Retry-After": "3"})
+        assert retry_after(error) == 3.0
+        assert retry_after(ValueError("x")) is None
+
+
+class TestAdaptiveLimiter:
+    """AdaptiveLimiter 测试"""
+
+    @pytest.mark.asyncio
+    async def test_window_limits_concurrency(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=2, qps=0)
+        running = peak = 0
+
+        async def work():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.02)
+                running -= 1
+
+        await asyncio.gather(*[work() for _ in range(6)])
+        assert peak == 2
+        assert limiter.get_stats()["in_flight"] == 0
+        assert limiter.get_stats()["queued"] == 4
+
+    @pytest.mark.asyncio
+    async def test_throttle_halves_window_then_recovers(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=8, qps=0)
+
+        await limiter.call(AsyncMock(return_value=MagicMock(status_code=429, code="Throttling")))
+        assert limiter.get_stats()["window"] == 4
+        assert limiter.get_stats()["throttled"] == 1
+
+        # 冷却期内新请求等待
+        assert limiter._local_reserve() > 0
+        await asyncio.sleep(0.06)
+
+        for _ in range(30):
+            await limiter.call(AsyncMock(return_value=MagicMock(status_code=200, code="")))
+        assert limiter.get_stats()["window"] == 8
+
+    @pytest.mark.asyncio
+    async def test_concurrent_throttles_halve_once(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=8, qps=0)
+        response = MagicMock(status_code=429, code="Throttling")
+
+        async def slow_call():
+            await asyncio.sleep(0.01)
+            return response
+
+        await asyncio.gather(*[limiter.call(slow_call) for _ in range(4)])
+        assert limiter.get_stats()["window"] == 4
+
+    @pytest.mark.asyncio
+    async def test_throttle_exception_recorded_and_raised(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=4, qps=0)
+        with pytest.raises(RuntimeError):
+            await limiter.call(AsyncMock(side_effect=RuntimeError("status_code: 429")))
+        assert limiter.get_stats()["window"] == 2
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_paces_requests(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=10, qps=20, burst=1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(3):
+            async with limiter.slot():
+                pass
+        assert loop.time() - started >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_fair_queue_round_robin(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=1, qps=0)
+        order = []
+
+        async def work(caller):
+            async with limiter.slot(caller=caller):
+                order.append(caller)
+                await asyncio.sleep(0.01)
+
+        # a 先占用窗口并排入 3 个请求，b 随后排入 1 个
+        tasks = [asyncio.create_task(work("a")) for _ in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(work("b")))
+        await asyncio.gather(*tasks)
+        assert order.index("b") <= 2
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_raises_busy(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=1, qps=0)
+        with patch("app.llm.upstream_limiter.settings.upstream_queue_timeout", 0.05):
+            async with limiter.slot():
+                with pytest.raises(UpstreamBusyError):
+                    async with limiter.slot():
+                        pass
+        stats = limiter.get_stats()
+        assert stats["rejected"] == 1
+        assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        limiter = AdaptiveLimiter("m", max_concurrency=1, qps=0)
+        with patch("app.llm.upstream_limiter.settings.upstream_limiter_enabled", False):
+            async with limiter.slot():
+                async with limiter.slot():
+                    pass
+        assert limiter.get_stats()["acquired"] == 0
+
+    @pytest.mark.asyncio
+    async def test_shared_bucket_and_cooldown_via_redis(self):
+        script = AsyncMock(side_effect=["0.02", "0"])
+        client = MagicMock()
+        client.register_script.return_value = script
+        client.set = AsyncMock()
+        redis = MagicMock(client=client)
+
+        limiter = AdaptiveLimiter("m", max_concurrency=2, qps=5)
+        with patch("app.llm.upstream_limiter.settings.upstream_limiter_shared", True), \
+             patch("app.cache.redis.redis_client", redis):
+            await limiter.call(AsyncMock(return_value=MagicMock(status_code=429, code="Throttling")))
+
+        assert script.await_count == 2
+        assert script.call_args.kwargs["keys"] == ["upstream:m:bucket", "upstream:m:cooldown"]
+        client.set.assert_awaited_once_with("upstream:m:cooldown", "1", px=50)
+
+    @pytest.mark.asyncio
+    async def test_shared_bucket_falls_back_to_local(self):
+        client = MagicMock()
+        client.register_script.side_effect = ConnectionError("redis down")
+        limiter = AdaptiveLimiter("m", max_concurrency=2, qps=5)
+        with patch("app.llm.upstream_limiter.settings.upstream_limiter_shared", True), \
+             patch("app.cache.redis.redis_client", MagicMock(client=client)):
+            async with limiter.slot():
+                pass
+        assert limiter.get_stats()["errors"] == 1
+
+
+class TestUpstreamLimiters:
+    """按上游名称的限流器注册表"""
+
+    def test_config_per_upstream(self):
+        limits = {"default": {"max_concurrency": 3, "qps": 1}, "tavily": {"max_concurrency": 2, "qps": 5}}
+        with patch("app.llm.upstream_limiter.settings.upstream_limits", limits):
+            registry = UpstreamLimiters()
+            assert registry.get("tavily").max_concurrency == 2
+            assert registry.get("qwen-plus").max_concurrency == 3
+            assert registry.get("tavily") is registry.get("tavily")
+            assert set(registry.get_stats()) == {"tavily", "qwen-plus"}
+
+    def test_busy_error_not_retried_and_classified(self):
+        error = UpstreamBusyError("tavily", 30)
+        assert retry_unless_busy(error) is False
+        assert retry_unless_busy(RuntimeError("x")) is True
+        assert AgentErrorClassifier.classify(error) == AgentErrorType.UPSTREAM_BUSY
+
+
+class TestUpstreamBusyTool:
+    """工具上游繁忙时 Agent 降级为错误 ToolMessage"""
+
+    @pytest.mark.asyncio
+    async def test_busy_tool_becomes_error_message(self):
+        from langchain.agents import create_agent
+        from langchain.agents.middleware import ToolRetryMiddleware
+        from langchain_core.messages import AIMessage, ToolMessage
+        from langchain_core.tools import tool
+
+        from tests.unit.test_stream_processor import ScriptedChatModel
+
+        calls = []
+
+        @tool
+        async def web_search(query: str) -> str:
+            """搜索"""
+            calls.append(query)
+            raise UpstreamBusyError("tavily", 1.0)
+
+        model = ScriptedChatModel(responses=[
+            AIMessage(content="", tool_calls=[{"name": "web_search", "args": {"query": "x"}, "id": "call_1"}]),
+            AIMessage(content="暂时无法搜索，直接回答"),
+        ])
+        agent = create_agent(model=model, tools=[web_search], middleware=[
+            UpstreamBusyToolMiddleware(),
+            ToolRetryMiddleware(max_retries=1, initial_delay=0, retry_on=retry_unless_busy),
+        ])
+
+        result = await agent.ainvoke({"messages": [{"role": "user", "content": "搜索 x"}]})
+
+        tool_message = next(m for m in result["messages"] if isinstance(m, ToolMessage))
+        assert tool_message.status == "error"
+        assert "tavily" in tool_message.content
+        assert calls == ["x"]
+        assert result["messages"][-1].content == "暂时无法搜索，直接回答"
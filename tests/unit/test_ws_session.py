@@ -0,0 +1,226 @@
+"""WebSocket 聊天会话测试"""
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from app.services.stream.ws_session import ChatWebSocketSession
+
+
+class FakeWebSocket:
+    """模拟 WebSocket：按顺序投递客户端消息，记录服务端发送的帧"""
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.closed_code = None
+
+    async def receive_text(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect(code=1000)
+        return message
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=None):
+        self.closed_code = code
+
+    def frames(self, event_type):
+        return [f for f in self.sent if f["type"] == event_type]
+
+
+class FakeEmitter:
+    """模拟 SSEEmitter：输出固定事件，可选择阻塞直到被取消"""
+
+    def __init__(self, block: bool = False):
+        self.block = block
+        self.message_repository = MagicMock()
+        self.message_repository.create_message = AsyncMock()
+
+    async def generate_events(self, db, conversation_id, user_id, content, **kwargs):
+        yield {"type": "content", "data": {"content": f"echo:{content}"}}
+        if self.block:
+            await asyncio.Event().wait()
+        yield {"type": "done"}
+
+
+@asynccontextmanager
+async def fake_session_factory():
+    db = MagicMock()
+    db.commit = AsyncMock()
+    yield db
+
+
+def make_session(websocket, emitter, **kwargs):
+    user = MagicMock()
+    user.id = 1
+    return ChatWebSocketSession(
+        websocket,
+        user,
+        sse_emitter=emitter,
+        session_factory=fake_session_factory,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def mock_get_conversation():
+    with patch(
+        "app.services.stream.ws_session.conversation_service.get_conversation",
+        new=AsyncMock(return_value=MagicMock()),
+    ) as mock_get:
+        yield mock_get
+
+
+class TestChatWebSocketSession:
+    """ChatWebSocketSession 多路复用测试"""
+
+    @pytest.mark.asyncio
+    async def test_chat_run_streams_tagged_events(self, mock_get_conversation):
+        """运行事件带有 run_id 和 conversation_id"""
+        websocket = FakeWebSocket()
+        emitter = FakeEmitter()
+        session = make_session(websocket, emitter)
+
+        await session.handle_message({"type": "chat", "run_id": "r1", "conversation_id": 7, "content": "hi"})
+        await asyncio.gather(*session._runs.values())
+
+        content = websocket.frames("content")
+        assert content == [{"type": "content", "run_id": "r1", "conversation_id": 7, "data": {"content": "echo:hi"}}]
+        assert websocket.frames("done")[0]["run_id"] == "r1"
+        emitter.message_repository.create_message.assert_awaited_once()
+        assert session._runs == {}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_runs_on_different_conversations(self, mock_get_conversation):
+        """不同对话可并发运行"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter())
+
+        await session.handle_message({"type": "chat", "run_id": "a", "conversation_id": 1, "content": "x"})
+        await session.handle_message({"type": "chat", "run_id": "b", "conversation_id": 2, "content": "y"})
+        await asyncio.gather(*session._runs.values())
+
+        assert {f["run_id"] for f in websocket.frames("done")} == {"a", "b"}
+
+    @pytest.mark.asyncio
+    async def test_busy_conversation_rejected_without_interrupt(self, mock_get_conversation):
+        """同一对话已有运行时拒绝新的运行"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(block=True))
+
+        await session.handle_message({"type": "chat", "run_id": "a", "conversation_id": 1, "content": "x"})
+        await session.handle_message({"type": "chat", "run_id": "b", "conversation_id": 1, "content": "y"})
+
+        errors = websocket.frames("error")
+        assert errors[0]["data"]["code"] == "conversation_busy"
+        assert list(session._runs) == ["a"]
+        await session.close()
+
+    @pytest.mark.asyncio
+    async def test_chat_with_interrupt_replaces_active_run(self, mock_get_conversation):
+        """interrupt=true 时先取消旧运行再开始新运行"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(block=True))
+
+        await session.handle_message({"type": "chat", "run_id": "a", "conversation_id": 1, "content": "x"})
+        await asyncio.sleep(0)
+        await session.handle_message(
+            {"type": "chat", "run_id": "b", "conversation_id": 1, "content": "y", "interrupt": True}
+        )
+
+        assert websocket.frames("cancelled")[0]["run_id"] == "a"
+        assert list(session._runs) == ["b"]
+        await session.close()
+
+    @pytest.mark.asyncio
+    async def test_cancel_run(self, mock_get_conversation):
+        """按 run_id 取消运行"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(block=True))
+
+        await session.handle_message({"type": "chat", "run_id": "a", "conversation_id": 1, "content": "x"})
+        await asyncio.sleep(0)
+        await session.handle_message({"type": "cancel", "run_id": "a"})
+
+        assert websocket.frames("cancelled")[0]["run_id"] == "a"
+        assert session._runs == {}
+
+    @pytest.mark.asyncio
+    async def test_cancel_unknown_run(self):
+        """取消不存在的运行返回错误"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter())
+
+        await session.handle_message({"type": "cancel", "run_id": "missing"})
+
+        assert websocket.frames("error")[0]["data"]["code"] == "run_not_found"
+
+    @pytest.mark.asyncio
+    async def test_max_concurrent_runs(self, mock_get_conversation):
+        """超过并发上限时拒绝"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(block=True), max_concurrent_runs=1)
+
+        await session.handle_message({"type": "chat", "run_id": "a", "conversation_id": 1, "content": "x"})
+        await session.handle_message({"type": "chat", "run_id": "b", "conversation_id": 2, "content": "y"})
+
+        assert websocket.frames("error")[0]["data"]["code"] == "too_many_runs"
+        await session.close()
+
+    @pytest.mark.asyncio
+    async def test_rate_limited(self, mock_get_conversation):
+        """限流拒绝时不创建运行"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(), rate_limiter=lambda: False)
+
+        await session.handle_message({"type": "chat", "conversation_id": 1, "content": "x"})
+
+        assert websocket.frames("error")[0]["data"]["code"] == "rate_limited"
+        assert session._runs == {}
+
+    @pytest.mark.asyncio
+    async def test_expired_token_closes_connection(self):
+        """Token 过期后发起运行会关闭连接"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter(), token_expires_at=0)
+
+        await session.handle_message({"type": "chat", "conversation_id": 1, "content": "x"})
+
+        assert websocket.frames("error")[0]["data"]["code"] == "token_expired"
+        assert websocket.closed_code == 1008
+
+    @pytest.mark.asyncio
+    async def test_serve_handles_invalid_json_and_ping(self):
+        """主循环处理非法消息与 ping，断开时退出"""
+        websocket = FakeWebSocket()
+        session = make_session(websocket, FakeEmitter())
+
+        await websocket.incoming.put("not json")
+        await websocket.incoming.put(json.dumps({"type": "ping"}))
+        await websocket.incoming.put(None)
+        await session.serve()
+
+        assert websocket.frames("error")[0]["data"]["code"] == "invalid_message"
+        assert len(websocket.frames("pong")) == 1
+
+
+class TestChatWebSocketEndpoint:
+    """WebSocket 端点认证测试"""
+
+    def test_missing_token_rejected(self):
+        """缺少 Token 时拒绝连接"""
+        from fastapi.testclient import TestClient
+        from app.main import create_app
+
+        client = TestClient(create_app())
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect("/api/v1/chat/ws"):
+                pass
+        assert exc_info.value.code == 1008